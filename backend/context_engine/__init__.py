@@ -1,3 +1,7 @@
 from .budget_manager import BudgetManager
+from .compressor import compress_evidence, compress_to_fit
+from .evidence_packer import pack_evidence
+from .mmr import mmr_rerank
+from .token_ledger import TokenLedger
 
-__all__ = ["BudgetManager"]
+__all__ = ["BudgetManager", "TokenLedger", "compress_evidence", "compress_to_fit", "mmr_rerank", "pack_evidence"]
@@ -3,6 +3,8 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any
 
+from .mmr import DEFAULT_MMR_LAMBDA
+
 
 DEFAULT_TOTAL = 131072
 DEFAULT_ALLOCATION = {
@@ -21,6 +23,7 @@ class BudgetManager:
     total: int
     allocation: dict[str, float]
     caps: dict[str, int]
+    mmr_lambda: float = DEFAULT_MMR_LAMBDA
 
     @classmethod
     def from_project(cls, project: dict[str, Any], override_total: int | None = None) -> "BudgetManager":
@@ -28,7 +31,8 @@ class BudgetManager:
         total = int(override_total or cfg.get("total", DEFAULT_TOTAL))
         allocation = {**DEFAULT_ALLOCATION, **cfg.get("allocation", {})}
         caps = {"max_items_per_bucket": 50, "max_examples_style": 5, **cfg.get("caps", {})}
-        return cls(total=total, allocation=allocation, caps=caps)
+        mmr_lambda = min(1.0, max(0.0, float(cfg.get("mmr_lambda", DEFAULT_MMR_LAMBDA))))
+        return cls(total=total, allocation=allocation, caps=caps, mmr_lambda=mmr_lambda)
 
     def bucket_limits(self) -> dict[str, int]:
         return {
@@ -41,7 +45,7 @@ class BudgetManager:
             "output_reserve": int(self.total * float(self.allocation.get("output_reserve_pct", 0))),
         }
 
-    def build_report(self, usage: dict[str, int], dropped: list[str]) -> dict[str, Any]:
+    def build_report(self, usage: dict[str, int], dropped: list[str], tokenizer: str = "heuristic") -> dict[str, Any]:
         limits = self.bucket_limits()
         reasons = {}
         for k, used in usage.items():
@@ -54,4 +58,5 @@ class BudgetManager:
             "caps": self.caps,
             "over_limit": reasons,
             "dropped_items": dropped,
+            "tokenizer": tokenizer,
         }
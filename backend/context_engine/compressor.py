@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import math
+import re
+from typing import Any, Callable, Iterable
+
+from .evidence_packer import EVIDENCE_BUCKETS
+
+
+COMPRESS_MIN_TOKENS = 40
+SENTENCE_SPAN_RE = re.compile(r"[^。！？!?\n]+[。！？!?」』”\"]*")
+ELLIPSIS = " … "
+
+
+def _sentences(text: str) -> list[tuple[int, int]]:
+    spans = []
+    for m in SENTENCE_SPAN_RE.finditer(text):
+        s, e = m.span()
+        while s < e and text[s].isspace():
+            s += 1
+        while e > s and text[e - 1].isspace():
+            e -= 1
+        if e > s:
+            spans.append((s, e))
+    return spans
+
+
+def compress_evidence(
+    item: dict[str, Any],
+    q_terms: set[str],
+    target_tokens: int,
+    token_fn: Callable[[str], int],
+    terms_fn: Callable[[str], Iterable[str]],
+) -> dict[str, Any]:
+    """Keep the sentences of one chunk that best match the query, in text order, up to `target_tokens`.
+
+    The result records character `spans` into the original chunk text and the source lines they
+    cover, so citations stay line-accurate after compression.
+    """
+    text = str(item.get("text", ""))
+    spans = _sentences(text)
+    if len(spans) <= 1:
+        return item
+    scored = []
+    for i, (s, e) in enumerate(spans):
+        terms = set(terms_fn(text[s:e]))
+        overlap = len(terms & q_terms) / math.sqrt(len(terms)) if terms else 0.0
+        scored.append((overlap + (0.05 if i == 0 else 0.0), -i, s, e, token_fn(text[s:e])))
+    scored.sort(reverse=True)
+    keep: list[tuple[int, int]] = []
+    used = 0
+    for _, _, s, e, tokens in scored:
+        if keep and used + tokens > target_tokens:
+            continue
+        keep.append((s, e))
+        used += tokens
+    if len(keep) == len(spans):
+        return item
+    keep.sort()
+    source = item.get("source", {}) or {}
+    first_line = int(source.get("start_line", 1) or 1)
+    kept_spans = [{"start": s, "end": e, "line": first_line + text.count("\n", 0, s)} for s, e in keep]
+    out_text = ELLIPSIS.join(text[s:e] for s, e in keep)
+    return {
+        **item,
+        "text": out_text,
+        "compressed": True,
+        "original_tokens": token_fn(text),
+        "spans": kept_spans,
+        "source": {**source, "lines": sorted({sp["line"] for sp in kept_spans})},
+    }
+
+
+def compress_to_fit(
+    items: list[dict[str, Any]],
+    capacities: dict[str, int],
+    max_items: int,
+    query: str,
+    token_fn: Callable[[str], int],
+    terms_fn: Callable[[str], Iterable[str]],
+) -> tuple[list[dict[str, Any]], list[str]]:
+    """Compress chunks in buckets whose candidates exceed capacity to an even per-slot share."""
+    q_terms = set(terms_fn(query))
+    by_bucket: dict[str, list[int]] = {}
+    for i, item in enumerate(items):
+        by_bucket.setdefault(EVIDENCE_BUCKETS.get(str(item.get("kb_id")), "current_draft"), []).append(i)
+    out = list(items)
+    decisions: list[str] = []
+    for bucket, idxs in by_bucket.items():
+        capacity = int(capacities.get(bucket, 0))
+        sizes = {i: token_fn(str(items[i].get("text", ""))) for i in idxs}
+        if capacity <= 0 or sum(sizes.values()) <= capacity:
+            continue
+        target = max(COMPRESS_MIN_TOKENS, capacity // max(1, min(len(idxs), max_items)))
+        n = 0
+        for i in idxs:
+            if sizes[i] > target:
+                out[i] = compress_evidence(items[i], q_terms, target, token_fn, terms_fn)
+                n += bool(out[i].get("compressed"))
+        decisions.append(f"compress_evidence:{bucket}:{n}/{len(idxs)}:target={target}")
+    return out, decisions
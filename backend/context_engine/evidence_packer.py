@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import math
+from typing import Any, Callable
+
+
+# Evidence from each KB is charged against the budget bucket it competes with.
+EVIDENCE_BUCKETS = {
+    "kb_manuscript": "current_draft",
+    "kb_docs": "canon",
+    "kb_world": "world",
+    "kb_style": "summaries",
+}
+DP_MAX_ITEMS = 24
+DP_MAX_UNITS = 512
+
+
+def _knapsack_dp(values: list[float], weights: list[int], capacity: int) -> list[int]:
+    # Exact 0/1 knapsack on weights quantized (rounded up) to at most DP_MAX_UNITS units,
+    # so any chosen set is guaranteed to fit the real capacity.
+    units = min(capacity, DP_MAX_UNITS)
+    q = [math.ceil(w * units / capacity) for w in weights]
+    best = [0.0] * (units + 1)
+    keep = [[False] * (units + 1) for _ in values]
+    for i, (v, w) in enumerate(zip(values, q)):
+        for c in range(units, w - 1, -1):
+            cand = best[c - w] + v
+            if cand > best[c]:
+                best[c] = cand
+                keep[i][c] = True
+    chosen: list[int] = []
+    c = units
+    for i in range(len(values) - 1, -1, -1):
+        if keep[i][c]:
+            chosen.append(i)
+            c -= q[i]
+    return sorted(chosen)
+
+
+def _greedy(values: list[float], weights: list[int], capacity: int, chosen: list[int] | None = None) -> list[int]:
+    # Also used to top up a DP selection: zero-value items still fill capacity left over, so both
+    # paths pack the same kind of candidates.
+    chosen = list(chosen or [])
+    taken = set(chosen)
+    used = sum(weights[i] for i in chosen)
+    order = sorted(range(len(values)), key=lambda i: (-(values[i] / max(1, weights[i])), i))
+    for i in order:
+        if i not in taken and used + weights[i] <= capacity:
+            chosen.append(i)
+            used += weights[i]
+    return sorted(chosen)
+
+
+def pack_evidence(
+    items: list[dict[str, Any]],
+    capacities: dict[str, int],
+    max_items: int,
+    token_fn: Callable[[str], int],
+    value_key: str = "score",
+) -> dict[str, Any]:
+    """Choose evidence maximizing total `value_key` under per-bucket token capacities and an item cap."""
+    by_bucket: dict[str, list[dict[str, Any]]] = {}
+    for item in items:
+        by_bucket.setdefault(EVIDENCE_BUCKETS.get(str(item.get("kb_id")), "current_draft"), []).append(item)
+
+    selected: list[dict[str, Any]] = []
+    dropped: list[dict[str, Any]] = []
+    decisions: list[str] = []
+    used: dict[str, int] = {}
+    for bucket, rows in by_bucket.items():
+        capacity = max(0, int(capacities.get(bucket, 0)))
+        weights = [max(1, token_fn(str(r.get("text", "")))) for r in rows]
+        values = [max(0.0, float(r.get(value_key, 0.0))) for r in rows]
+        if capacity <= 0:
+            chosen: list[int] = []
+            method = "empty"
+        elif sum(weights) <= capacity:
+            chosen = list(range(len(rows)))
+            method = "all"
+        elif len(rows) <= DP_MAX_ITEMS:
+            chosen = _greedy(values, weights, capacity, _knapsack_dp(values, weights, capacity))
+            method = "dp"
+        else:
+            chosen = _greedy(values, weights, capacity)
+            method = "greedy"
+        keep = set(chosen)
+        used[bucket] = sum(weights[i] for i in chosen)
+        decisions.append(f"pack_evidence:{bucket}:{method}:{len(chosen)}/{len(rows)}:{used[bucket]}/{capacity}")
+        for i, r in enumerate(rows):
+            (selected if i in keep else dropped).append({**r, "tokens": weights[i]})
+
+    selected.sort(key=lambda r: r.get(value_key, 0.0), reverse=True)
+    if len(selected) > max_items:
+        over = selected[max_items:]
+        selected = selected[:max_items]
+        for r in over:
+            bucket = EVIDENCE_BUCKETS.get(str(r.get("kb_id")), "current_draft")
+            used[bucket] -= r["tokens"]
+        dropped.extend(over)
+        decisions.append(f"pack_evidence:max_items:{max_items}")
+    return {"selected": selected, "dropped": dropped, "decisions": decisions, "used": used}
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Iterable
+
+
+DEFAULT_MMR_LAMBDA = 0.7
+
+
+def jaccard(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def mmr_rerank(items: list[dict[str, Any]], lam: float, terms_fn: Callable[[str], Iterable[str]]) -> list[dict[str, Any]]:
+    """Maximal Marginal Relevance order over term-set Jaccard similarity.
+
+    Each returned item carries `mmr_score` = lam * relevance - (1 - lam) * max similarity to the
+    items ranked before it, with relevance the item's score normalized to the best score.
+    """
+    if not items:
+        return []
+    top = max(float(it.get("score", 0.0)) for it in items) or 1.0
+    rel = [float(it.get("score", 0.0)) / top for it in items]
+    terms = [set(terms_fn(str(it.get("text", "")))) for it in items]
+    max_sim = [0.0] * len(items)
+    remaining = set(range(len(items)))
+    out: list[dict[str, Any]] = []
+    while remaining:
+        best = max(remaining, key=lambda i: (lam * rel[i] - (1 - lam) * max_sim[i], -i))
+        remaining.discard(best)
+        out.append({**items[best], "mmr_score": round(lam * rel[best] - (1 - lam) * max_sim[best], 6)})
+        for i in remaining:
+            sim = jaccard(terms[best], terms[i])
+            if sim > max_sim[i]:
+                max_sim[i] = sim
+    return out
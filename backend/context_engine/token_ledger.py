@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from typing import Any, Callable
+
+
+class TokenLedger:
+    """Per-bucket token totals built from individually measured entries.
+
+    Each entry is stringified and counted once when added; trims and drops only adjust the
+    running bucket total, so enforcement cost is proportional to the number of changes.
+    """
+
+    def __init__(self, count_fn: Callable[[str], int], buckets: list[str] | tuple[str, ...] = ()) -> None:
+        self.count_fn = count_fn
+        self.entries: dict[str, dict[str, int]] = {b: {} for b in buckets}
+        self.totals: dict[str, int] = {b: 0 for b in buckets}
+
+    def measure(self, value: Any) -> int:
+        return self.count_fn(value if isinstance(value, str) else str(value))
+
+    def set(self, bucket: str, key: str, tokens: int) -> int:
+        entries = self.entries.setdefault(bucket, {})
+        self.totals[bucket] = self.totals.get(bucket, 0) - entries.get(key, 0) + tokens
+        entries[key] = tokens
+        return tokens
+
+    def add(self, bucket: str, key: str, value: Any) -> int:
+        return self.set(bucket, key, self.measure(value))
+
+    def add_many(self, bucket: str, prefix: str, values: list[Any]) -> int:
+        for i, v in enumerate(values):
+            self.add(bucket, f"{prefix}:{i}", v)
+        return self.totals.get(bucket, 0)
+
+    def remove(self, bucket: str, key: str) -> int:
+        tokens = self.entries.get(bucket, {}).pop(key, 0)
+        self.totals[bucket] = self.totals.get(bucket, 0) - tokens
+        return tokens
+
+    def remove_prefix(self, bucket: str, prefix: str) -> int:
+        keys = [k for k in self.entries.get(bucket, {}) if k.startswith(prefix + ":")]
+        return sum(self.remove(bucket, k) for k in keys)
+
+    def get(self, bucket: str, key: str) -> int:
+        return self.entries.get(bucket, {}).get(key, 0)
+
+    def total(self, bucket: str) -> int:
+        return self.totals.get(bucket, 0)
+
+    def usage(self) -> dict[str, int]:
+        return dict(self.totals)
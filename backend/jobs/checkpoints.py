@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from storage.fs_store import FSStore
+
+
+JOBS_DIR = "meta/jobs"
+INDEX_PATH = f"{JOBS_DIR}/index.jsonl"
+JOB_FILE = "job.json"
+STAGES_DIR = "stages"
+
+
+def _rel(job_id: str, *parts: str) -> str:
+    return "/".join([JOBS_DIR, job_id, *parts])
+
+
+def save_job(store: FSStore, project_id: str, job_id: str, **fields: Any) -> dict[str, Any]:
+    """Create or update meta/jobs/<job_id>/job.json and append the new status to the job index."""
+    record = store.read_json(project_id, _rel(job_id, JOB_FILE)) if store.file_signature(project_id, _rel(job_id, JOB_FILE)) else {"job_id": job_id, "created_at": time.time()}
+    record.update(fields, updated_at=time.time())
+    store.write_json(project_id, _rel(job_id, JOB_FILE), record)
+    payload = record.get("payload", {})
+    store.append_jsonl(project_id, INDEX_PATH, {
+        "job_id": job_id,
+        "chapter_id": payload.get("chapter_id"),
+        "scene_index": payload.get("scene_index"),
+        "batch_id": record.get("batch_id"),
+        "status": record.get("status"),
+        "created_at": record["created_at"],
+        "updated_at": record["updated_at"],
+    })
+    return record
+
+
+def load_job(store: FSStore, project_id: str, job_id: str) -> dict[str, Any] | None:
+    if store.file_signature(project_id, _rel(job_id, JOB_FILE)) is None:
+        return None
+    record = store.read_json(project_id, _rel(job_id, JOB_FILE))
+    record["stages_done"] = sorted(load_stages(store, project_id, job_id))
+    return record
+
+
+def save_stage(store: FSStore, project_id: str, job_id: str, stage: str, value: Any) -> None:
+    store.write_json(project_id, _rel(job_id, STAGES_DIR, f"{stage}.json"), {"stage": stage, "value": value})
+
+
+def load_stages(store: FSStore, project_id: str, job_id: str) -> dict[str, Any]:
+    base = store._safe_path(project_id, _rel(job_id, STAGES_DIR))
+    if not base.exists():
+        return {}
+    return {fp.stem: store.read_json(project_id, _rel(job_id, STAGES_DIR, fp.name)).get("value") for fp in sorted(base.glob("*.json"))}
+
+
+def list_jobs(store: FSStore, project_id: str, limit: int = 50) -> list[dict[str, Any]]:
+    rows: dict[str, dict[str, Any]] = {}
+    for r in store.read_jsonl(project_id, INDEX_PATH):
+        r.pop("ts", None)
+        rows[r["job_id"]] = r
+    return sorted(rows.values(), key=lambda x: x["created_at"], reverse=True)[:limit]
+
+
+def find_job_project(store: FSStore, job_id: str) -> str | None:
+    for pdir in sorted(store.data_dir.iterdir()):
+        if (pdir / "project.yaml").exists() and store.file_signature(pdir.name, _rel(job_id, JOB_FILE)) is not None:
+            return pdir.name
+    return None
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+
+DEFAULT_FRAME_TOKENS = 16
+DEFAULT_FRAME_MS = 50
+
+logger = logging.getLogger(__name__)
+
+
+def coalescing_policy(project: dict[str, Any], payload: dict[str, Any]) -> dict[str, int]:
+    cfg = {**(project.get("stream_coalescing") or {}), **(payload.get("stream_coalescing") or {})}
+    return {
+        "max_tokens": max(1, int(cfg.get("max_tokens", DEFAULT_FRAME_TOKENS))),
+        "max_ms": max(0, int(cfg.get("max_ms", DEFAULT_FRAME_MS))),
+    }
+
+
+class TokenCoalescer:
+    """Buffers streamed deltas and emits them as one frame per `max_tokens` deltas or `max_ms` of age
+    (0 disables the time bound).
+
+    A frame is also cut when the frame metadata (provider/model/fallback) changes, so a fallback
+    switch never mixes tokens from two providers in one frame.
+    """
+
+    def __init__(self, emit_frame: Callable[[dict[str, Any]], Awaitable[None]], max_tokens: int = DEFAULT_FRAME_TOKENS, max_ms: int = DEFAULT_FRAME_MS) -> None:
+        self.emit_frame = emit_frame
+        self.max_tokens = max_tokens
+        self.max_ms = max_ms
+        self._buf: list[str] = []
+        self._meta: dict[str, Any] | None = None
+        self._started = 0.0
+        self._timer: asyncio.TimerHandle | None = None
+        self._flush_task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+        self.stats = {"tokens": 0, "frames": 0}
+
+    async def add(self, delta: str, meta: dict[str, Any]) -> None:
+        if self._buf and meta != self._meta:
+            await self.flush()
+        if not self._buf:
+            self._meta = meta
+            self._started = time.monotonic()
+            if self.max_tokens > 1 and self.max_ms > 0:
+                self._timer = asyncio.get_running_loop().call_later(self.max_ms / 1000, self._flush_later)
+        self._buf.append(delta)
+        self.stats["tokens"] += 1
+        if len(self._buf) >= self.max_tokens or (self.max_ms and (time.monotonic() - self._started) * 1000 >= self.max_ms):
+            await self.flush()
+
+    def _flush_later(self) -> None:
+        # Keep a reference so the timed flush is not garbage-collected and close() can wait for it.
+        self._timer = None
+        self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+        self._flush_task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("timed frame flush failed", exc_info=task.exception())
+
+    async def close(self) -> None:
+        """Emit the buffered frame and wait for any timed flush still in flight."""
+        await self.flush()
+        task, self._flush_task = self._flush_task, None
+        if task is not None and not task.done():
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._buf:
+                return
+            frame = {"delta": "".join(self._buf), "tokens": len(self._buf), **(self._meta or {})}
+            self._buf = []
+            self.stats["frames"] += 1
+            await self.emit_frame(frame)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator
+
+
+DEFAULT_BUFFER_EVENTS = 2048
+DEFAULT_SUBSCRIBER_EVENTS = 256
+DEFAULT_TTL_S = 300.0
+COALESCIBLE_EVENTS = {"WRITER_TOKEN"}
+
+
+def _merge_frames(a: dict[str, Any], b: dict[str, Any]) -> dict[str, Any]:
+    da, db = a.get("data", {}), b.get("data", {})
+    data = {**db, "delta": str(da.get("delta", "")) + str(db.get("delta", "")), "tokens": int(da.get("tokens", 1)) + int(db.get("tokens", 1))}
+    return {**b, "data": data, "coalesced": int(a.get("coalesced", 1)) + int(b.get("coalesced", 1))}
+
+
+class Subscriber:
+    """Per-subscriber pending queue. Pushing never blocks the producer: once `maxlen` events are
+    pending, token frames are merged into the previous token frame; stage events are always kept."""
+
+    def __init__(self, maxlen: int = DEFAULT_SUBSCRIBER_EVENTS) -> None:
+        self.maxlen = maxlen
+        self.pending: deque[dict[str, Any]] = deque()
+        self.coalesced = 0
+        self._ready = asyncio.Event()
+
+    def push(self, event: dict[str, Any]) -> None:
+        if len(self.pending) >= self.maxlen and event.get("event") in COALESCIBLE_EVENTS:
+            last = self.pending[-1]
+            # Only merge frames with the same provider/fallback metadata.
+            if last.get("event") == event["event"] and {k: v for k, v in last.get("data", {}).items() if k not in ("delta", "tokens")} == {k: v for k, v in event.get("data", {}).items() if k not in ("delta", "tokens")}:
+                self.pending[-1] = _merge_frames(last, event)
+                self.coalesced += 1
+                self._ready.set()
+                return
+        self.pending.append(event)
+        self._ready.set()
+
+    async def wait(self) -> None:
+        await self._ready.wait()
+        self._ready.clear()
+
+
+class JobEventBuffer:
+    """Broadcast hub for one job: a bounded, sequence-numbered replay log plus live fan-out to
+    any number of subscribers, each with its own bounded queue."""
+
+    def __init__(self, maxlen: int = DEFAULT_BUFFER_EVENTS, subscriber_maxlen: int = DEFAULT_SUBSCRIBER_EVENTS) -> None:
+        self.events: deque[dict[str, Any]] = deque(maxlen=maxlen)
+        self.next_seq = 0
+        self.done_at: float | None = None
+        self.stats = {"tokens": 0, "frames": 0, "events": 0}
+        self.subscriber_maxlen = subscriber_maxlen
+        self.subscribers: set[Subscriber] = set()
+
+    def publish(self, event: dict[str, Any]) -> dict[str, Any]:
+        framed = {"seq": self.next_seq, **event}
+        self.next_seq += 1
+        self.stats["events"] += 1
+        self.events.append(framed)
+        if event.get("event") == "DONE":
+            self.done_at = time.monotonic()
+        for sub in self.subscribers:
+            sub.push(framed)
+        return framed
+
+    async def subscribe(self, since: int = -1) -> AsyncIterator[dict[str, Any]]:
+        sub = Subscriber(self.subscriber_maxlen)
+        cursor = since + 1
+        # Backfill and registration happen without an await in between, so no live event is missed.
+        if self.events and cursor < self.events[0]["seq"]:
+            sub.push({"seq": cursor, "event": "REPLAY_GAP", "data": {"requested": cursor, "oldest": self.events[0]["seq"]}})
+            cursor = self.events[0]["seq"]
+        if self.events and cursor < self.next_seq:
+            for event in list(self.events)[cursor - self.events[0]["seq"]:]:
+                sub.push(event)
+        if self.done_at is None:
+            self.subscribers.add(sub)
+        try:
+            while True:
+                while sub.pending:
+                    event = sub.pending.popleft()
+                    yield event
+                    if event["event"] == "DONE":
+                        return
+                if self.done_at is not None and sub not in self.subscribers:
+                    return
+                await sub.wait()
+        finally:
+            self.subscribers.discard(sub)
+
+
+class JobEventRegistry:
+    def __init__(self, maxlen: int = DEFAULT_BUFFER_EVENTS, ttl_s: float = DEFAULT_TTL_S, subscriber_maxlen: int = DEFAULT_SUBSCRIBER_EVENTS) -> None:
+        self.maxlen = maxlen
+        self.ttl_s = ttl_s
+        self.subscriber_maxlen = subscriber_maxlen
+        self.buffers: dict[str, JobEventBuffer] = {}
+
+    def open(self, job_id: str) -> JobEventBuffer:
+        self.gc()
+        buf = self.buffers.get(job_id)
+        if buf is None:
+            buf = self.buffers[job_id] = JobEventBuffer(self.maxlen, self.subscriber_maxlen)
+        return buf
+
+    def get(self, job_id: str) -> JobEventBuffer | None:
+        return self.buffers.get(job_id)
+
+    def publish(self, job_id: str, event: dict[str, Any]) -> dict[str, Any]:
+        buf = self.buffers.get(job_id) or self.open(job_id)
+        return buf.publish(event)
+
+    def discard(self, job_id: str) -> None:
+        self.buffers.pop(job_id, None)
+
+    def gc(self, now: float | None = None) -> list[str]:
+        now = time.monotonic() if now is None else now
+        expired = [jid for jid, b in self.buffers.items() if b.done_at is not None and now - b.done_at > self.ttl_s]
+        for jid in expired:
+            del self.buffers[jid]
+        return expired
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any
+
+
+DEFAULT_INTERVAL_S = 0.05
+DEFAULT_WINDOW = 1200
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class LoopLagMonitor:
+    """Measures event-loop latency: a task sleeps `interval_s` and records how late it wakes up.
+    Anything that blocks the loop (sync disk or CPU work in a coroutine) shows up as lag."""
+
+    def __init__(self, interval_s: float = DEFAULT_INTERVAL_S, window: int = DEFAULT_WINDOW) -> None:
+        self.interval_s = interval_s
+        self.samples: deque[float] = deque(maxlen=window)
+        self.max_ms = 0.0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            t0 = time.monotonic()
+            await asyncio.sleep(self.interval_s)
+            lag_ms = max(0.0, (time.monotonic() - t0 - self.interval_s) * 1000)
+            self.samples.append(lag_ms)
+            self.max_ms = max(self.max_ms, lag_ms)
+
+    def snapshot(self) -> dict[str, Any]:
+        values = list(self.samples)
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval_s * 1000, 3),
+            "samples": len(values),
+            "p50_ms": round(_percentile(values, 0.5), 3),
+            "p99_ms": round(_percentile(values, 0.99), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
@@ -1,78 +1,269 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import json
+import threading
 import uuid
-from collections import defaultdict
-from typing import Any
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 
 from services.context_engine import ContextEngine
 from services.llm_gateway import LLMGateway
+from jobs import checkpoints
+from jobs.coalescer import TokenCoalescer, coalescing_policy
+from jobs.event_buffer import JobEventRegistry
+from jobs.loop_monitor import LoopLagMonitor
+from jobs.scheduler import JobScheduler, backend_key
+from jobs.stages import Stage, run_stage_dag
 from agents.technique_director import TechniqueDirector, derive_technique_adherence_issues
-from services.summary_service import make_summaries
+from services.summary_service import make_summaries, update_summary_pyramid
 from services.canon_extractor_service import CanonExtractorService
-from services.llm_config_service import LLMConfigService
+from services.llm_config_service import MODULES, LLMConfigService
+from services.memory_pack_service import persist_memory_pack
 from storage.fs_store import FSStore, apply_patch_ops
 
 
+JOB_IO_WORKERS = 4
+ROLLING_WINDOW = 10
+ROLLING_MIN_EVENTS = 30
+DEFAULT_BATCH_WINDOW = 2
+# Stages worth checkpointing: retrieval only warms caches and is cheap to redo.
+UNCHECKPOINTED_STAGES = {"retrieve"}
+BATCH_KEYS = ("scene_indices", "chapter_range", "batch_window")
+
+
 class JobManager:
-    def __init__(self, store: FSStore, context_engine: ContextEngine, llm_gateway: LLMGateway) -> None:
+    def __init__(self, store: FSStore, context_engine: ContextEngine, llm_gateway: LLMGateway, llm_config: LLMConfigService | None = None) -> None:
         self.store = store
+        self.llm_config = llm_config or LLMConfigService(store.data_dir)
         self.context_engine = context_engine
         self.llm_gateway = llm_gateway
-        self.queues: dict[str, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self.events = JobEventRegistry()
+        self.scheduler = JobScheduler()
         self.canon_extractor = CanonExtractorService(llm_gateway)
         self.technique_director = TechniqueDirector(store)
+        # Blocking storage/retrieval work runs here so the event loop keeps serving sockets; the
+        # session log gets its own single worker so appends land in emit order.
+        self.executor = ThreadPoolExecutor(max_workers=JOB_IO_WORKERS, thread_name_prefix="job-io")
+        self._log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-log")
+        self.loop_monitor = LoopLagMonitor()
+        self._batch_of: dict[str, tuple[str, int]] = {}
+        self._running: set[str] = set()
+        self._background: set[asyncio.Task] = set()
+        self._rolling: dict[tuple[str, str], dict[str, Any]] = {}
+        self._rolling_lock = threading.Lock()
+
+    async def _offload(self, fn: Any, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    def _publish(self, project_id: str, job_id: str, event: str, data: Any) -> None:
+        # For sync callbacks (scheduler QUEUED): the log write is queued on the same single-thread
+        # executor as emit(), so the session log keeps event order without blocking the loop.
+        payload = {"event": event, "data": data}
+        self._log_executor.submit(self.store.append_jsonl, project_id, "sessions/session_001.jsonl", {"job_id": job_id, **payload})
+        self._fanout(job_id, payload)
 
     async def emit(self, project_id: str, job_id: str, event: str, data: Any) -> None:
         payload = {"event": event, "data": data}
-        self.store.append_jsonl(project_id, "sessions/session_001.jsonl", {"job_id": job_id, **payload})
-        await self.queues[job_id].put(payload)
+        await asyncio.get_running_loop().run_in_executor(self._log_executor, self.store.append_jsonl, project_id, "sessions/session_001.jsonl", {"job_id": job_id, **payload})
+        self._fanout(job_id, payload)
+
+    def _fanout(self, job_id: str, payload: dict[str, Any]) -> None:
+        self.events.publish(job_id, payload)
+        parent = self._batch_of.get(job_id)
+        if parent is not None:
+            self.events.publish(parent[0], {**payload, "job_id": job_id, "unit": parent[1]})
+
+    def _append_many(self, project_id: str, rel: str, items: list[dict[str, Any]]) -> None:
+        for item in items:
+            self.store.append_jsonl(project_id, rel, item)
 
     async def run_write_job(self, project_id: str, payload: dict[str, Any]) -> str:
+        self.loop_monitor.start()
         self._validate_write_payload(project_id, payload)
+        profiles = self._resolve_profiles(project_id, payload)
+        reservation = self.scheduler.admit(project_id, profiles["writer"][1])
         job_id = f"job_{uuid.uuid4().hex[:10]}"
-        asyncio.create_task(self._pipeline(job_id, project_id, payload))
+        self.events.open(job_id)
+        asyncio.create_task(self._pipeline(job_id, project_id, payload, reservation=reservation, profiles=profiles))
         return job_id
 
-    def _resolve_profile(self, project_id: str, payload: dict[str, Any], module: str = "writer") -> tuple[str, dict[str, Any], dict[str, Any]]:
-        project = self.store.read_yaml(project_id, "project.yaml")
-        project_profiles = project.get("llm_profiles", {})
-        cfg = LLMConfigService(self.store.data_dir)
-        global_profiles = cfg.read_profiles()
-        assignments = cfg.read_assignments()
-        profiles = {**global_profiles, **project_profiles}
+    async def resume_job(self, job_id: str) -> dict[str, Any]:
+        project_id = await self._offload(checkpoints.find_job_project, self.store, job_id)
+        job = await self._offload(checkpoints.load_job, self.store, project_id, job_id) if project_id else None
+        if job is None:
+            raise KeyError(job_id)
+        if job_id in self._running:
+            raise ValueError("job is still running")
+        if job.get("status") == "done":
+            raise ValueError("job already finished")
+        self.loop_monitor.start()
+        payload = job.get("payload", {})
+        profiles = self._resolve_profiles(project_id, payload)
+        stages = await self._offload(checkpoints.load_stages, self.store, project_id, job_id)
+        reservation = self.scheduler.admit(project_id, profiles["writer"][1])
+        # A batch unit that followed an earlier scene appends to the chapter; resume it the same way.
+        batch = {"snapshot": {}, "after": None, "append": True, "merged": asyncio.Event()} if job.get("batch_append") else None
+        self.events.discard(job_id)
+        self.events.open(job_id)
+        self._running.add(job_id)
+        asyncio.create_task(self._pipeline(job_id, project_id, payload, batch, stages, reservation, profiles))
+        return {"job_id": job_id, "project_id": project_id, "resumed_from": sorted(stages)}
+
+    def _batch_units(self, project_id: str, payload: dict[str, Any]) -> list[dict[str, Any]]:
+        # A blueprint (all scenes or `scene_indices`) for one chapter, or a `chapter_range` over
+        # drafts/.chapter_order where each chapter uses its bound blueprint_id/scene_index from meta.
+        rng = payload.get("chapter_range")
+        if isinstance(rng, dict):
+            order = [c for c in self.store.read_md(project_id, "drafts/.chapter_order").splitlines() if c]
+            start, end = rng.get("from"), rng.get("to", rng.get("from"))
+            if start not in order or end not in order:
+                raise ValueError("chapter_range must name chapters in drafts/.chapter_order")
+            chapters = order[order.index(start): order.index(end) + 1]
+        else:
+            chapters = [payload.get("chapter_id")]
+        units = []
+        for chapter_id in chapters:
+            meta = self.store.read_json(project_id, f"drafts/{chapter_id}.meta.json") if isinstance(rng, dict) else {}
+            blueprint_id = meta.get("blueprint_id") or payload.get("blueprint_id")
+            bp = self.store.read_json(project_id, f"cards/{blueprint_id}.json") if isinstance(blueprint_id, str) and blueprint_id else {}
+            if "scene_index" in meta:
+                indices = [meta["scene_index"]]
+            elif payload.get("scene_indices") is not None and not isinstance(rng, dict):
+                indices = list(payload["scene_indices"])
+            else:
+                indices = list(range(len(bp.get("scene_plan") or [])))
+            for scene_index in indices:
+                unit = {"chapter_id": chapter_id, "blueprint_id": blueprint_id, "scene_index": scene_index}
+                self._validate_write_payload(project_id, unit)
+                units.append(unit)
+        if not units:
+            raise ValueError("batch has no scenes to write")
+        return units
+
+    async def run_batch_job(self, project_id: str, payload: dict[str, Any]) -> dict[str, Any]:
+        self.loop_monitor.start()
+        units = self._batch_units(project_id, payload)
+        profiles = self._resolve_profiles(project_id, payload)
+        reservation = self.scheduler.admit(project_id, profiles["writer"][1])
+        batch_id = f"batch_{uuid.uuid4().hex[:10]}"
+        self.events.open(batch_id)
+        for i, unit in enumerate(units):
+            unit["job_id"] = f"job_{uuid.uuid4().hex[:10]}"
+            self.events.open(unit["job_id"])
+            self._batch_of[unit["job_id"]] = (batch_id, i)
+        asyncio.create_task(self._batch(batch_id, project_id, payload, units, reservation, profiles))
+        return {"batch_id": batch_id, "jobs": [{k: u[k] for k in ("job_id", "chapter_id", "scene_index")} for u in units]}
+
+    async def _batch(self, batch_id: str, project_id: str, payload: dict[str, Any], units: list[dict[str, Any]], reservation: str | None = None, profiles: dict[str, Any] | None = None) -> None:
+        t0 = asyncio.get_running_loop().time()
+        common = {k: v for k, v in payload.items() if k not in BATCH_KEYS and k not in ("chapter_id", "blueprint_id", "scene_index")}
+        common.setdefault("priority", "batch")
+        # One project snapshot for every unit; manifest components are shared through the ContextEngine cache.
+        snapshot = {
+            "project": self.store.read_yaml(project_id, "project.yaml"),
+            "outline": self.store.read_yaml(project_id, "cards/outline_001.yaml"),
+            "profiles": profiles or self._resolve_profiles(project_id, common),
+        }
+        self.events.publish(batch_id, {"event": "BATCH_PLAN", "data": {"batch_id": batch_id, "units": [{k: u[k] for k in ("job_id", "chapter_id", "scene_index")} for u in units]}})
+        window = asyncio.Semaphore(max(1, int(payload.get("batch_window", DEFAULT_BATCH_WINDOW))))
+        merged: dict[str, asyncio.Event] = {}
+        results: list[bool] = [False] * len(units)
+
+        async def run_unit(i: int, unit: dict[str, Any], ctx: dict[str, Any]) -> None:
+            async with window:
+                # The batch's admission reservation is handed to its first unit.
+                results[i] = await self._pipeline(unit["job_id"], project_id, {**common, **{k: unit[k] for k in ("chapter_id", "blueprint_id", "scene_index")}}, ctx, reservation=reservation if i == 0 else None)
+
+        tasks = []
+        for i, unit in enumerate(units):
+            # Scenes of one chapter draft in order, each appended to the previous scene's merged text;
+            # their plan/technique/manifest stages still overlap the previous scene's writer.
+            prev = merged.get(unit["chapter_id"])
+            ctx = {"snapshot": snapshot, "after": prev, "append": prev is not None, "merged": asyncio.Event()}
+            merged[unit["chapter_id"]] = ctx["merged"]
+            tasks.append(asyncio.create_task(run_unit(i, unit, ctx)))
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for unit in units:
+            self._batch_of.pop(unit["job_id"], None)
+        self.events.publish(batch_id, {"event": "DONE", "data": {
+            "batch_id": batch_id,
+            "units": [{"job_id": u["job_id"], "chapter_id": u["chapter_id"], "scene_index": u["scene_index"], "ok": ok} for u, ok in zip(units, results)],
+            "elapsed_ms": round((asyncio.get_running_loop().time() - t0) * 1000, 3),
+        }})
+
+    def _resolve_profiles(self, project_id: str, payload: dict[str, Any], project: dict[str, Any] | None = None) -> dict[str, tuple[str, dict[str, Any], dict[str, Any]]]:
+        # One config snapshot per job: every module resolves against the same profiles/assignments.
+        project = project if project is not None else self.store.read_yaml(project_id, "project.yaml")
+        cfg = self.llm_config.snapshot()
+        profiles = {**cfg["profiles"], **project.get("llm_profiles", {})}
+        assignments = cfg["assignments"]
+        fallback = profiles.get("mock_default", {"provider": "mock", "model": "mock-writer-v1", "stream": True})
+        out = {}
+        for module in MODULES:
+            req_id = payload.get("llm_profile_id") or assignments.get(module) or project.get("default_llm_profile_id", "mock_default")
+            out[module] = (req_id, profiles.get(req_id, profiles.get("mock_default", self.llm_gateway.env_defaults())), fallback)
+        return out
 
-        req_profile_id = payload.get("llm_profile_id")
-        assignment_profile_id = assignments.get(module)
-        project_default = project.get("default_llm_profile_id", "mock_default")
-        req_id = req_profile_id or assignment_profile_id or project_default
+    async def _writer(self, project_id: str, job_id: str, messages: list[dict[str, str]], selected: dict[str, Any], fallback: dict[str, Any], policy: dict[str, int] | None = None) -> tuple[str, dict[str, Any], list[str]]:
+        policy = policy or coalescing_policy({}, {})
 
-        selected = profiles.get(req_id, profiles.get("mock_default", self.llm_gateway.env_defaults()))
-        fallback = profiles.get("mock_default", {"provider": "mock", "model": "mock-writer-v1", "stream": True})
-        return req_id, selected, fallback
+        async def _frame(frame: dict[str, Any]) -> None:
+            await self.emit(project_id, job_id, "WRITER_TOKEN", frame)
 
-    async def _writer(self, project_id: str, job_id: str, messages: list[dict[str, str]], selected: dict[str, Any], fallback: dict[str, Any]) -> tuple[str, dict[str, Any], list[str]]:
+        frames = TokenCoalescer(_frame, policy["max_tokens"], policy["max_ms"])
         used = selected
         tokens: list[str] = []
         try:
             async for delta in self.llm_gateway.chat_stream(messages, selected.get("model", ""), 0.7, 900, selected):
                 tokens.append(delta)
-                await self.emit(project_id, job_id, "WRITER_TOKEN", {"delta": delta, "provider": selected.get("provider"), "model": selected.get("model")})
+                await frames.add(delta, {"provider": selected.get("provider"), "model": selected.get("model")})
         except Exception as e:
+            await frames.flush()
             await self.emit(project_id, job_id, "ERROR", {"stage": "writer", "provider": selected.get("provider"), "message": str(e)})
             used = fallback
             async for delta in self.llm_gateway.chat_stream(messages, fallback.get("model", "mock-writer-v1"), 0.7, 900, fallback):
                 tokens.append(delta)
-                await self.emit(project_id, job_id, "WRITER_TOKEN", {"delta": delta, "provider": fallback.get("provider"), "model": fallback.get("model"), "fallback": True})
+                await frames.add(delta, {"provider": fallback.get("provider"), "model": fallback.get("model"), "fallback": True})
+        await frames.close()
+        stats = self.events.open(job_id).stats
+        stats["tokens"] += frames.stats["tokens"]
+        stats["frames"] += frames.stats["frames"]
         return "".join(tokens), used, tokens
 
-    async def _complete_with_fallback(self, project_id: str, job_id: str, stage: str, messages: list[dict[str, str]], selected: dict[str, Any], fallback: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    def _start_prefetch(self, project_id: str, chapter_id: str, bp: dict[str, Any], scene_index: int, payload: dict[str, Any], project: dict[str, Any]) -> asyncio.Future | None:
+        # Opt-in: warm the next scene's manifest components on a worker thread while the writer streams.
+        enabled = payload.get("prefetch_next_scene")
+        if enabled is None:
+            enabled = project.get("context_prefetch", False)
+        plan = bp.get("scene_plan", [])
+        if not enabled or scene_index + 1 >= len(plan):
+            return None
+        fut = asyncio.get_running_loop().run_in_executor(self.executor, self.context_engine.prefetch, project_id, chapter_id, plan[scene_index + 1], payload.get("constraints", {}))
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return fut
+
+    @asynccontextmanager
+    async def _backend_slot(self, job_id: str, project_id: str, profile: dict[str, Any], priority: str = "interactive", held: str | None = None) -> AsyncIterator[None]:
+        # Critic, editor and canon-extractor calls take a slot on their own backend; the slot the job
+        # already holds for its writer covers calls routed to that same backend.
+        if held is not None and backend_key(profile) == held:
+            yield
+            return
+        async with self.scheduler.slot(job_id, project_id, profile, priority):
+            yield
+
+    async def _complete_with_fallback(self, project_id: str, job_id: str, stage: str, messages: list[dict[str, str]], selected: dict[str, Any], fallback: dict[str, Any], priority: str = "interactive", held: str | None = None) -> tuple[dict[str, Any], dict[str, Any]]:
         try:
-            return await self.llm_gateway.chat_complete(messages, selected.get("model", ""), 0.4, 500, selected), selected
+            async with self._backend_slot(job_id, project_id, selected, priority, held):
+                return await self.llm_gateway.chat_complete(messages, selected.get("model", ""), 0.4, 500, selected), selected
         except Exception as e:
             await self.emit(project_id, job_id, "ERROR", {"stage": stage, "provider": selected.get("provider"), "message": str(e)})
-            return await self.llm_gateway.chat_complete(messages, fallback.get("model", "mock-writer-v1"), 0.4, 500, fallback), fallback
+            async with self._backend_slot(job_id, project_id, fallback, priority, held):
+                return await self.llm_gateway.chat_complete(messages, fallback.get("model", "mock-writer-v1"), 0.4, 500, fallback), fallback
 
 
     def _persist_memory_pack(self, project_id: str, chapter_id: str, job_id: str, manifest: dict[str, Any]) -> None:
@@ -87,7 +278,7 @@ class JobManager:
             "dropped_items": manifest.get("dropped_items", []),
             "compression_steps": manifest.get("compression_steps", []),
         }
-        self.store.write_json(project_id, f"meta/memory_packs/{chapter_id}/{job_id}.json", pack)
+        persist_memory_pack(self.store, project_id, chapter_id, job_id, pack)
 
 
     def _normalize_selection_range(self, payload: dict[str, Any]) -> dict[str, int] | None:
@@ -144,164 +335,336 @@ class JobManager:
 
         return chapter_id, bp, scene_index
 
-    async def _pipeline(self, job_id: str, project_id: str, payload: dict[str, Any]) -> None:
+    async def _pipeline(self, job_id: str, project_id: str, payload: dict[str, Any], batch: dict[str, Any] | None = None, resume: dict[str, Any] | None = None, reservation: str | None = None, profiles: dict[str, Any] | None = None) -> bool:
+        slot = None
+        ok = False
+        timings: dict[str, float] = {}
+        deferred: list[Any] = []
+        self._running.add(job_id)
         try:
+            parent = self._batch_of.get(job_id)
+            await self._offload(checkpoints.save_job, self.store, project_id, job_id, payload=payload, status="running", batch_id=parent[0] if parent else None, batch_append=bool(batch and batch.get("append")))
+            if resume:
+                await self.emit(project_id, job_id, "RESUMED", {"job_id": job_id, "stages": sorted(resume)})
             chapter_id, bp, scene_index = self._validate_write_payload(project_id, payload)
             selection_range = self._normalize_selection_range(payload)
             scene = bp.get("scene_plan", [])[scene_index]
-            outline = self.store.read_yaml(project_id, "cards/outline_001.yaml")
-            req_profile_id, selected, fallback = self._resolve_profile(project_id, payload, "writer")
-
-            plan = {"scene": scene, "beats": outline.get("payload", {}).get("beats", [])}
-            await self.emit(project_id, job_id, "DIRECTOR_PLAN", plan)
-
-            selected_bundle = self.technique_director.resolve_selected_bundle(project_id, chapter_id, outline, scene)
-            selected_techniques = selected_bundle.get("selected_techniques", [])
-            selected_categories = selected_bundle.get("selected_categories", [])
-            technique_bundle = self.technique_director.build(
-                project_id,
-                chapter_id,
-                plan,
-                self.store.read_yaml(project_id, "cards/style_001.yaml").get("payload", {}).get("style_guide", {}),
-                self.store.read_jsonl(project_id, "canon/facts.jsonl")[-8:],
-                selected_techniques,
-                selected_categories,
-            )
-            await self.emit(project_id, job_id, "TECHNIQUE_BRIEF", technique_bundle)
-            chapter_meta = self.store.read_json(project_id, f"drafts/{chapter_id}.meta.json")
-            chapter_meta["technique_brief"] = technique_bundle.get("technique_brief", "")
-            chapter_meta["technique_checklist"] = technique_bundle.get("technique_checklist", [])
-            self.store.write_json(project_id, f"drafts/{chapter_id}.meta.json", chapter_meta)
-
-            manifest = self.context_engine.build_manifest(project_id, chapter_id, scene, payload.get("constraints", {}), technique_bundle)
-            manifest["llm"] = {"requested_profile_id": req_profile_id, "requested_provider": selected.get("provider"), "requested_model": selected.get("model")}
-            manifest["usage_estimate"] = {"prompt_tokens": 0, "completion_tokens": 0}
-            self._persist_memory_pack(project_id, chapter_id, job_id, manifest)
-            await self.emit(project_id, job_id, "CONTEXT_MANIFEST", manifest)
-
-            guide_text = str(manifest["fixed_blocks"].get("style_guide", {}))
-            world_facts = manifest.get("world_facts", [])[:5]
-            writer_messages = [
-                {"role": "system", "content": "你是长篇小说写作助手，按提供文风与场景目标写作，必须遵守style locks。"},
-                {"role": "user", "content": f"scene={scene}\nstyle_guide={guide_text}\nstyle_locks={manifest.get('fixed_blocks',{}).get('style_locks',{})}\nworld_facts={world_facts}\ntechnique_brief={manifest.get('fixed_blocks',{}).get('technique_brief','')}\ntechnique_checklist={manifest.get('fixed_blocks',{}).get('technique_checklist',[])}\ntechnique_agent_tags={manifest.get('fixed_blocks',{}).get('technique_agent_tags',[])}\n请写一段章节草稿。"},
-            ]
-            writer_text, writer_used, writer_tokens = await self._writer(project_id, job_id, writer_messages, selected, fallback)
-            draft = f"# {chapter_id}\n\n{writer_text}" if writer_text else f"# {chapter_id}\n\n林秋在{scene.get('situation')}做出选择。"
-            self.store.write_md(project_id, f"drafts/{chapter_id}.md", draft)
-            manifest["usage_estimate"] = {
-                "prompt_tokens": max(1, len(str(writer_messages)) // 4),
-                "completion_tokens": max(1, len("".join(writer_tokens)) // 4),
-            }
-            await self.emit(project_id, job_id, "WRITER_DRAFT", {"chapter_id": chapter_id, "text": draft, "provider": writer_used.get("provider"), "model": writer_used.get("model"), "fallback": writer_used.get("provider") != selected.get("provider")})
-
-            critic_messages = [{"role": "system", "content": "你是审稿人，输出一句主要问题。"}, {"role": "user", "content": draft[:900] + "\n证据:" + str(manifest.get("critic_evidence", [])[:3])}]
-            _, critic_selected, critic_fallback = self._resolve_profile(project_id, payload, "critic")
-            critic_out, critic_used = await self._complete_with_fallback(project_id, job_id, "critic", critic_messages, critic_selected, critic_fallback)
-            issues = [{"issue": (critic_out.get("text") or "冲突可增强")[:120], "evidence": {"chapter_id": chapter_id, "quote": draft.splitlines()[-1][:40]}}]
-            style_locks = manifest.get("fixed_blocks", {}).get("style_locks", {})
-            if style_locks.get("punctuation") and ("!" in draft or "！" in draft):
-                issues.append({"issue": "style_drift: punctuation lock violated", "evidence": {"chapter_id": chapter_id, "quote": "!"}})
-            tech_issues = derive_technique_adherence_issues(chapter_id, draft, manifest.get("fixed_blocks", {}).get("technique_checklist", []))
-            issues.extend(tech_issues)
-            for issue in issues:
-                self.store.append_jsonl(project_id, "canon/issues.jsonl", issue)
-            await self.emit(project_id, job_id, "CRITIC_REVIEW", {"issues": issues, "provider": critic_used.get("provider"), "model": critic_used.get("model")})
-
-            editor_scope_hint = f"selection_range={selection_range}" if selection_range else "selection_range=None(whole chapter)"
-            editor_messages = [
-                {"role": "system", "content": "你是编辑。输出JSON: {\"ops\":[{\"op_id\":\"op_001\",\"type\":\"replace\",\"target_range\":{\"start\":2,\"end\":3},\"before\":\"...\",\"after\":\"...\",\"rationale\":\"...\"}]}. 若给定 selection_range，则所有 target_range 必须完全落在 selection_range 内。"},
-                {"role": "user", "content": f"{editor_scope_hint}\n{draft[:1200]}"},
-            ]
-            _, editor_selected, editor_fallback = self._resolve_profile(project_id, payload, "editor")
-            editor_out, editor_used = await self._complete_with_fallback(project_id, job_id, "editor", editor_messages, editor_selected, editor_fallback)
-            ops = []
-            try:
-                obj = json.loads(editor_out.get("text", "{}"))
-                ops = obj.get("ops", []) if isinstance(obj, dict) else []
-            except Exception:
+            snapshot = (batch or {}).get("snapshot", {})
+            outline = snapshot.get("outline") or self.store.read_yaml(project_id, "cards/outline_001.yaml")
+            project = snapshot.get("project") or self.store.read_yaml(project_id, "project.yaml")
+            # Profiles resolved at admission are reused, so the job runs on the backend it was admitted for.
+            resolved = profiles or snapshot.get("profiles") or self._resolve_profiles(project_id, payload, project)
+            req_profile_id, selected, fallback = resolved["writer"]
+            priority = str(payload.get("priority", "interactive"))
+
+            async def _acquire_slot() -> str:
+                # Queue behind other jobs on the same backend; QUEUED events report the position while waiting.
+                nonlocal reservation
+                held, reservation = reservation, None
+                return await self.scheduler.acquire(job_id, project_id, selected, priority, lambda info: self._publish(project_id, job_id, "QUEUED", info), held)
+
+            if batch is None:
+                slot = await _acquire_slot()
+            defer_canon = bool(payload.get("defer_canon", project.get("defer_canon_extraction", False)))
+
+            # Only stages on the chain plan -> technique -> manifest -> writer -> critic -> editor ->
+            # merge -> canon emit events, so the client-visible order never changes; the side stages
+            # (retrieve, critic_llm, checks) overlap with that chain and only return values.
+            async def _plan(r: dict[str, Any]) -> dict[str, Any]:
+                plan = {"scene": scene, "beats": outline.get("payload", {}).get("beats", [])}
+                await self.emit(project_id, job_id, "DIRECTOR_PLAN", plan)
+                return plan
+
+            async def _retrieve(r: dict[str, Any]) -> dict[str, Any]:
+                # Warms the manifest components (KB queries, canon, cards) on a worker thread while
+                # the technique bundle is built; build_manifest then reuses them from the cache.
+                return await self._offload(self.context_engine.prefetch, project_id, chapter_id, scene, payload.get("constraints", {}))
+
+            def _build_technique(plan: dict[str, Any]) -> dict[str, Any]:
+                selected_bundle = self.technique_director.resolve_selected_bundle(project_id, chapter_id, outline, scene)
+                return self.technique_director.build(
+                    project_id,
+                    chapter_id,
+                    plan,
+                    self.store.read_yaml(project_id, "cards/style_001.yaml").get("payload", {}).get("style_guide", {}),
+                    self.store.read_jsonl(project_id, "canon/facts.jsonl")[-8:],
+                    selected_bundle.get("selected_techniques", []),
+                    selected_bundle.get("selected_categories", []),
+                )
+
+            def _record_technique(technique_bundle: dict[str, Any]) -> None:
+                chapter_meta = self.store.read_json(project_id, f"drafts/{chapter_id}.meta.json")
+                chapter_meta["technique_brief"] = technique_bundle.get("technique_brief", "")
+                chapter_meta["technique_checklist"] = technique_bundle.get("technique_checklist", [])
+                self.store.write_json(project_id, f"drafts/{chapter_id}.meta.json", chapter_meta)
+
+            async def _technique(r: dict[str, Any]) -> dict[str, Any]:
+                technique_bundle = await self._offload(_build_technique, r["plan"])
+                await self.emit(project_id, job_id, "TECHNIQUE_BRIEF", technique_bundle)
+                await self._offload(_record_technique, technique_bundle)
+                return technique_bundle
+
+            async def _manifest(r: dict[str, Any]) -> dict[str, Any]:
+                manifest = await self._offload(self.context_engine.build_manifest, project_id, chapter_id, scene, payload.get("constraints", {}), r["technique"], selected)
+                manifest["llm"] = {
+                    "requested_profile_id": req_profile_id,
+                    "requested_provider": selected.get("provider"),
+                    "requested_model": selected.get("model"),
+                    "resolved": {m: {"profile_id": pid, "provider": prof.get("provider"), "model": prof.get("model")} for m, (pid, prof, _fb) in resolved.items()},
+                }
+                manifest["usage_estimate"] = {"prompt_tokens": 0, "completion_tokens": 0}
+                await self._offload(self._persist_memory_pack, project_id, chapter_id, job_id, manifest)
+                await self.emit(project_id, job_id, "CONTEXT_MANIFEST", manifest)
+                return manifest
+
+            async def _write(r: dict[str, Any]) -> dict[str, Any]:
+                nonlocal slot
+                if batch is not None:
+                    # Batch units hold a backend slot only from drafting on, so their retrieval overlaps
+                    # generation of the unit before them.
+                    if batch.get("after") is not None:
+                        await batch["after"].wait()
+                    slot = await _acquire_slot()
+                manifest = r["manifest"]
+                guide_text = str(manifest["fixed_blocks"].get("style_guide", {}))
+                world_facts = manifest.get("world_facts", [])[:5]
+                writer_messages = [
+                    {"role": "system", "content": "你是长篇小说写作助手，按提供文风与场景目标写作，必须遵守style locks。"},
+                    {"role": "user", "content": f"scene={scene}\nstyle_guide={guide_text}\nstyle_locks={manifest.get('fixed_blocks',{}).get('style_locks',{})}\nworld_facts={world_facts}\ntechnique_brief={manifest.get('fixed_blocks',{}).get('technique_brief','')}\ntechnique_checklist={manifest.get('fixed_blocks',{}).get('technique_checklist',[])}\ntechnique_agent_tags={manifest.get('fixed_blocks',{}).get('technique_agent_tags',[])}\n请写一段章节草稿。"},
+                ]
+                self._start_prefetch(project_id, chapter_id, bp, scene_index, payload, project)
+                policy = coalescing_policy(project, payload)
+                writer_text, writer_used, writer_tokens = await self._writer(project_id, job_id, writer_messages, selected, fallback, policy)
+                body = writer_text or f"林秋在{scene.get('situation')}做出选择。"
+                previous = await self._offload(self.store.read_md, project_id, f"drafts/{chapter_id}.md") if batch and batch.get("append") else ""
+                draft = f"{previous.rstrip()}\n\n{body}" if previous.strip() else f"# {chapter_id}\n\n{body}"
+                await self._offload(self.store.write_md, project_id, f"drafts/{chapter_id}.md", draft)
+                if batch is not None and not payload.get("auto_apply_patch", False):
+                    # Without auto-apply the chapter text is final once drafted; the next scene may append.
+                    batch["merged"].set()
+                manifest["usage_estimate"] = {
+                    "prompt_tokens": self.llm_gateway.tokenizers.count_messages(writer_messages, writer_used),
+                    "completion_tokens": self.llm_gateway.tokenizers.count("".join(writer_tokens), writer_used),
+                }
+                await self.emit(project_id, job_id, "WRITER_DRAFT", {"chapter_id": chapter_id, "text": draft, "provider": writer_used.get("provider"), "model": writer_used.get("model"), "fallback": writer_used.get("provider") != selected.get("provider")})
+                return {"draft": draft, "used": writer_used}
+
+            async def _critic_llm(r: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+                draft = r["writer"]["draft"]
+                critic_messages = [{"role": "system", "content": "你是审稿人，输出一句主要问题。"}, {"role": "user", "content": draft[:900] + "\n证据:" + str(r["manifest"].get("critic_evidence", [])[:3])}]
+                _, critic_selected, critic_fallback = resolved["critic"]
+                return await self._complete_with_fallback(project_id, job_id, "critic", critic_messages, critic_selected, critic_fallback, priority, slot)
+
+            async def _checks(r: dict[str, Any]) -> list[dict[str, Any]]:
+                draft = r["writer"]["draft"]
+                fixed = r["manifest"].get("fixed_blocks", {})
+                issues = []
+                if fixed.get("style_locks", {}).get("punctuation") and ("!" in draft or "！" in draft):
+                    issues.append({"issue": "style_drift: punctuation lock violated", "evidence": {"chapter_id": chapter_id, "quote": "!"}})
+                issues.extend(derive_technique_adherence_issues(chapter_id, draft, fixed.get("technique_checklist", [])))
+                return issues
+
+            async def _critic(r: dict[str, Any]) -> list[dict[str, Any]]:
+                draft = r["writer"]["draft"]
+                critic_out, critic_used = r["critic_llm"]
+                issues = [{"issue": (critic_out.get("text") or "冲突可增强")[:120], "evidence": {"chapter_id": chapter_id, "quote": draft.splitlines()[-1][:40]}}, *r["checks"]]
+                await self._offload(self._append_many, project_id, "canon/issues.jsonl", issues)
+                await self.emit(project_id, job_id, "CRITIC_REVIEW", {"issues": issues, "provider": critic_used.get("provider"), "model": critic_used.get("model")})
+                return issues
+
+            async def _edit(r: dict[str, Any]) -> list[dict[str, Any]]:
+                draft, issues = r["writer"]["draft"], r["critic"]
+                editor_scope_hint = f"selection_range={selection_range}" if selection_range else "selection_range=None(whole chapter)"
+                editor_messages = [
+                    {"role": "system", "content": "你是编辑。输出JSON: {\"ops\":[{\"op_id\":\"op_001\",\"type\":\"replace\",\"target_range\":{\"start\":2,\"end\":3},\"before\":\"...\",\"after\":\"...\",\"rationale\":\"...\"}]}. 若给定 selection_range，则所有 target_range 必须完全落在 selection_range 内。"},
+                    {"role": "user", "content": f"{editor_scope_hint}\n{draft[:1200]}"},
+                ]
+                _, editor_selected, editor_fallback = resolved["editor"]
+                editor_out, editor_used = await self._complete_with_fallback(project_id, job_id, "editor", editor_messages, editor_selected, editor_fallback, priority, slot)
                 ops = []
-            if not ops:
-                ops = [{"op_id": "op_001", "type": "replace", "target_range": {"start": 2, "end": 3}, "before": "", "after": "林秋停了两秒。她收起手机，走进雨里，决定赴约。", "rationale": "增强节奏与动作"}]
-            if selection_range and not self._clip_ops_to_selection(ops, selection_range):
-                s0, e0 = selection_range["start"], selection_range["end"]
-                ops = [{"op_id": "op_sel_001", "type": "replace", "target_range": {"start": s0, "end": e0}, "before": "", "after": "（选区内润色）", "rationale": "选区编辑兜底"}]
-            technique_issue = next((x for x in issues if x.get("type") == "technique_adherence"), None)
-            if technique_issue:
-                ops.insert(0, {
-                    "op_id": "op_technique_001",
-                    "type": "replace",
-                    "target_range": {"start": 2, "end": 3},
-                    "before": "",
-                    "after": f"（技法修复）{technique_issue.get('suggested_fix', '补充技法信号。')}",
-                    "rationale": "优先修复 technique_adherence，最小改动",
-                })
-
-            ops = self._clip_ops_to_selection(ops, selection_range)
-            await self.emit(project_id, job_id, "EDITOR_PATCH", {"patch_id": f"patch_{job_id}", "ops": ops, "provider": editor_used.get("provider"), "model": editor_used.get("model"), "selection_range": selection_range})
-
-            auto_apply = bool(payload.get("auto_apply_patch", False))
-            if auto_apply:
+                try:
+                    obj = json.loads(editor_out.get("text", "{}"))
+                    ops = obj.get("ops", []) if isinstance(obj, dict) else []
+                except Exception:
+                    ops = []
+                if not ops:
+                    ops = [{"op_id": "op_001", "type": "replace", "target_range": {"start": 2, "end": 3}, "before": "", "after": "林秋停了两秒。她收起手机，走进雨里，决定赴约。", "rationale": "增强节奏与动作"}]
+                if selection_range and not self._clip_ops_to_selection(ops, selection_range):
+                    s0, e0 = selection_range["start"], selection_range["end"]
+                    ops = [{"op_id": "op_sel_001", "type": "replace", "target_range": {"start": s0, "end": e0}, "before": "", "after": "（选区内润色）", "rationale": "选区编辑兜底"}]
+                technique_issue = next((x for x in issues if x.get("type") == "technique_adherence"), None)
+                if technique_issue:
+                    ops.insert(0, {
+                        "op_id": "op_technique_001",
+                        "type": "replace",
+                        "target_range": {"start": 2, "end": 3},
+                        "before": "",
+                        "after": f"（技法修复）{technique_issue.get('suggested_fix', '补充技法信号。')}",
+                        "rationale": "优先修复 technique_adherence，最小改动",
+                    })
+
+                ops = self._clip_ops_to_selection(ops, selection_range)
+                await self.emit(project_id, job_id, "EDITOR_PATCH", {"patch_id": f"patch_{job_id}", "ops": ops, "provider": editor_used.get("provider"), "model": editor_used.get("model"), "selection_range": selection_range})
+                return ops
+
+            async def _merge(r: dict[str, Any]) -> str | None:
+                draft, ops = r["writer"]["draft"], r["editor"]
+                if not payload.get("auto_apply_patch", False):
+                    await self.emit(project_id, job_id, "DIFF", {"diff": ""})
+                    await self.emit(project_id, job_id, "MERGE_RESULT", {"chapter_id": chapter_id, "applied": False, "pending_patch": True})
+                    return None
                 apply_ops = []
                 for op in ops:
                     tr = op.get("target_range", {})
                     apply_ops.append({"op": op.get("type", op.get("op", "replace")), "start": int(tr.get("start", op.get("start", 0))), "end": int(tr.get("end", op.get("end", tr.get("start", 0)))), "value": op.get("after", op.get("value", ""))})
-                updated, diff = apply_patch_ops(draft, apply_ops)
+                updated, diff = await self._offload(apply_patch_ops, draft, apply_ops)
                 await self.emit(project_id, job_id, "DIFF", {"diff": diff})
-                self.store.write_md(project_id, f"drafts/{chapter_id}.md", updated)
-                self.store.append_jsonl(project_id, f"drafts/{chapter_id}.patch.jsonl", {"patch_id": f"patch_{job_id}", "patch_ops": ops, "accept_op_ids": [o.get("op_id") for o in ops], "accepted_op_ids": [o.get("op_id") for o in ops], "rejected_op_ids": [], "diff": diff, "job_id": job_id})
+                await self._offload(self.store.write_md, project_id, f"drafts/{chapter_id}.md", updated)
+                await self._offload(self.store.append_jsonl, project_id, f"drafts/{chapter_id}.patch.jsonl", {"patch_id": f"patch_{job_id}", "patch_ops": ops, "accept_op_ids": [o.get("op_id") for o in ops], "accepted_op_ids": [o.get("op_id") for o in ops], "rejected_op_ids": [], "diff": diff, "job_id": job_id})
                 await self.emit(project_id, job_id, "MERGE_RESULT", {"chapter_id": chapter_id, "applied": True, "accepted_op_ids": [o.get("op_id") for o in ops], "rejected_op_ids": []})
-
-                summary = make_summaries(chapter_id, updated)
-                meta = self.store.read_json(project_id, f"drafts/{chapter_id}.meta.json")
-                meta.update(summary)
-                self.store.write_json(project_id, f"drafts/{chapter_id}.meta.json", meta)
-                self.store.write_md(project_id, f"meta/summaries/{chapter_id}.summary.md", summary["chapter_summary"])
-                self.store.write_json(project_id, f"meta/summaries/{chapter_id}.scene_summaries.json", summary["scene_summaries"])
-
-                chapter_fact = {"id": f"fact_{job_id}", "scope": "chapter_summary", "key": "summary", "value": summary["chapter_summary"], "confidence": 0.8, "evidence": {"chapter_id": chapter_id}, "sources": [{"path": f"drafts/{chapter_id}.md"}]}
-                self.store.append_jsonl(project_id, "canon/facts.jsonl", chapter_fact)
-                for scene_summary in summary["scene_summaries"]:
-                    self.store.append_jsonl(project_id, "canon/facts.jsonl", {"id": f"fact_{uuid.uuid4().hex[:10]}", "scope": "scene_summary", "key": "scene", "value": scene_summary["summary"], "confidence": 0.7, "evidence": {"chapter_id": chapter_id}, "sources": [{"path": f"drafts/{chapter_id}.md"}]})
-                _, canon_selected, _canon_fallback = self._resolve_profile(project_id, payload, "canon_extractor")
+                if batch is not None:
+                    batch["merged"].set()
+                return updated
+
+            async def _canon(r: dict[str, Any]) -> None:
+                updated, writer_used = r["merge"], r["writer"]["used"]
+                if updated is None:
+                    await self.emit(project_id, job_id, "CANON_UPDATES", {"facts": [], "summary": None, "provider": writer_used.get("provider")})
+                    return
+                summary, chapter_fact = await self._offload(self._record_summaries, project_id, job_id, chapter_id, updated)
+                _, canon_selected, _canon_fallback = resolved["canon_extractor"]
                 canon_profile = canon_selected
                 if canon_profile.get("provider") == "mock" and writer_used.get("provider") != "mock":
                     canon_profile = writer_used
-                extracted = await self.canon_extractor.extract(chapter_id, updated, {"scene_index": scene_index, "beats": scene.get("beats", []), "cast": scene.get("cast", [])}, canon_profile)
-                for fact in extracted.get("facts", []):
-                    self.store.append_jsonl(project_id, "canon/facts.jsonl", fact)
-                for issue in extracted.get("issues", []):
-                    self.store.append_jsonl(project_id, "canon/issues.jsonl", issue)
-                for proposal in extracted.get("new_entity_proposals", []):
-                    self.store.append_jsonl(project_id, "canon/proposals.jsonl", proposal)
-                meta["proposals"] = extracted.get("new_entity_proposals", [])
-                self.store.write_json(project_id, f"drafts/{chapter_id}.meta.json", meta)
+                if defer_canon:
+                    # The extractor LLM call starts after DONE, still holding the job's backend slot; its
+                    # result is logged as CANON_EXTRACTED.
+                    await self.emit(project_id, job_id, "CANON_UPDATES", {"facts": [chapter_fact], "proposals": [], "summary": summary, "provider": writer_used.get("provider"), "deferred": True})
+                    deferred.append(lambda held: self._extract_canon(project_id, job_id, chapter_id, updated, scene_index, scene, canon_profile, priority=priority, held=held))
+                    return
+                extracted = await self._extract_canon(project_id, job_id, chapter_id, updated, scene_index, scene, canon_profile, publish=False, priority=priority, held=slot)
                 await self.emit(project_id, job_id, "CANON_UPDATES", {"facts": [chapter_fact, *extracted.get("facts", [])], "proposals": extracted.get("new_entity_proposals", []), "summary": summary, "provider": writer_used.get("provider")})
-            else:
-                await self.emit(project_id, job_id, "DIFF", {"diff": ""})
-                await self.emit(project_id, job_id, "MERGE_RESULT", {"chapter_id": chapter_id, "applied": False, "pending_patch": True})
-                await self.emit(project_id, job_id, "CANON_UPDATES", {"facts": [], "summary": None, "provider": writer_used.get("provider")})
 
-            self._update_rolling_summary(project_id, "session_001")
+            async def _checkpoint(stage: str, value: Any) -> None:
+                if stage not in UNCHECKPOINTED_STAGES:
+                    await self._offload(checkpoints.save_stage, self.store, project_id, job_id, stage, value)
+
+            await run_stage_dag([
+                Stage("plan", _plan),
+                Stage("retrieve", _retrieve),
+                Stage("technique", _technique, ("plan",)),
+                Stage("manifest", _manifest, ("technique", "retrieve")),
+                Stage("writer", _write, ("manifest",)),
+                Stage("critic_llm", _critic_llm, ("writer",)),
+                Stage("checks", _checks, ("writer",)),
+                Stage("critic", _critic, ("critic_llm", "checks")),
+                Stage("editor", _edit, ("critic",)),
+                Stage("merge", _merge, ("editor",)),
+                Stage("canon", _canon, ("merge",)),
+            ], timings, resume, _checkpoint)
+
+            await self._offload(self._update_rolling_summary, project_id, "session_001")
+            ok = True
         except Exception as exc:
             await self.emit(project_id, job_id, "ERROR", {"stage": "pipeline", "message": str(exc)})
         finally:
-            await self.queues[job_id].put({"event": "DONE", "data": {"job_id": job_id}})
+            self._running.discard(job_id)
+            if slot is not None and not deferred:
+                self.scheduler.release(slot, project_id)
+            if reservation is not None:
+                self.scheduler.unreserve(reservation, project_id)
+            try:
+                await self._offload(checkpoints.save_job, self.store, project_id, job_id, status="done" if ok else "failed", stage_ms=timings)
+            except Exception:
+                pass
+            if batch is not None:
+                batch["merged"].set()
+            buf = self.events.open(job_id)
+            done = {"job_id": job_id, "stream": dict(buf.stats), "stage_ms": timings}
+            buf.publish({"event": "DONE", "data": done})
+            if job_id in self._batch_of:
+                batch_id, unit = self._batch_of[job_id]
+                self.events.publish(batch_id, {"event": "UNIT_DONE", "data": {**done, "ok": ok}, "job_id": job_id, "unit": unit})
+            if deferred:
+                task = asyncio.create_task(self._after_done(project_id, deferred, slot))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+        return ok
+
+    async def _after_done(self, project_id: str, calls: list[Any], slot: str | None) -> None:
+        # Deferred work keeps the job's backend slot until its LLM calls return.
+        try:
+            for call in calls:
+                await call(slot)
+        finally:
+            if slot is not None:
+                self.scheduler.release(slot, project_id)
+
+    async def _extract_canon(self, project_id: str, job_id: str, chapter_id: str, text: str, scene_index: int, scene: dict[str, Any], profile: dict[str, Any], publish: bool = True, priority: str = "interactive", held: str | None = None) -> dict[str, Any]:
+        try:
+            async with self._backend_slot(job_id, project_id, profile, priority, held):
+                extracted = await self.canon_extractor.extract(chapter_id, text, {"scene_index": scene_index, "beats": scene.get("beats", []), "cast": scene.get("cast", [])}, profile)
+        except Exception as exc:
+            if not publish:
+                raise
+            await self.emit(project_id, job_id, "ERROR", {"stage": "canon_extractor", "message": str(exc)})
+            return {}
+        await self._offload(self._store_extracted, project_id, chapter_id, extracted)
+        if publish:
+            await self.emit(project_id, job_id, "CANON_EXTRACTED", {"chapter_id": chapter_id, "facts": extracted.get("facts", []), "proposals": extracted.get("new_entity_proposals", [])})
+        return extracted
+
+    def _record_summaries(self, project_id: str, job_id: str, chapter_id: str, text: str) -> tuple[dict[str, Any], dict[str, Any]]:
+        summary = make_summaries(chapter_id, text)
+        meta = self.store.read_json(project_id, f"drafts/{chapter_id}.meta.json")
+        meta.update(summary)
+        self.store.write_json(project_id, f"drafts/{chapter_id}.meta.json", meta)
+        self.store.write_md(project_id, f"meta/summaries/{chapter_id}.summary.md", summary["chapter_summary"])
+        self.store.write_json(project_id, f"meta/summaries/{chapter_id}.scene_summaries.json", summary["scene_summaries"])
+        update_summary_pyramid(self.store, project_id, chapter_id, summary["chapter_summary"])
+
+        chapter_fact = {"id": f"fact_{job_id}", "scope": "chapter_summary", "key": "summary", "value": summary["chapter_summary"], "confidence": 0.8, "evidence": {"chapter_id": chapter_id}, "sources": [{"path": f"drafts/{chapter_id}.md"}]}
+        self.store.append_jsonl(project_id, "canon/facts.jsonl", chapter_fact)
+        for scene_summary in summary["scene_summaries"]:
+            self.store.append_jsonl(project_id, "canon/facts.jsonl", {"id": f"fact_{uuid.uuid4().hex[:10]}", "scope": "scene_summary", "key": "scene", "value": scene_summary["summary"], "confidence": 0.7, "evidence": {"chapter_id": chapter_id}, "sources": [{"path": f"drafts/{chapter_id}.md"}]})
+        return summary, chapter_fact
+
+    def _store_extracted(self, project_id: str, chapter_id: str, extracted: dict[str, Any]) -> None:
+        self._append_many(project_id, "canon/facts.jsonl", extracted.get("facts", []))
+        self._append_many(project_id, "canon/issues.jsonl", extracted.get("issues", []))
+        self._append_many(project_id, "canon/proposals.jsonl", extracted.get("new_entity_proposals", []))
+        meta = self.store.read_json(project_id, f"drafts/{chapter_id}.meta.json")
+        meta["proposals"] = extracted.get("new_entity_proposals", [])
+        self.store.write_json(project_id, f"drafts/{chapter_id}.meta.json", meta)
 
     def _update_rolling_summary(self, project_id: str, sid: str) -> None:
-        events = self.store.read_jsonl(project_id, f"sessions/{sid}.jsonl")
-        if len(events) < 30:
+        # Keeps {offset, count, recent} for the session log and only parses lines appended since the
+        # last update, so the cost follows the job's own events rather than the log's length. Tailing
+        # the file (instead of hooking emit) also counts events appended by the canon/patch routers.
+        rel = f"sessions/{sid}.jsonl"
+        with self._rolling_lock:
+            meta = self.store.read_json(project_id, f"sessions/{sid}.meta.json")
+            state = self._rolling.get((project_id, sid)) or meta.get("rolling_state") or {}
+            size = (self.store.file_signature(project_id, rel) or [0, 0])[1]
+            if int(state.get("offset", 0)) > size:
+                state = {}  # log was truncated or replaced
+            rows, offset = self.store.read_jsonl_from(project_id, rel, int(state.get("offset", 0)))
+            recent = deque(state.get("recent", []), maxlen=ROLLING_WINDOW)
+            recent.extend(f"{e.get('job_id','evt')}:{str(e.get('event',''))[:40]}" for e in rows)
+            state = {"offset": offset, "count": int(state.get("count", 0)) + len(rows), "recent": list(recent)}
+            self._rolling[(project_id, sid)] = state
+            meta["rolling_state"] = state
+            if state["count"] >= ROLLING_MIN_EVENTS:
+                meta["rolling_summary"] = " | ".join(recent)[:600]
+                meta["last_summarized_message_id"] = str(state["count"])
+            self.store.write_json(project_id, f"sessions/{sid}.meta.json", meta)
+
+    def has_job(self, job_id: str) -> bool:
+        return self.events.get(job_id) is not None
+
+    async def stream(self, job_id: str, since: int = -1):
+        buf = self.events.get(job_id)
+        if buf is None:
             return
-        meta = self.store.read_json(project_id, f"sessions/{sid}.meta.json")
-        last = events[-10:]
-        summary = " | ".join([f"{e.get('job_id','evt')}:{str(e.get('event',''))[:40]}" for e in last])[:600]
-        meta["rolling_summary"] = summary
-        meta["last_summarized_message_id"] = str(len(events))
-        self.store.write_json(project_id, f"sessions/{sid}.meta.json", meta)
-
-    async def stream(self, job_id: str):
-        queue = self.queues[job_id]
-        while True:
-            event = await queue.get()
+        async for event in buf.subscribe(since):
             yield event
-            if event["event"] == "DONE":
-                break
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable
+
+
+# Concurrent jobs per backend before queueing. Local servers serialize decoding, so extra
+# parallel requests only slow every stream down; hosted APIs tolerate a few in flight.
+DEFAULT_BACKEND_CONCURRENCY = {"mock": 8, "ollama": 1, "llama_cpp": 1, "openai_compat": 4}
+FALLBACK_CONCURRENCY = 2
+MAX_QUEUED_PER_BACKEND = 32
+MAX_QUEUED_PER_PROJECT = 8
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class AdmissionError(RuntimeError):
+    pass
+
+
+@dataclass
+class _Waiter:
+    job_id: str
+    project_id: str
+    priority: int
+    seq: int
+    notify: Callable[[dict[str, Any]], None]
+    future: asyncio.Future = field(repr=False)
+
+
+def backend_key(profile: dict[str, Any]) -> str:
+    provider = str(profile.get("provider", "mock"))
+    base_url = str(profile.get("base_url", "") or "").rstrip("/")
+    return f"{provider}@{base_url}" if base_url and provider != "mock" else provider
+
+
+class JobScheduler:
+    """Admits jobs per backend (provider + base_url) under a concurrency limit.
+
+    Waiters are ordered by priority class, then by how many jobs their project already runs on
+    that backend (so one project cannot starve the others), then by arrival.
+    """
+
+    def __init__(self, limits: dict[str, int] | None = None, max_queued_per_backend: int = MAX_QUEUED_PER_BACKEND, max_queued_per_project: int = MAX_QUEUED_PER_PROJECT) -> None:
+        self.limits = {**DEFAULT_BACKEND_CONCURRENCY, **(limits or {})}
+        self.max_queued_per_backend = max_queued_per_backend
+        self.max_queued_per_project = max_queued_per_project
+        self.running: dict[str, int] = defaultdict(int)
+        self.running_by_project: dict[tuple[str, str], int] = defaultdict(int)
+        self.waiting: dict[str, list[_Waiter]] = defaultdict(list)
+        # Admitted jobs that have not reached acquire() yet; they count against the queue limits.
+        self.reserved: dict[str, int] = defaultdict(int)
+        self.reserved_by_project: dict[tuple[str, str], int] = defaultdict(int)
+        self.key_limits: dict[str, int] = {}
+        self._seq = itertools.count()
+
+    def limit_for(self, profile: dict[str, Any]) -> int:
+        if profile.get("max_concurrency"):
+            return max(1, int(profile["max_concurrency"]))
+        return self.limits.get(str(profile.get("provider", "mock")), FALLBACK_CONCURRENCY)
+
+    def admit(self, project_id: str, profile: dict[str, Any]) -> str:
+        """Reserve a place for a new job and return the reservation key (the backend key).
+
+        Jobs beyond the free slots, waiting or only reserved, count as queued. Pass the key to
+        acquire() to consume the reservation, or to unreserve() if the job ends before acquiring.
+        """
+        key = backend_key(profile)
+        self.key_limits[key] = self.limit_for(profile)
+        free = max(0, self.key_limits[key] - self.running[key])
+        queued = self.waiting.get(key, [])
+        pending = len(queued) + self.reserved[key]
+        if pending - free >= self.max_queued_per_backend:
+            raise AdmissionError(f"backend {key} queue is full ({pending} pending)")
+        if sum(1 for w in queued if w.project_id == project_id) + self.reserved_by_project[(key, project_id)] - free >= self.max_queued_per_project:
+            raise AdmissionError(f"project {project_id} has too many queued jobs on {key}")
+        self.reserved[key] += 1
+        self.reserved_by_project[(key, project_id)] += 1
+        return key
+
+    def unreserve(self, key: str, project_id: str) -> None:
+        if self.reserved_by_project[(key, project_id)] > 0:
+            self.reserved[key] -= 1
+            self.reserved_by_project[(key, project_id)] -= 1
+
+    def _order(self, key: str) -> list[_Waiter]:
+        return sorted(self.waiting[key], key=lambda w: (w.priority, self.running_by_project[(key, w.project_id)], w.seq))
+
+    def _notify_positions(self, key: str) -> None:
+        for pos, w in enumerate(self._order(key), start=1):
+            w.notify({"backend": key, "position": pos, "running": self.running[key], "limit": self.key_limits.get(key)})
+
+    def _dispatch(self, key: str) -> None:
+        dispatched = False
+        while self.waiting[key] and self.running[key] < self.key_limits[key]:
+            w = self._order(key)[0]
+            self.waiting[key].remove(w)
+            if w.future.done():
+                continue
+            self.running[key] += 1
+            self.running_by_project[(key, w.project_id)] += 1
+            w.future.set_result(None)
+            dispatched = True
+        if dispatched:
+            self._notify_positions(key)
+
+    async def acquire(self, job_id: str, project_id: str, profile: dict[str, Any], priority: str = "interactive", notify: Callable[[dict[str, Any]], None] | None = None, reservation: str | None = None) -> str:
+        if reservation is not None:
+            self.unreserve(reservation, project_id)
+        key = backend_key(profile)
+        self.key_limits[key] = self.limit_for(profile)
+        if self.running[key] < self.key_limits[key] and not self.waiting[key]:
+            self.running[key] += 1
+            self.running_by_project[(key, project_id)] += 1
+            return key
+        w = _Waiter(job_id, project_id, PRIORITIES.get(priority, PRIORITIES["interactive"]), next(self._seq), notify or (lambda _info: None), asyncio.get_running_loop().create_future())
+        self.waiting[key].append(w)
+        self._notify_positions(key)
+        try:
+            await w.future
+        except asyncio.CancelledError:
+            if w in self.waiting[key]:
+                self.waiting[key].remove(w)
+            elif not w.future.cancelled():
+                self.release(key, project_id)
+            raise
+        return key
+
+    def release(self, key: str, project_id: str) -> None:
+        self.running[key] -= 1
+        self.running_by_project[(key, project_id)] -= 1
+        self._dispatch(key)
+
+    @asynccontextmanager
+    async def slot(self, job_id: str, project_id: str, profile: dict[str, Any], priority: str = "interactive", notify: Callable[[dict[str, Any]], None] | None = None) -> AsyncIterator[str]:
+        key = await self.acquire(job_id, project_id, profile, priority, notify)
+        try:
+            yield key
+        finally:
+            self.release(key, project_id)
+
+    def snapshot(self) -> dict[str, Any]:
+        keys = set(self.running) | set(self.waiting)
+        return {k: {"running": self.running[k], "waiting": len(self.waiting[k]), "limit": self.key_limits.get(k)} for k in sorted(keys)}
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[dict[str, Any]], Awaitable[Any]]
+    deps: tuple[str, ...] = field(default_factory=tuple)
+
+
+async def run_stage_dag(
+    stages: list[Stage],
+    timings: dict[str, float],
+    completed: dict[str, Any] | None = None,
+    on_complete: Callable[[str, Any], Awaitable[None]] | None = None,
+) -> dict[str, Any]:
+    """Run each stage as soon as its dependencies finish; independent stages overlap.
+
+    Stages must be declared after their dependencies. `fn` receives the results of all stages
+    finished so far. Stages found in `completed` (e.g. restored checkpoints) are not run again, and
+    `on_complete` is awaited after each stage that does run. The first failure cancels every stage
+    still pending and is re-raised.
+    """
+    results: dict[str, Any] = {}
+    tasks: dict[str, asyncio.Future] = {}
+
+    async def _run(stage: Stage) -> None:
+        if stage.deps:
+            await asyncio.gather(*(tasks[d] for d in stage.deps))
+        t0 = time.perf_counter()
+        results[stage.name] = await stage.fn(results)
+        timings[stage.name] = round((time.perf_counter() - t0) * 1000, 3)
+        if on_complete is not None:
+            await on_complete(stage.name, results[stage.name])
+
+    loop = asyncio.get_running_loop()
+    for stage in stages:
+        missing = [d for d in stage.deps if d not in tasks]
+        if missing:
+            raise ValueError(f"stage {stage.name} depends on undeclared stages {missing}")
+        if completed and stage.name in completed:
+            results[stage.name] = completed[stage.name]
+            tasks[stage.name] = loop.create_future()
+            tasks[stage.name].set_result(None)
+            continue
+        tasks[stage.name] = asyncio.create_task(_run(stage))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for t in tasks.values():
+            t.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return results
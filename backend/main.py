@@ -20,6 +20,7 @@ from services.llm_gateway import LLMGateway
 from services.world_facts_service import WorldFactsService
 from services.wiki_import_service import WikiImportService
 from services.llm_config_service import LLMConfigService
+from services.tokenizer import TokenizerRegistry
 from storage.fs_store import FSStore
 
 DATA_DIR = BACKEND_DIR.parents[0] / 'data'
@@ -31,14 +32,15 @@ except Exception:
     # with YAML content different from local bootstrap format.
     pass
 
+tokenizers = TokenizerRegistry(DATA_DIR / '_global' / 'tokenizers')
 kb_service = KBService(store)
-context_engine = ContextEngine(store, kb_service)
+context_engine = ContextEngine(store, kb_service, tokenizers)
 style_service = StyleService(store, kb_service)
-llm_gateway = LLMGateway()
+llm_gateway = LLMGateway(tokenizers)
 world_facts_service = WorldFactsService(store, kb_service)
 wiki_import_service = WikiImportService(store)
 llm_config_service = LLMConfigService(DATA_DIR)
-job_manager = JobManager(store, context_engine, llm_gateway)
+job_manager = JobManager(store, context_engine, llm_gateway, llm_config_service)
 
 frontend_port = os.getenv('NOVIX_FRONTEND_PORT', '5173')
 allowed_origins = [
@@ -6,7 +6,7 @@ from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException
 
 from services.canon_extractor_service import CanonExtractorService
-from services.summary_service import make_summaries
+from services.summary_service import make_summaries, update_summary_pyramid
 from storage.fs_store import FSStore
 
 
@@ -80,6 +80,7 @@ async def analyze_chapter(
     s.write_json(project_id, f'drafts/{chapter_id}.meta.json', chapter_meta)
     s.write_md(project_id, f'meta/summaries/{chapter_id}.summary.md', summary.get('chapter_summary', ''))
     s.write_json(project_id, f'meta/summaries/{chapter_id}.scene_summaries.json', summary.get('scene_summaries', []))
+    update_summary_pyramid(s, project_id, chapter_id, summary.get('chapter_summary', ''))
 
     extraction = await extractor.extract(chapter_id, chapter_text, {
         'scene_index': body.get('scene_index', 0),
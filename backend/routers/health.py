@@ -6,3 +6,11 @@ router = APIRouter(prefix="/api")
 @router.get("/health")
 def health():
     return {"ok": True}
+
+
+@router.get("/health/loop")
+async def loop_health():
+    from main import job_manager
+
+    job_manager.loop_monitor.start()
+    return {"ok": True, "loop": job_manager.loop_monitor.snapshot()}
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, WebSocket
 
+from jobs import checkpoints
 from jobs.manager import JobManager
+from jobs.scheduler import AdmissionError
 
 
 def get_manager() -> JobManager:
@@ -16,16 +18,74 @@ router = APIRouter(prefix='/api')
 async def create_job(project_id: str, body: dict, jm: JobManager = Depends(get_manager)):
     try:
         job_id = await jm.run_write_job(project_id, body)
+    except AdmissionError as exc:
+        raise HTTPException(status_code=429, detail=str(exc)) from exc
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     return {"job_id": job_id}
 
 
+@router.post('/projects/{project_id}/jobs/batch')
+async def create_batch_job(project_id: str, body: dict, jm: JobManager = Depends(get_manager)):
+    try:
+        return await jm.run_batch_job(project_id, body)
+    except AdmissionError as exc:
+        raise HTTPException(status_code=429, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.get('/projects/{project_id}/jobs')
+def list_jobs(project_id: str, limit: int = 50, jm: JobManager = Depends(get_manager)):
+    return checkpoints.list_jobs(jm.store, project_id, limit)
+
+
+@router.get('/projects/{project_id}/jobs/{job_id}')
+def get_job(project_id: str, job_id: str, jm: JobManager = Depends(get_manager)):
+    job = checkpoints.load_job(jm.store, project_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
+@router.post('/jobs/{job_id}/resume')
+async def resume_job(job_id: str, jm: JobManager = Depends(get_manager)):
+    try:
+        return await jm.resume_job(job_id)
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail="job not found") from exc
+    except AdmissionError as exc:
+        raise HTTPException(status_code=429, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+
+
+@router.get('/jobs/scheduler')
+def scheduler_status(jm: JobManager = Depends(get_manager)):
+    return {"backends": jm.scheduler.snapshot()}
+
+
+@router.get('/jobs/{job_id}/stats')
+def job_stats(job_id: str, jm: JobManager = Depends(get_manager)):
+    buf = jm.events.get(job_id)
+    if buf is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return {
+        **buf.stats,
+        "last_seq": buf.next_seq - 1,
+        "done": buf.done_at is not None,
+        "subscribers": [{"pending": len(sub.pending), "coalesced": sub.coalesced} for sub in buf.subscribers],
+    }
+
+
 @router.websocket('/jobs/{job_id}/stream')
-async def job_stream(job_id: str, websocket: WebSocket):
+async def job_stream(job_id: str, websocket: WebSocket, since: int = -1):
     from main import job_manager
 
     await websocket.accept()
-    async for event in job_manager.stream(job_id):
+    if not job_manager.has_job(job_id):
+        await websocket.close(code=4404)
+        return
+    async for event in job_manager.stream(job_id, since):
         await websocket.send_json(event)
     await websocket.close()
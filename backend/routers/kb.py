@@ -14,7 +14,8 @@ router = APIRouter(prefix='/api/projects/{project_id}/kb')
 
 @router.post('/reindex')
 def reindex(project_id: str, body: dict, kb: KBService = Depends(get_kb)):
-    return kb.reindex(project_id, body.get('kb_id', 'kb_style'))
+    workers = body.get('workers')
+    return kb.reindex(project_id, body.get('kb_id', 'kb_style'), parallel=bool(body.get('parallel', False)), workers=int(workers) if workers else None)
 
 
 @router.post('/query')
@@ -25,3 +26,13 @@ def query(project_id: str, body: dict, kb: KBService = Depends(get_kb)):
 @router.post('/query_multi')
 def query_multi(project_id: str, body: dict, kb: KBService = Depends(get_kb)):
     return kb.query_multi(project_id, body.get('query', ''), int(body.get('top_k', 12)), body.get('kb', []), body.get('filters'))
+
+
+@router.post('/phrase')
+def find_phrase(project_id: str, body: dict, kb: KBService = Depends(get_kb)):
+    return kb.find_phrase(project_id, body.get('kb_id', 'kb_manuscript'), body.get('phrase', ''), int(body.get('top_k', 20)))
+
+
+@router.get('/stats')
+def stats(project_id: str, kb: KBService = Depends(get_kb)):
+    return {"dedup": kb.dedup_stats(project_id)}
@@ -1,9 +1,9 @@
 from pathlib import Path
-import json
 import uuid
 
 from fastapi import APIRouter, Depends, HTTPException
 
+from services import memory_pack_service as memory_packs
 from storage.fs_store import FSStore
 
 
@@ -38,35 +38,7 @@ def get_project(project_id: str, s: FSStore = Depends(get_store)):
 
 @router.get('/{project_id}/memory_packs')
 def list_memory_packs(project_id: str, chapter_id: str | None = None, s: FSStore = Depends(get_store)):
-    base = s._project_dir(project_id) / 'meta' / 'memory_packs'
-    if chapter_id:
-        roots = [base / chapter_id]
-    else:
-        roots = [p for p in base.iterdir() if p.is_dir()] if base.exists() else []
-
-    rows = []
-    for root in roots:
-        if not root.exists():
-            continue
-        for fp in root.glob('*.json'):
-            try:
-                data = json.loads(fp.read_text(encoding='utf-8'))
-            except Exception:
-                data = {}
-            ch = root.name
-            job = fp.stem
-            rows.append({
-                'pack_id': f'{ch}:{job}',
-                'chapter_id': ch,
-                'job_id': job,
-                'created_at': fp.stat().st_mtime,
-                'summary': {
-                    'evidence_count': len(data.get('evidence', [])) if isinstance(data, dict) else 0,
-                    'compression_steps': len(data.get('compression_steps', [])) if isinstance(data, dict) else 0,
-                },
-            })
-    rows.sort(key=lambda x: (x['chapter_id'], x['job_id']), reverse=True)
-    return rows
+    return memory_packs.list_memory_packs(s, project_id, chapter_id)
 
 
 @router.get('/{project_id}/memory_packs/{pack_id}')
@@ -76,7 +48,7 @@ def get_memory_pack(project_id: str, pack_id: str, s: FSStore = Depends(get_stor
     chapter_id, job_id = pack_id.split(':', 1)
     if any(x in chapter_id for x in ['..', '/', '\\']) or any(x in job_id for x in ['..', '/', '\\']):
         raise HTTPException(status_code=400, detail='invalid pack_id')
-    fp = s._project_dir(project_id) / 'meta' / 'memory_packs' / chapter_id / f'{job_id}.json'
-    if not fp.exists():
+    pack = memory_packs.load_memory_pack(s, project_id, chapter_id, job_id)
+    if pack is None:
         raise HTTPException(status_code=404, detail='Not found')
-    return json.loads(fp.read_text(encoding='utf-8'))
+    return pack
@@ -1,77 +1,178 @@
 from __future__ import annotations
 
-from typing import Any
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
 
 from context_engine.budget_manager import BudgetManager
-from services.kb_service import KBService
+from context_engine.compressor import compress_to_fit
+from context_engine.evidence_packer import EVIDENCE_BUCKETS, pack_evidence
+from context_engine.mmr import mmr_rerank
+from context_engine.token_ledger import TokenLedger
+from services.kb_service import KBService, _tokenize
+from services.summary_service import PYRAMID_PATH, summary_cover
+from services.tokenizer import TokenizerRegistry
 from storage.fs_store import FSStore
 
 
-def approx_tokens(text: str) -> int:
-    return max(1, len(text) // 2)
+EVIDENCE_MAX_ITEMS = 12
+MANIFEST_CACHE_SIZE = 128
+EVIDENCE_KBS = ("kb_manuscript", "kb_docs", "kb_style", "kb_world")
+
+
+def _fingerprint(parts: Any) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
 
 
 class ContextEngine:
-    def __init__(self, store: FSStore, kb: KBService):
+    def __init__(self, store: FSStore, kb: KBService, tokenizers: TokenizerRegistry | None = None):
         self.store = store
         self.kb = kb
+        self.tokenizers = tokenizers or TokenizerRegistry(store.data_dir / "_global" / "tokenizers")
+        # Cached components are shared between manifests and must not be mutated by callers.
+        self._components: OrderedDict[tuple[str, str, str], Any] = OrderedDict()
+        self._components_lock = threading.Lock()
 
-    def build_manifest(self, project_id: str, chapter_id: str, scene: dict[str, Any], constraints: dict[str, Any] | None = None, technique_data: dict[str, Any] | None = None) -> dict[str, Any]:
-        constraints = constraints or {}
-        proj = self.store.read_yaml(project_id, "project.yaml")
-        bm = BudgetManager.from_project(proj, constraints.get("max_tokens"))
-        limits = bm.bucket_limits()
+    def _component(self, report: dict[str, Any], project_id: str, name: str, parts: Any, build: Callable[[], Any]) -> Any:
+        key = (project_id, name, _fingerprint(parts))
+        with self._components_lock:
+            if key in self._components:
+                self._components.move_to_end(key)
+                report["reused"].append(name)
+                return self._components[key]
+        t0 = time.perf_counter()
+        value = build()
+        report["built_ms"][name] = round((time.perf_counter() - t0) * 1000, 3)
+        with self._components_lock:
+            self._components[key] = value
+            while len(self._components) > MANIFEST_CACHE_SIZE:
+                self._components.popitem(last=False)
+        return value
 
-        style = self.store.read_yaml(project_id, "cards/style_001.yaml")
-        outline = self.store.read_yaml(project_id, "cards/outline_001.yaml")
-        cast = scene.get("cast", [])
-        cards = [self.store.read_yaml(project_id, f"cards/{cid}.yaml") for cid in cast if cid][: bm.caps["max_items_per_bucket"]]
-        canon_facts = self.store.read_jsonl(project_id, "canon/facts.jsonl")[-bm.caps["max_items_per_bucket"] :]
-        canon_issues = self.store.read_jsonl(project_id, "canon/issues.jsonl")[-bm.caps["max_items_per_bucket"] :]
-        chapter_meta = self.store.read_json(project_id, f"drafts/{chapter_id}.meta.json")
+    def _kb_signature(self, project_id: str) -> list[Any]:
+        return [
+            [self.store.file_signature(project_id, f"meta/kb/{kb_id}/generation.json"), self.store.file_signature(project_id, f"meta/kb/{kb_id}/chunks.jsonl")]
+            for kb_id in EVIDENCE_KBS
+        ]
+
+    def _cards_signature(self, project_id: str) -> list[Any]:
+        # Card stars/importance reweight every cards/*.yaml hit at query time, so evidence depends on them.
+        cards_dir = self.store._safe_path(project_id, "cards")
+        return [[fp.name, self.store.file_signature(project_id, f"cards/{fp.name}")] for fp in sorted(cards_dir.glob("*.yaml"))]
+
+    def _load_components(self, project_id: str, chapter_id: str, scene: dict[str, Any], cap: int, report: dict[str, Any]) -> dict[str, Any]:
+        sig = self.store.file_signature
+        style, outline = self._component(
+            report, project_id, "style",
+            [sig(project_id, "cards/style_001.yaml"), sig(project_id, "cards/outline_001.yaml")],
+            lambda: (self.store.read_yaml(project_id, "cards/style_001.yaml"), self.store.read_yaml(project_id, "cards/outline_001.yaml")),
+        )
+        cast = [cid for cid in scene.get("cast", []) if cid][:cap]
+        cards = self._component(
+            report, project_id, "cards",
+            [cast, [sig(project_id, f"cards/{cid}.yaml") for cid in cast]],
+            lambda: [self.store.read_yaml(project_id, f"cards/{cid}.yaml") for cid in cast],
+        )
+        canon_facts, canon_issues = self._component(
+            report, project_id, "canon",
+            [cap, sig(project_id, "canon/facts.jsonl"), sig(project_id, "canon/issues.jsonl")],
+            lambda: (self.store.read_jsonl(project_id, "canon/facts.jsonl")[-cap:], self.store.read_jsonl(project_id, "canon/issues.jsonl")[-cap:]),
+        )
+        chapter_meta = self._component(
+            report, project_id, "chapter_meta",
+            [chapter_id, sig(project_id, f"drafts/{chapter_id}.meta.json")],
+            lambda: self.store.read_json(project_id, f"drafts/{chapter_id}.meta.json"),
+        )
 
-        guide = style.get("payload", {}).get("style_guide", {})
-        locks = style.get("payload", {}).get("locks", {})
-        policy = style.get("payload", {}).get("injection_policy", {"max_examples": 4, "max_chars_per_example": 800})
         query_text = " ".join([scene.get("purpose", ""), scene.get("situation", ""), *scene.get("choice_points", [])])
 
         self.kb.reindex(project_id, "kb_world")
-        if not self.store.read_jsonl(project_id, "meta/kb/kb_manuscript/chunks.jsonl"):
+        if not (sig(project_id, "meta/kb/kb_manuscript/chunks.jsonl") or [0, 0])[1]:
             self.kb.reindex_manuscript(project_id)
+        kb_parts = [self._kb_signature(project_id), self._cards_signature(project_id), sig(project_id, "project.yaml"), cap]
 
-        writer_evidence = self.kb.query_multi(
-            project_id,
-            query_text,
-            bm.caps["max_items_per_bucket"],
-            [
-                {"kb_id": "kb_manuscript", "weight": 1.2},
-                {"kb_id": "kb_docs", "weight": 1.0},
-                {"kb_id": "kb_style", "weight": 0.7},
-                {"kb_id": "kb_world", "weight": 1.1},
-            ],
-            filters={},
+        writer_evidence = self._component(
+            report, project_id, "writer_evidence",
+            [query_text, kb_parts],
+            lambda: self.kb.query_multi(
+                project_id,
+                query_text,
+                cap,
+                [
+                    {"kb_id": "kb_manuscript", "weight": 1.2},
+                    {"kb_id": "kb_docs", "weight": 1.0},
+                    {"kb_id": "kb_style", "weight": 0.7},
+                    {"kb_id": "kb_world", "weight": 1.1},
+                ],
+                filters={},
+            ),
+        )
+        names = [str(n) for n in [c.get("payload", {}).get("name") or c.get("title") for c in cards] if n]
+        critic_evidence = self._component(
+            report, project_id, "critic_evidence",
+            [query_text, names, kb_parts],
+            lambda: self._critic_evidence(project_id, query_text, cap, names),
         )
 
-        critic_evidence = self.kb.query_multi(
-            project_id,
-            query_text + " 冲突 设定 矛盾",
-            bm.caps["max_items_per_bucket"],
-            [
-                {"kb_id": "kb_manuscript", "weight": 1.4},
-                {"kb_id": "kb_docs", "weight": 1.0},
-                {"kb_id": "kb_world", "weight": 1.2},
-                {"kb_id": "kb_style", "weight": 0.2},
-            ],
-            filters={},
+        draft = self._component(report, project_id, "draft", [chapter_id, sig(project_id, f"drafts/{chapter_id}.md")], lambda: self.store.read_md(project_id, f"drafts/{chapter_id}.md"))
+        cover = self._component(
+            report, project_id, "summary_cover",
+            [chapter_id, sig(project_id, PYRAMID_PATH)],
+            lambda: summary_cover(self.store.read_json(project_id, PYRAMID_PATH), chapter_id),
         )
+        return {
+            "style": style,
+            "outline": outline,
+            "cards": cards,
+            "canon_facts": canon_facts,
+            "canon_issues": canon_issues,
+            "chapter_meta": chapter_meta,
+            "query_text": query_text,
+            "writer_evidence": writer_evidence,
+            "critic_evidence": critic_evidence,
+            "draft": draft,
+            "summary_cover": cover,
+        }
+
+    def prefetch(self, project_id: str, chapter_id: str, scene: dict[str, Any], constraints: dict[str, Any] | None = None) -> dict[str, Any]:
+        """Warm the component cache for a scene that is likely to be written next.
+
+        Nothing is returned to the caller besides the cache report: a later build_manifest reuses the
+        components only if their fingerprints still match, so stale prefetches are discarded for free.
+        """
+        proj = self.store.read_yaml(project_id, "project.yaml")
+        bm = BudgetManager.from_project(proj, (constraints or {}).get("max_tokens"))
+        report: dict[str, Any] = {"reused": [], "built_ms": {}}
+        self._load_components(project_id, chapter_id, scene, bm.caps["max_items_per_bucket"], report)
+        return report
+
+    def build_manifest(self, project_id: str, chapter_id: str, scene: dict[str, Any], constraints: dict[str, Any] | None = None, technique_data: dict[str, Any] | None = None, llm_profile: dict[str, Any] | None = None) -> dict[str, Any]:
+        constraints = constraints or {}
+        count_tokens = self.tokenizers.counter(llm_profile)
+        proj = self.store.read_yaml(project_id, "project.yaml")
+        bm = BudgetManager.from_project(proj, constraints.get("max_tokens"))
+        limits = bm.bucket_limits()
+
+        cache_report: dict[str, Any] = {"reused": [], "built_ms": {}}
+        comp = self._load_components(project_id, chapter_id, scene, bm.caps["max_items_per_bucket"], cache_report)
+        style, outline, cards = comp["style"], comp["outline"], comp["cards"]
+        canon_facts, canon_issues, chapter_meta = comp["canon_facts"], comp["canon_issues"], comp["chapter_meta"]
+        writer_evidence, critic_evidence = comp["writer_evidence"], list(comp["critic_evidence"])
+        query_text = comp["query_text"]
+
+        guide = style.get("payload", {}).get("style_guide", {})
+        locks = style.get("payload", {}).get("locks", {})
+        policy = style.get("payload", {}).get("injection_policy", {"max_examples": 4, "max_chars_per_example": 800})
 
-        world_facts = [e for e in writer_evidence if e.get("kb_id") == "kb_world"][:8]
-        style_examples = [e for e in writer_evidence if e.get("kb_id") == "kb_style"][: int(policy.get("max_examples", bm.caps["max_examples_style"]))]
-        for ex in style_examples:
-            ex["text"] = ex["text"][: int(policy.get("max_chars_per_example", 800))]
+        max_chars = int(policy.get("max_chars_per_example", 800))
+        style_examples = [{**e, "text": e["text"][:max_chars]} for e in writer_evidence if e.get("kb_id") == "kb_style"][: int(policy.get("max_examples", bm.caps["max_examples_style"]))]
+        trimmed_style = {e["chunk_id"]: e for e in style_examples}
+        writer_evidence = [trimmed_style.get(e["chunk_id"], e) if e.get("kb_id") == "kb_style" else e for e in writer_evidence]
 
-        evidence = writer_evidence[:12]
-        citation_map = {e["chunk_id"]: e["source"] for e in evidence}
         dropped_items: list[str] = []
         compression_steps: list[str] = []
 
@@ -94,28 +195,26 @@ class ContextEngine:
             "included_cards": cards,
             "included_canon": {"facts": canon_facts, "issues": canon_issues},
             "included_evidence_chunks": {"style_examples": style_examples, "draft_summaries": chapter_meta.get("scene_summaries", [])},
-            "evidence": evidence,
-            "world_facts": world_facts,
-            "citation_map": citation_map,
+            "evidence": [],
+            "world_facts": [],
+            "citation_map": {},
             "critic_evidence": critic_evidence,
             "dropped_items": dropped_items,
             "compression_steps": compression_steps,
         }
 
-        usage = {
-            "system_rules": approx_tokens(str(fixed_blocks)),
-            "cards": approx_tokens(str(cards)),
-            "canon": approx_tokens(str(canon_facts) + str(canon_issues)),
-            "summaries": approx_tokens(str(chapter_meta.get("scene_summaries", []))),
-            "current_draft": approx_tokens(self.store.read_md(project_id, f"drafts/{chapter_id}.md")),
-            "world": approx_tokens(str(world_facts)),
-            "output_reserve": limits.get("output_reserve", 0),
-        }
-
+        ledger = TokenLedger(count_tokens, list(limits))
+        for key, block in fixed_blocks.items():
+            ledger.add("system_rules", key, block)
+        ledger.add_many("cards", "card", cards)
+        ledger.add_many("canon", "fact", canon_facts)
+        ledger.add_many("canon", "issue", canon_issues)
+        ledger.add_many("summaries", "scene_summary", chapter_meta.get("scene_summaries", []))
+        ledger.add("current_draft", "draft", comp["draft"])
+        ledger.set("output_reserve", "reserve", limits.get("output_reserve", 0))
 
         if "technique_brief" in fixed_blocks:
-            brief_usage = approx_tokens(str(fixed_blocks.get("technique_brief", "")))
-            if usage["system_rules"] > limits["system_rules"] and brief_usage > 0:
+            if ledger.total("system_rules") > limits["system_rules"] and ledger.get("system_rules", "technique_brief") > 0:
                 compression_steps.append("trim_technique_brief_examples")
                 brief = str(fixed_blocks.get("technique_brief", ""))
                 keep = []
@@ -124,28 +223,76 @@ class ContextEngine:
                         continue
                     keep.append(line)
                 fixed_blocks["technique_brief"] = "\n".join(keep)[:800]
-                usage["system_rules"] = approx_tokens(str(fixed_blocks))
+                ledger.add("system_rules", "technique_brief", fixed_blocks["technique_brief"])
 
-        if usage["cards"] > limits["cards"]:
+        if ledger.total("cards") > limits["cards"]:
             compression_steps.append("trim_cards_fields")
             trimmed_cards = []
             for c in cards:
                 p = c.get("payload", {})
                 trimmed_cards.append({"id": c.get("id"), "type": c.get("type"), "payload": {"identity": p.get("identity"), "voice": p.get("voice"), "boundaries": p.get("boundaries")}})
             manifest["included_cards"] = trimmed_cards
-            usage["cards"] = approx_tokens(str(trimmed_cards))
+            ledger.add_many("cards", "card", trimmed_cards)
 
-        if usage["current_draft"] + usage["canon"] > limits["current_draft"] + limits["canon"]:
+        if ledger.total("current_draft") + ledger.total("canon") > limits["current_draft"] + limits["canon"]:
             compression_steps.append("prefer_manuscript_summary")
-            man = [e for e in manifest["evidence"] if e.get("kb_id") == "kb_manuscript"][:2]
-            docs = [e for e in manifest["evidence"] if e.get("kb_id") == "kb_docs"][:1]
-            manifest["evidence"] = man + docs
-            manifest["citation_map"] = {e["chunk_id"]: e["source"] for e in manifest["evidence"]}
             manifest["included_evidence_chunks"]["draft_summaries"] = [{"chapter_summary": chapter_meta.get("chapter_summary", "")[:200]}]
+            ledger.remove_prefix("summaries", "scene_summary")
+            ledger.add_many("summaries", "chapter_summary", manifest["included_evidence_chunks"]["draft_summaries"])
+
+        book_summaries = []
+        for node in comp["summary_cover"]:
+            tokens = ledger.measure(node["summary"])
+            if ledger.total("summaries") + tokens > limits["summaries"]:
+                dropped_items.append(f"summary:{node['level']}:{node['id']}")
+                continue
+            ledger.set("summaries", f"pyramid:{node['id']}", tokens)
+            book_summaries.append(node)
+        manifest["included_evidence_chunks"]["book_summaries"] = book_summaries
 
-        if approx_tokens(str(style_examples)) > limits["summaries"]:
+        capacities = {bucket: limits[bucket] - ledger.total(bucket) for bucket in ("current_draft", "canon", "world", "summaries")}
+        value_key = "score"
+        if bm.mmr_lambda < 1.0:
+            writer_evidence = mmr_rerank(writer_evidence, bm.mmr_lambda, _tokenize)
+            value_key = "mmr_score"
+            compression_steps.append(f"mmr_rerank:lambda={bm.mmr_lambda}")
+        writer_evidence, compress_steps = compress_to_fit(writer_evidence, capacities, EVIDENCE_MAX_ITEMS, query_text, count_tokens, _tokenize)
+        compression_steps.extend(compress_steps)
+        packed = pack_evidence(writer_evidence, capacities, EVIDENCE_MAX_ITEMS, count_tokens, value_key)
+        manifest["evidence"] = packed["selected"]
+        # World facts are the packed kb_world evidence, so each chunk is charged to the world bucket once.
+        manifest["world_facts"] = [e for e in packed["selected"] if e.get("kb_id") == "kb_world"][:8]
+        manifest["citation_map"] = {e["chunk_id"]: e["source"] for e in packed["selected"]}
+        compression_steps.extend(packed["decisions"])
+        dropped_items.extend(f"evidence:{e['kb_id']}:{e['chunk_id']}" for e in packed["dropped"])
+        for e in packed["selected"]:
+            ledger.set(EVIDENCE_BUCKETS.get(e["kb_id"], "current_draft"), f"evidence:{e['kb_id']}:{e['chunk_id']}", e["tokens"])
+
+        if sum(ledger.measure(ex) for ex in style_examples) > limits["summaries"]:
             dropped_items.append("style_examples")
             manifest["included_evidence_chunks"]["style_examples"] = []
 
-        manifest["budget"] = bm.build_report(usage, dropped_items)
+        manifest["cache"] = cache_report
+        manifest["budget"] = bm.build_report(ledger.usage(), dropped_items, self.tokenizers.describe(llm_profile))
         return manifest
+
+    def _critic_evidence(self, project_id: str, query_text: str, top_k: int, names: list[str]) -> list[dict[str, Any]]:
+        critic_evidence = self.kb.query_multi(
+            project_id,
+            query_text + " 冲突 设定 矛盾",
+            top_k,
+            [
+                {"kb_id": "kb_manuscript", "weight": 1.4},
+                {"kb_id": "kb_docs", "weight": 1.0},
+                {"kb_id": "kb_world", "weight": 1.2},
+                {"kb_id": "kb_style", "weight": 0.2},
+            ],
+            filters={},
+        )
+        critic_seen = {e["chunk_id"] for e in critic_evidence}
+        for name in names:
+            for hit in self.kb.find_phrase(project_id, "kb_manuscript", name, top_k=2):
+                if hit["chunk_id"] not in critic_seen:
+                    critic_seen.add(hit["chunk_id"])
+                    critic_evidence.append({**hit, "score": 0.0, "match": "exact_name", "entity": name})
+        return critic_evidence
@@ -1,13 +1,23 @@
 from __future__ import annotations
 
+import json
 import math
+import os
+import random
 import re
+import shutil
+import threading
+import time
+import atexit
 import uuid
+import zlib
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, Iterator
 
-from storage.fs_store import FSStore
+from storage.fs_store import FSStore, now_iso
+from services.tokenizer import default_registry
 
 INJECTION_PATTERNS = [
     re.compile(r"ignore\s+previous\s+instructions", re.I),
@@ -22,6 +32,30 @@ STAR_WEIGHT_COEFF = 0.15
 IMPORTANCE_WEIGHT_COEFF = 0.10
 DEFAULT_IMPORTANCE = 3
 
+KEEP_GENERATIONS = 2
+
+POSITIONAL_KBS = {"kb_manuscript", "kb_world"}
+PHRASE_RE = re.compile(r'"([^"]+)"|“([^”]+)”|「([^」]+)」')
+PHRASE_WEIGHT = 1.0
+PROXIMITY_WEIGHT = 0.3
+PROXIMITY_WINDOW = 8
+
+MINHASH_PERMS = 32
+MINHASH_BANDS = 8
+MINHASH_SHINGLE = 3
+NEAR_DUP_THRESHOLD = 0.8
+_MINHASH_PRIME = (1 << 61) - 1
+_MINHASH_RNG = random.Random(20240601)
+_MINHASH_PARAMS = [(_MINHASH_RNG.randrange(1, _MINHASH_PRIME), _MINHASH_RNG.randrange(0, _MINHASH_PRIME)) for _ in range(MINHASH_PERMS)]
+
+CHUNK_TARGET_CHARS = 800
+CHAPTER_CHUNK_TARGET_CHARS = 500
+PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+SENTENCE_RE = re.compile(r"[^。！？!?\n]+[。！？!?]?|[。！？!?]")
+
+WORLD_CARD_PATTERNS = ("world_rule_*.yaml", "lore_*.yaml", "worldview_*.yaml")
+WORLD_FACT_SCOPES = {"world_state", "world_event", "world_rule"}
+
 
 def sanitize_for_index(text: str) -> tuple[str, list[str]]:
     warnings: list[str] = []
@@ -33,44 +67,67 @@ def sanitize_for_index(text: str) -> tuple[str, list[str]]:
     return cleaned.strip(), warnings
 
 
-def split_chunks(text: str) -> list[str]:
-    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
-    chunks: list[str] = []
-
-    def flush_buffer(buf: str) -> str:
-        while len(buf) > 800:
-            chunks.append(buf[:800].strip())
-            buf = buf[800:]
-        return buf
-
-    for p in paragraphs:
-        if len(p) <= 800:
-            chunks.append(p)
+def _iter_paragraphs(text: str) -> Iterator[str]:
+    pos = 0
+    for m in PARAGRAPH_SPLIT_RE.finditer(text):
+        p = text[pos:m.start()].strip()
+        if p:
+            yield p
+        pos = m.end()
+    tail = text[pos:].strip()
+    if tail:
+        yield tail
+
+
+def iter_chunks(text: str, target: int = CHUNK_TARGET_CHARS, overlap: int = 0) -> Iterator[str]:
+    """Stream chunks of at most ``target`` chars; a list buffer with a running length keeps this linear."""
+    target = max(1, int(target))
+    overlap = max(0, min(int(overlap), target // 2))
+    step = target - overlap
+    for p in _iter_paragraphs(text):
+        if len(p) <= target:
+            yield p
             continue
 
-        pieces = re.split(r"(?<=[。！？!?])|\n", p)
-        buf = ""
-        for s in pieces:
-            s = s.strip()
-            if not s:
+        buf: list[str] = []
+        buf_len = 0
+        fresh = False
+        for m in SENTENCE_RE.finditer(p):
+            piece = m.group(0).strip()
+            if not piece:
                 continue
-            if len(buf) + len(s) <= 800:
-                buf += s
+            if buf_len + len(piece) <= target:
+                buf.append(piece)
+                buf_len += len(piece)
+                fresh = True
                 continue
 
-            if buf:
-                chunks.append(buf.strip())
-                buf = ""
+            if fresh:
+                chunk = "".join(buf).strip()
+                yield chunk
+                carry = chunk[-overlap:] if overlap else ""
+                buf, buf_len, fresh = ([carry] if carry else []), len(carry), False
+            if buf_len + len(piece) <= target:
+                buf.append(piece)
+                buf_len += len(piece)
+                fresh = True
+                continue
 
-            if len(s) <= 800:
-                buf = s
-            else:
-                buf = flush_buffer(s)
+            # Oversized sentence: hard-split in fixed steps instead of re-slicing the remainder.
+            pos = 0
+            while len(piece) - pos > target:
+                chunk = piece[pos:pos + target].strip()
+                if chunk:
+                    yield chunk
+                pos += step
+            rest = piece[pos:]
+            buf, buf_len, fresh = [rest], len(rest), True
+        if fresh and "".join(buf).strip():
+            yield "".join(buf).strip()
 
-        if buf.strip():
-            chunks.append(buf.strip())
 
-    return chunks or [text[:800]]
+def split_chunks(text: str, target: int = CHUNK_TARGET_CHARS, overlap: int = 0) -> list[str]:
+    return list(iter_chunks(text, target, overlap)) or [text[:target]]
 
 
 def text_features(text: str) -> dict[str, Any]:
@@ -97,20 +154,295 @@ def _kb_rel(kb_id: str, name: str) -> str:
     return f"meta/kb/{kb_id}/{name}"
 
 
-def _tokenize(text: str) -> list[str]:
-    raw = [t for t in re.findall(r"[一-龥A-Za-z0-9]{2,}", text.lower())]
-    out: list[str] = []
-    for tok in raw:
+def _token_runs(text: str) -> list[list[str]]:
+    # One list of terms per raw token; punctuation, spaces and single characters separate runs.
+    runs: list[list[str]] = []
+    for tok in re.findall(r"[一-龥A-Za-z0-9]{2,}", text.lower()):
         if re.fullmatch(r"[一-龥]+", tok):
-            out.extend([tok[i:i + 2] for i in range(max(1, len(tok) - 1))])
+            runs.append([tok[i:i + 2] for i in range(max(1, len(tok) - 1))])
         else:
-            out.append(tok)
+            runs.append([tok])
+    return runs
+
+
+def _tokenize(text: str) -> list[str]:
+    return [t for run in _token_runs(text) for t in run]
+
+
+def _token_positions(text: str) -> Iterator[tuple[int, str]]:
+    # Runs are one position apart, so bigrams from different sentences or words are never adjacent.
+    pos = 0
+    for run in _token_runs(text):
+        for term in run:
+            yield pos, term
+            pos += 1
+        pos += 1
+
+
+def minhash_signature(text: str) -> list[int]:
+    norm = re.sub(r"\s+", "", text.lower())
+    shingles = {norm[i:i + MINHASH_SHINGLE] for i in range(max(1, len(norm) - MINHASH_SHINGLE + 1))}
+    hashes = [zlib.crc32(sh.encode("utf-8")) for sh in shingles]
+    return [min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in _MINHASH_PARAMS]
+
+
+def minhash_similarity(a: list[int], b: list[int]) -> float:
+    if not a or not b or len(a) != len(b):
+        return 0.0
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+def _lsh_keys(sig: list[int]) -> list[str]:
+    rows = max(1, len(sig) // MINHASH_BANDS)
+    return [f"{i}:{zlib.crc32(repr(sig[i * rows:(i + 1) * rows]).encode())}" for i in range(MINHASH_BANDS)]
+
+
+class NearDupIndex:
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD):
+        self.threshold = threshold
+        self._bands: dict[str, list[int]] = defaultdict(list)
+        self._sigs: list[list[int]] = []
+        self._ids: list[str] = []
+
+    def match(self, sig: list[int]) -> str | None:
+        seen: set[int] = set()
+        for key in _lsh_keys(sig):
+            for i in self._bands.get(key, []):
+                if i in seen:
+                    continue
+                seen.add(i)
+                if minhash_similarity(sig, self._sigs[i]) >= self.threshold:
+                    return self._ids[i]
+        return None
+
+    def add(self, item_id: str, sig: list[int]) -> None:
+        idx = len(self._sigs)
+        self._sigs.append(sig)
+        self._ids.append(item_id)
+        for key in _lsh_keys(sig):
+            self._bands[key].append(idx)
+
+
+def _approx_tokens(text: str) -> int:
+    return default_registry.count(text)
+
+
+def _build_bm25(chunks: list[dict[str, Any]], positional: bool = False) -> dict[str, Any]:
+    doc_freq: dict[str, int] = defaultdict(int)
+    postings: dict[str, dict[str, int]] = {}
+    positions: dict[str, dict[str, list[int]]] = defaultdict(dict)
+    doc_len = {}
+    for c in chunks:
+        cid = c["chunk_id"]
+        text = c.get("cleaned_text", c.get("text", ""))
+        toks = _tokenize(text)
+        counts = Counter(toks)
+        doc_len[cid] = len(toks)
+        postings[cid] = dict(counts)
+        for term in counts.keys():
+            doc_freq[term] += 1
+        if positional:
+            for pos, term in _token_positions(text):
+                positions[term].setdefault(cid, []).append(pos)
+    avg_len = (sum(doc_len.values()) / len(doc_len)) if doc_len else 0
+    out = {"doc_freq": doc_freq, "postings": postings, "doc_len": doc_len, "avg_len": avg_len, "n_docs": len(doc_len)}
+    if positional:
+        out["positions"] = positions
     return out
 
 
+def _parse_phrases(query: str) -> list[str]:
+    return [next(g for g in m.groups() if g) for m in PHRASE_RE.finditer(query)]
+
+
+def _phrase_hits(positions: dict[str, dict[str, list[int]]], terms: list[str], candidates: set[str] | None = None) -> dict[str, int]:
+    if not terms:
+        return {}
+    docs = set(positions.get(terms[0], {}))
+    for t in terms[1:]:
+        docs &= set(positions.get(t, {}))
+    if candidates is not None:
+        docs &= candidates
+    hits: dict[str, int] = {}
+    for cid in docs:
+        rest = [set(positions[t][cid]) for t in terms[1:]]
+        n = sum(1 for p in positions[terms[0]][cid] if all((p + i + 1) in r for i, r in enumerate(rest)))
+        if n:
+            hits[cid] = n
+    return hits
+
+
+def _min_distance(a: list[int], b: list[int]) -> int:
+    i = j = 0
+    best = 1 << 30
+    while i < len(a) and j < len(b):
+        best = min(best, abs(a[i] - b[j]))
+        if a[i] < b[j]:
+            i += 1
+        else:
+            j += 1
+    return best
+
+
+def _proximity_bonus(positions: dict[str, dict[str, list[int]]], cid: str, q_terms: list[str]) -> float:
+    bonus = 0.0
+    for a, b in zip(q_terms, q_terms[1:]):
+        if a == b:
+            continue
+        pa = positions.get(a, {}).get(cid)
+        pb = positions.get(b, {}).get(cid)
+        if not pa or not pb:
+            continue
+        d = _min_distance(pa, pb)
+        if 0 < d <= PROXIMITY_WINDOW:
+            bonus += PROXIMITY_WEIGHT / d
+    return bonus
+
+
+def _chapter_row(chapter_id: str, idx: int, chunk_text: str, start: int, end: int) -> dict[str, Any]:
+    return {
+        "chunk_id": f"{chapter_id}_c{idx:04d}",
+        "kb_id": "kb_manuscript",
+        "asset_id": None,
+        "ordinal": idx,
+        "text": chunk_text,
+        "cleaned_text": chunk_text,
+        "features": text_features(chunk_text),
+        "minhash": minhash_signature(chunk_text),
+        "source": {
+            "path": f"drafts/{chapter_id}.md",
+            "kind": "manuscript",
+            "chapter_id": chapter_id,
+            "start_line": start,
+            "end_line": end,
+            "paragraph_index": idx,
+        },
+    }
+
+
+def _text_span(buf: list[str], start: int) -> tuple[int, int]:
+    # Line span of the stripped chunk: skip the blank lines that .strip() drops at either end.
+    filled = [k for k, line in enumerate(buf) if line.strip()]
+    return start + filled[0], start + filled[-1]
+
+
+def iter_chapter_rows(chapter_id: str, text: str, target: int = CHAPTER_CHUNK_TARGET_CHARS, overlap: int = 0) -> Iterator[dict[str, Any]]:
+    target = max(1, int(target))
+    overlap = max(0, min(int(overlap), target // 2))
+    lines = text.splitlines()
+    start = 1
+    buf: list[str] = []
+    buf_len = 0
+    n_carried = 0
+    idx = 0
+    for i, line in enumerate(lines, start=1):
+        if len(line) > target:
+            # A single oversized line (e.g. a paragraph without line breaks) is windowed on its own.
+            # Lines carried over as overlap were already emitted, so they alone are not a chunk.
+            if len(buf) > n_carried and "\n".join(buf).strip():
+                yield _chapter_row(chapter_id, idx, "\n".join(buf).strip(), *_text_span(buf, start))
+                idx += 1
+            pos = 0
+            while len(line) - pos > target:
+                piece = line[pos:pos + target].strip()
+                if piece:
+                    yield _chapter_row(chapter_id, idx, piece, i, i)
+                    idx += 1
+                pos += target - overlap
+            line = line[pos:]
+            buf, buf_len, start, n_carried = [], 0, i, 0
+        buf_len += len(line) + (1 if buf else 0)
+        buf.append(line)
+        if buf_len < target and i != len(lines):
+            continue
+        chunk_text = "\n".join(buf).strip()
+        if chunk_text:
+            yield _chapter_row(chapter_id, idx, chunk_text, *_text_span(buf, start))
+            idx += 1
+        # Carry trailing whole lines (up to ``overlap`` chars) into the next chunk.
+        carried: list[str] = []
+        carried_len = 0
+        if overlap:
+            for prev in reversed(buf[1:]):
+                if carried_len + len(prev) + 1 > overlap:
+                    break
+                carried.insert(0, prev)
+                carried_len += len(prev) + 1
+        buf = carried
+        buf_len = max(0, carried_len - 1)
+        n_carried = len(carried)
+        start = i + 1 - len(carried)
+
+
+def _bm25_for_file(path: str, positional: bool = False) -> dict[str, Any]:
+    # Process-pool entry point: workers load the chunks themselves, so only the index crosses back.
+    fp = Path(path)
+    lines = fp.read_text(encoding="utf-8").splitlines() if fp.exists() else []
+    return _build_bm25([json.loads(line) for line in lines if line.strip()], positional)
+
+
+_POOLS: dict[int, ProcessPoolExecutor] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    # Worker processes are started once per size and reused by every parallel reindex.
+    with _POOLS_LOCK:
+        if workers not in _POOLS:
+            _POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+        return _POOLS[workers]
+
+
+@atexit.register
+def _shutdown_pools() -> None:
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _POOLS.clear()
+
+
+def _rows_for_chapter_file(chapter_id: str, path: str, target: int = CHAPTER_CHUNK_TARGET_CHARS, overlap: int = 0) -> list[dict[str, Any]]:
+    # Process-pool entry point: read in the worker so only rows cross the process boundary.
+    return list(iter_chapter_rows(chapter_id, Path(path).read_text(encoding="utf-8"), target, overlap))
+
+
+def _elapsed_ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 2)
+
+
 class KBService:
     def __init__(self, store: FSStore):
         self.store = store
+        self._snapshots: dict[tuple[str, str], dict[str, Any]] = {}
+        self._publish_locks: dict[tuple[str, str], threading.Lock] = defaultdict(threading.Lock)
+        self._dedup_stats: dict[str, Counter] = defaultdict(Counter)
+
+    def _kb_settings(self, project_id: str) -> dict[str, Any]:
+        return self.store.read_yaml(project_id, "project.yaml").get("kb_settings", {}) or {}
+
+    def dedup_stats(self, project_id: str) -> dict[str, int]:
+        stats = self._dedup_stats[project_id]
+        return {k: int(stats.get(k, 0)) for k in ("index_dropped_chunks", "index_saved_tokens", "query_collapsed_chunks", "query_saved_tokens")}
+
+    def _dedup_rows(self, project_id: str, rows: Iterable[dict[str, Any]], against_kb: str | None = None) -> Iterable[dict[str, Any]]:
+        settings = self._kb_settings(project_id)
+        if not settings.get("dedup_on_index", False):
+            return rows
+        index = NearDupIndex(float(settings.get("near_dup_threshold", NEAR_DUP_THRESHOLD)))
+        existing = self.store.read_jsonl(project_id, _kb_rel(against_kb, "chunks.jsonl")) if against_kb else []
+        for r in existing:
+            index.add(r["chunk_id"], r.get("minhash") or minhash_signature(r.get("cleaned_text", r.get("text", ""))))
+        kept = []
+        stats = self._dedup_stats[project_id]
+        for r in rows:
+            sig = r.get("minhash") or minhash_signature(r.get("cleaned_text", r.get("text", "")))
+            if index.match(sig):
+                stats["index_dropped_chunks"] += 1
+                stats["index_saved_tokens"] += _approx_tokens(r.get("text", ""))
+                continue
+            index.add(r["chunk_id"], sig)
+            kept.append(r)
+        return kept
 
     def upload_text(self, project_id: str, kind: str, filename: str, raw: str) -> dict[str, Any]:
         asset_id = f"{kind}_{uuid.uuid4().hex[:10]}"
@@ -122,144 +454,254 @@ class KBService:
             kb_id = "kb_docs"
         self.store.write_md(project_id, rel, raw)
         cleaned, warnings = sanitize_for_index(raw)
-        rows = self._rows_for_text(kb_id, asset_id, cleaned, {"path": rel, "kind": kind, "asset_id": asset_id, "filename": filename})
+        rows = self._rows_for_text(kb_id, asset_id, cleaned, {"path": rel, "kind": kind, "asset_id": asset_id, "filename": filename}, project_id)
+        rows = self._dedup_rows(project_id, rows, against_kb=kb_id)
         self._append_rows(project_id, kb_id, rows)
         self.reindex(project_id, kb_id)
         return {"asset_id": asset_id, "saved_path": rel, "warnings": warnings}
 
-    def _rows_for_text(self, kb_id: str, ref_id: str, text: str, source_base: dict[str, Any]) -> list[dict[str, Any]]:
-        chunks = split_chunks(text)
-        rows = []
-        for i, chunk in enumerate(chunks):
-            src = {**source_base, "paragraph_index": i}
-            rows.append({
-                "chunk_id": f"{ref_id}_c{i:04d}",
-                "kb_id": kb_id,
-                "asset_id": source_base.get("asset_id"),
-                "ordinal": i,
-                "text": chunk,
-                "cleaned_text": chunk,
-                "features": text_features(chunk),
-                "source": src,
-            })
-        return rows
-
-    def _append_rows(self, project_id: str, kb_id: str, rows: list[dict[str, Any]]) -> None:
+    def _rows_for_text(self, kb_id: str, ref_id: str, text: str, source_base: dict[str, Any], project_id: str | None = None) -> Iterator[dict[str, Any]]:
+        cfg = self._chunk_settings(project_id)
+        i = -1
+        for i, chunk in enumerate(iter_chunks(text, cfg["chunk_chars"], cfg["chunk_overlap"])):
+            yield self._text_row(kb_id, ref_id, i, chunk, source_base)
+        if i < 0:
+            yield self._text_row(kb_id, ref_id, 0, text[: cfg["chunk_chars"]], source_base)
+
+    def _text_row(self, kb_id: str, ref_id: str, i: int, chunk: str, source_base: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "chunk_id": f"{ref_id}_c{i:04d}",
+            "kb_id": kb_id,
+            "asset_id": source_base.get("asset_id"),
+            "ordinal": i,
+            "text": chunk,
+            "cleaned_text": chunk,
+            "features": text_features(chunk),
+            "minhash": minhash_signature(chunk),
+            "source": {**source_base, "paragraph_index": i},
+        }
+
+    def _append_rows(self, project_id: str, kb_id: str, rows: Iterable[dict[str, Any]]) -> None:
         for r in rows:
             self.store.append_jsonl(project_id, _kb_rel(kb_id, "chunks.jsonl"), r)
 
-    def _build_bm25(self, chunks: list[dict[str, Any]]) -> dict[str, Any]:
-        doc_freq: dict[str, int] = defaultdict(int)
-        postings: dict[str, dict[str, int]] = {}
-        doc_len = {}
-        for c in chunks:
-            cid = c["chunk_id"]
-            toks = _tokenize(c.get("cleaned_text", c.get("text", "")))
-            counts = Counter(toks)
-            doc_len[cid] = len(toks)
-            postings[cid] = dict(counts)
-            for term in counts.keys():
-                doc_freq[term] += 1
-        avg_len = (sum(doc_len.values()) / len(doc_len)) if doc_len else 0
-        return {"doc_freq": doc_freq, "postings": postings, "doc_len": doc_len, "avg_len": avg_len, "n_docs": len(doc_len)}
+    def _build_bm25(self, chunks: list[dict[str, Any]], positional: bool = False) -> dict[str, Any]:
+        return _build_bm25(chunks, positional)
+
+    def _write_rows(self, project_id: str, kb_id: str, rows: Iterable[dict[str, Any]]) -> None:
+        self.store.write_jsonl(project_id, _kb_rel(kb_id, "chunks.jsonl"), rows)
 
     def _reindex_kb(self, project_id: str, kb_id: str) -> dict[str, Any]:
         chunks = self.store.read_jsonl(project_id, _kb_rel(kb_id, "chunks.jsonl"))
-        bm25 = self._build_bm25(chunks)
-        self.store.write_json(project_id, _kb_rel(kb_id, "bm25.json"), bm25)
-        return {"kb_id": kb_id, "chunks": len(chunks)}
-
-    def reindex(self, project_id: str, kb_id: str) -> dict[str, Any]:
+        bm25 = self._build_bm25(chunks, kb_id in POSITIONAL_KBS)
+        generation = self._publish(project_id, kb_id, chunks, bm25)
+        return {"kb_id": kb_id, "chunks": len(chunks), "generation": generation}
+
+    def _publish(self, project_id: str, kb_id: str, chunks: list[dict[str, Any]], bm25: dict[str, Any]) -> int:
+        # Build the next generation in a side directory, rename it into place, then flip the pointer.
+        # Readers keep serving the previous generation until the pointer changes.
+        with self._publish_locks[(project_id, kb_id)]:
+            pointer = self.store.read_json(project_id, _kb_rel(kb_id, "generation.json"))
+            generation = int(pointer.get("generation", 0)) + 1
+            gen_root = self.store._safe_path(project_id, _kb_rel(kb_id, "generations"))
+            gen_root.mkdir(parents=True, exist_ok=True)
+            staging = gen_root / f".building_{generation:06d}_{uuid.uuid4().hex[:6]}"
+            staging.mkdir()
+            ts = now_iso()
+            (staging / "chunks.jsonl").write_text("".join(json.dumps({**c, "ts": c.get("ts", ts)}, ensure_ascii=False) + "\n" for c in chunks), encoding="utf-8")
+            (staging / "bm25.json").write_text(json.dumps(bm25, ensure_ascii=False), encoding="utf-8")
+            final = gen_root / f"{generation:06d}"
+            if final.exists():
+                shutil.rmtree(final)
+            os.replace(staging, final)
+            self.store.write_json(project_id, _kb_rel(kb_id, "generation.json"), {"generation": generation, "path": f"generations/{final.name}", "chunks": len(chunks), "published_at": ts})
+            older = sorted(p for p in gen_root.iterdir() if p.is_dir() and not p.name.startswith(".") and p.name != final.name)
+            for old in older[: max(0, len(older) - (KEEP_GENERATIONS - 1))]:
+                shutil.rmtree(old, ignore_errors=True)
+        return generation
+
+    def index_snapshot(self, project_id: str, kb_id: str) -> dict[str, Any]:
+        pointer = self.store.read_json(project_id, _kb_rel(kb_id, "generation.json"))
+        key = (project_id, kb_id)
+        cached = self._snapshots.get(key)
+        if not pointer:
+            # Legacy layout (no published generation yet): read the flat files.
+            chunks = self.store.read_jsonl(project_id, _kb_rel(kb_id, "chunks.jsonl"))
+            return {"generation": 0, "chunks": chunks, "bm25": self.store.read_json(project_id, _kb_rel(kb_id, "bm25.json"))}
+        if cached and cached["generation"] == pointer.get("generation"):
+            return cached
+        rel = _kb_rel(kb_id, str(pointer.get("path", "")))
+        try:
+            snap = {
+                "generation": pointer.get("generation"),
+                "chunks": self.store.read_jsonl(project_id, f"{rel}/chunks.jsonl"),
+                "bm25": self.store.read_json(project_id, f"{rel}/bm25.json"),
+            }
+        except (OSError, ValueError):
+            if cached:
+                return cached
+            raise
+        self._snapshots[key] = snap
+        return snap
+
+    def reindex(self, project_id: str, kb_id: str, parallel: bool = False, workers: int | None = None) -> dict[str, Any]:
         if kb_id == "all":
+            if parallel:
+                return self.reindex_all_parallel(project_id, workers)
             self.reindex_manuscript(project_id)
             parts = [self._reindex_kb(project_id, x) for x in ["kb_style", "kb_docs", "kb_manuscript", "kb_world"]]
             return {"ok": True, "kb_id": "all", "parts": parts}
         if kb_id == "kb_manuscript":
             self.reindex_manuscript(project_id)
         if kb_id == "kb_world":
-            self.reindex_world(project_id)
+            return self.reindex_world(project_id)
         return {"ok": True, **self._reindex_kb(project_id, kb_id)}
 
-
-
-    def reindex_world(self, project_id: str) -> dict[str, Any]:
+    def reindex_all_parallel(self, project_id: str, workers: int | None = None) -> dict[str, Any]:
+        kb_order = ["kb_style", "kb_docs", "kb_manuscript", "kb_world"]
+        workers = max(1, int(workers or os.cpu_count() or 1))
+        timings: dict[str, float] = {}
+        t_all = time.perf_counter()
+        drafts_dir = self.store._safe_path(project_id, "drafts")
+        chapters = sorted(drafts_dir.glob("chapter_*.md"))
+        pool = None
+        if workers > 1:
+            try:
+                pool = _process_pool(workers)
+            except (OSError, NotImplementedError, ValueError):
+                pass
+        if pool is None:
+            # A single worker only adds process startup and IPC to the serial path, and sandboxes
+            # without working multiprocessing cannot start one at all.
+            t0 = time.perf_counter()
+            out = self.reindex(project_id, "all")
+            timings["total"] = _elapsed_ms(t0)
+            return {**out, "mode": "serial_fallback", "workers": 1, "timings_ms": timings}
+        t0 = time.perf_counter()
+        cfg = self._chunk_settings(project_id)
+        n = len(chapters)
+        per_chapter = pool.map(_rows_for_chapter_file, [md.stem for md in chapters], [str(md) for md in chapters], [cfg["manuscript_chunk_chars"]] * n, [cfg["manuscript_chunk_overlap"]] * n, chunksize=max(1, n // (workers * 4)))
+        rows = list(self._dedup_rows(project_id, [r for part in per_chapter for r in part]))
+        timings["chunk_manuscript"] = _elapsed_ms(t0)
+
+        t0 = time.perf_counter()
+        self._write_rows(project_id, "kb_manuscript", rows)
+        # Workers read chunks.jsonl themselves; the parent loads its copy for publishing meanwhile.
+        futures = {x: pool.submit(_bm25_for_file, str(self.store._safe_path(project_id, _kb_rel(x, "chunks.jsonl"))), x in POSITIONAL_KBS) for x in kb_order}
+        kb_chunks = {x: (rows if x == "kb_manuscript" else self.store.read_jsonl(project_id, _kb_rel(x, "chunks.jsonl"))) for x in kb_order}
+        bm25_by_kb = {x: f.result() for x, f in futures.items()}
+        timings["build_bm25"] = _elapsed_ms(t0)
+
+        t0 = time.perf_counter()
+        generations = {x: self._publish(project_id, x, kb_chunks[x], bm25_by_kb[x]) for x in kb_order}
+        timings["publish"] = _elapsed_ms(t0)
+        timings["total"] = _elapsed_ms(t_all)
+        parts = [{"kb_id": x, "chunks": len(kb_chunks[x]), "generation": generations[x]} for x in kb_order]
+        return {"ok": True, "kb_id": "all", "parts": parts, "mode": "parallel", "workers": workers, "chapters": len(chapters), "timings_ms": timings}
+
+    def _world_card_row(self, project_id: str, name: str) -> dict[str, Any]:
+        data = self.store.read_yaml(project_id, f"cards/{name}")
+        text = str(data.get("payload", {}))
+        stem = Path(name).stem
+        return {"chunk_id": f"{stem}_c0000", "kb_id": "kb_world", "asset_id": None, "ordinal": 0, "text": text, "cleaned_text": text, "features": text_features(text), "source": {"path": f"cards/{name}", "kind": "world_card", "card_id": data.get("id", stem), "field_path": "payload"}}
+
+    def _world_fact_rows(self, facts: list[dict[str, Any]], start: int) -> list[dict[str, Any]]:
         rows: list[dict[str, Any]] = []
-        cards_dir = self.store._safe_path(project_id, "cards")
-        for y in sorted(cards_dir.glob("world_rule_*.yaml")) + sorted(cards_dir.glob("lore_*.yaml")) + sorted(cards_dir.glob("worldview_*.yaml")):
-            data = self.store.read_yaml(project_id, f"cards/{y.name}")
-            text = str(data.get("payload", {}))
-            chunk_id = f"{y.stem}_c0000"
-            rows.append({"chunk_id": chunk_id, "kb_id": "kb_world", "asset_id": None, "ordinal": 0, "text": text, "cleaned_text": text, "features": text_features(text), "source": {"path": f"cards/{y.name}", "kind": "world_card", "card_id": data.get("id", y.stem), "field_path": "payload"}})
-        for fact in self.store.read_jsonl(project_id, "canon/facts.jsonl"):
-            if fact.get("scope") not in {"world_state", "world_event", "world_rule"}:
+        for fact in facts:
+            if fact.get("scope") not in WORLD_FACT_SCOPES:
                 continue
             txt = str(fact.get("value") or fact.get("fact") or "")
             if not txt:
                 continue
-            cid = fact.get("id") or f"worldfact_{len(rows):04d}"
-            rows.append({"chunk_id": f"{cid}_c0000", "kb_id": "kb_world", "asset_id": None, "ordinal": len(rows), "text": txt, "cleaned_text": txt, "features": text_features(txt), "source": {"path": "canon/facts.jsonl", "kind": "world_fact", "fact_id": fact.get("id", cid), "field_path": "value"}})
-        self.store.write_md(project_id, _kb_rel("kb_world", "chunks.jsonl"), "")
-        for r in rows:
-            self.store.append_jsonl(project_id, _kb_rel("kb_world", "chunks.jsonl"), r)
-        return {"ok": True, "kb_id": "kb_world", "chunks": len(rows)}
+            n = start + len(rows)
+            cid = fact.get("id") or f"worldfact_{n:04d}"
+            rows.append({"chunk_id": f"{cid}_c0000", "kb_id": "kb_world", "asset_id": None, "ordinal": n, "text": txt, "cleaned_text": txt, "features": text_features(txt), "source": {"path": "canon/facts.jsonl", "kind": "world_fact", "fact_id": fact.get("id", cid), "field_path": "value"}})
+        return rows
+
+    def reindex_world(self, project_id: str, force: bool = False) -> dict[str, Any]:
+        """Incremental rebuild driven by card mtimes and the facts log offset; a no-op costs one stat per source."""
+        marks_rel = _kb_rel("kb_world", "watermarks.json")
+        marks = {} if force else self.store.read_json(project_id, marks_rel)
+        cards_dir = self.store._safe_path(project_id, "cards")
+        facts_path = self.store._safe_path(project_id, "canon/facts.jsonl")
+
+        dir_mtime = cards_dir.stat().st_mtime_ns if cards_dir.exists() else 0
+        if marks and marks.get("cards_dir_mtime") == dir_mtime:
+            names = list(marks.get("cards", {}).keys())
+        else:
+            names = [y.name for pattern in WORLD_CARD_PATTERNS for y in sorted(cards_dir.glob(pattern))]
+        card_marks: dict[str, list[int]] = {}
+        for name in names:
+            try:
+                st = (cards_dir / name).stat()
+            except FileNotFoundError:
+                continue
+            card_marks[name] = [st.st_mtime_ns, st.st_size]
+        facts_size = facts_path.stat().st_size if facts_path.exists() else 0
+        facts_offset = int(marks.get("facts_offset", 0))
+
+        if marks and card_marks == marks.get("cards") and facts_size == facts_offset:
+            return {"ok": True, "kb_id": "kb_world", "chunks": int(marks.get("chunks", 0)), "unchanged": True}
+
+        full = not marks or facts_size < facts_offset
+        if full:
+            card_rows = [self._world_card_row(project_id, name) for name in card_marks]
+            facts, facts_offset = self.store.read_jsonl_from(project_id, "canon/facts.jsonl", 0)
+            fact_rows = self._world_fact_rows(facts, len(card_rows))
+            changed_cards = list(card_marks)
+        else:
+            existing = self.store.read_jsonl(project_id, _kb_rel("kb_world", "chunks.jsonl"))
+            old_marks = marks.get("cards", {})
+            changed_cards = [name for name, m in card_marks.items() if old_marks.get(name) != m]
+            by_path = {r.get("source", {}).get("path"): r for r in existing if r.get("source", {}).get("kind") == "world_card"}
+            card_rows = [self._world_card_row(project_id, name) if name in changed_cards or f"cards/{name}" not in by_path else by_path[f"cards/{name}"] for name in card_marks]
+            fact_rows = [r for r in existing if r.get("source", {}).get("kind") == "world_fact"]
+            new_facts, facts_offset = self.store.read_jsonl_from(project_id, "canon/facts.jsonl", facts_offset)
+            new_rows = self._world_fact_rows(new_facts, len(card_rows) + len(fact_rows))
+            if not changed_cards and not new_rows and len(card_rows) == int(marks.get("chunks", 0)) - len(fact_rows):
+                # Only out-of-scope facts were appended: advance the watermark without publishing a new generation.
+                self.store.write_json(project_id, marks_rel, {**marks, "cards_dir_mtime": dir_mtime, "cards": card_marks, "facts_offset": facts_offset})
+                return {"ok": True, "kb_id": "kb_world", "chunks": int(marks.get("chunks", 0)), "unchanged": True}
+            fact_rows.extend(new_rows)
+
+        rows = card_rows + fact_rows
+        self._write_rows(project_id, "kb_world", rows)
+        self._reindex_kb(project_id, "kb_world")
+        self.store.write_json(project_id, marks_rel, {"cards_dir_mtime": dir_mtime, "cards": card_marks, "facts_offset": facts_offset, "chunks": len(rows)})
+        return {"ok": True, "kb_id": "kb_world", "chunks": len(rows), "full_rebuild": full, "changed_cards": changed_cards}
+
     def reindex_manuscript(self, project_id: str) -> dict[str, Any]:
         drafts_dir = self.store._safe_path(project_id, "drafts")
         rows: list[dict[str, Any]] = []
         for md in sorted(drafts_dir.glob("chapter_*.md")):
             chapter_id = md.stem
             text = md.read_text(encoding="utf-8")
-            rows.extend(self._rows_for_chapter(chapter_id, text))
-        self.store.write_md(project_id, _kb_rel("kb_manuscript", "chunks.jsonl"), "")
-        for r in rows:
-            self.store.append_jsonl(project_id, _kb_rel("kb_manuscript", "chunks.jsonl"), r)
+            rows.extend(self._rows_for_chapter(chapter_id, text, project_id))
+        rows = list(self._dedup_rows(project_id, rows))
+        self._write_rows(project_id, "kb_manuscript", rows)
         return {"ok": True, "kb_id": "kb_manuscript", "chunks": len(rows)}
 
     def reindex_manuscript_chapter(self, project_id: str, chapter_id: str) -> None:
         text = self.store.read_md(project_id, f"drafts/{chapter_id}.md")
-        chunks_path = self.store._safe_path(project_id, _kb_rel("kb_manuscript", "chunks.jsonl"))
         existing = self.store.read_jsonl(project_id, _kb_rel("kb_manuscript", "chunks.jsonl"))
         kept = [r for r in existing if r.get("source", {}).get("chapter_id") != chapter_id]
-        chunks_path.parent.mkdir(parents=True, exist_ok=True)
-        chunks_path.write_text("", encoding="utf-8")
-        for r in kept:
-            self.store.append_jsonl(project_id, _kb_rel("kb_manuscript", "chunks.jsonl"), r)
-        for r in self._rows_for_chapter(chapter_id, text):
-            self.store.append_jsonl(project_id, _kb_rel("kb_manuscript", "chunks.jsonl"), r)
+        # Same dedup pass as reindex_manuscript; rows already kept for other chapters win over new ones.
+        rows = list(self._dedup_rows(project_id, [*kept, *self._rows_for_chapter(chapter_id, text, project_id)]))
+        self._write_rows(project_id, "kb_manuscript", rows)
         self._reindex_kb(project_id, "kb_manuscript")
 
-    def _rows_for_chapter(self, chapter_id: str, text: str) -> list[dict[str, Any]]:
-        lines = text.splitlines()
-        rows = []
-        start = 1
-        buf = []
-        idx = 0
-        for i, line in enumerate(lines, start=1):
-            buf.append(line)
-            if len("\n".join(buf)) >= 500 or i == len(lines):
-                chunk_text = "\n".join(buf).strip()
-                if chunk_text:
-                    rows.append({
-                        "chunk_id": f"{chapter_id}_c{idx:04d}",
-                        "kb_id": "kb_manuscript",
-                        "asset_id": None,
-                        "ordinal": idx,
-                        "text": chunk_text,
-                        "cleaned_text": chunk_text,
-                        "features": text_features(chunk_text),
-                        "source": {
-                            "path": f"drafts/{chapter_id}.md",
-                            "kind": "manuscript",
-                            "chapter_id": chapter_id,
-                            "start_line": start,
-                            "end_line": i,
-                            "paragraph_index": idx,
-                        },
-                    })
-                    idx += 1
-                start = i + 1
-                buf = []
-        return rows
+    def _chunk_settings(self, project_id: str | None) -> dict[str, int]:
+        settings = self._kb_settings(project_id) if project_id else {}
+        return {
+            "chunk_chars": int(settings.get("chunk_chars", CHUNK_TARGET_CHARS)),
+            "chunk_overlap": int(settings.get("chunk_overlap", 0)),
+            "manuscript_chunk_chars": int(settings.get("manuscript_chunk_chars", CHAPTER_CHUNK_TARGET_CHARS)),
+            "manuscript_chunk_overlap": int(settings.get("manuscript_chunk_overlap", 0)),
+        }
 
+    def _rows_for_chapter(self, chapter_id: str, text: str, project_id: str | None = None) -> Iterator[dict[str, Any]]:
+        cfg = self._chunk_settings(project_id)
+        return iter_chapter_rows(chapter_id, text, cfg["manuscript_chunk_chars"], cfg["manuscript_chunk_overlap"])
 
     def _card_weight_multiplier(self, project_id: str, source: dict[str, Any]) -> float:
         path = str(source.get("path", ""))
@@ -277,16 +719,20 @@ class KBService:
 
     def query(self, project_id: str, kb_id: str, query: str, top_k: int = 5, filters: dict[str, Any] | None = None) -> list[dict[str, Any]]:
         filters = filters or {}
-        chunks = self.store.read_jsonl(project_id, _kb_rel(kb_id, "chunks.jsonl"))
-        bm25 = self.store.read_json(project_id, _kb_rel(kb_id, "bm25.json"))
+        snap = self.index_snapshot(project_id, kb_id)
+        chunks = snap["chunks"]
+        bm25 = snap["bm25"]
         if not bm25:
-            bm25 = self._build_bm25(chunks)
+            bm25 = self._build_bm25(chunks, kb_id in POSITIONAL_KBS)
         n_docs = max(1, bm25.get("n_docs", 1))
         avg_len = max(1.0, float(bm25.get("avg_len", 1.0)))
         doc_freq = bm25.get("doc_freq", {})
         postings = bm25.get("postings", {})
         doc_len = bm25.get("doc_len", {})
+        positions = bm25.get("positions")
         q_terms = _tokenize(query)
+        q_set = set(q_terms)
+        phrase_hits = self._phrase_hits_for_query(chunks, positions, _parse_phrases(query))
         allow_assets = set(filters.get("asset_ids", []))
         allow_chapters = set(filters.get("chapter_ids", []))
         out = []
@@ -297,9 +743,12 @@ class KBService:
             if allow_chapters and src.get("chapter_id") not in allow_chapters:
                 continue
             cid = c["chunk_id"]
+            if phrase_hits is not None and cid not in phrase_hits:
+                continue
             score = 0.0
+            doc_terms = postings.get(cid, {})
             for t in q_terms:
-                tf = postings.get(cid, {}).get(t, 0)
+                tf = doc_terms.get(t, 0)
                 if tf == 0:
                     continue
                 df = doc_freq.get(t, 0) + 1
@@ -308,8 +757,12 @@ class KBService:
                 k1 = 1.5
                 b = 0.75
                 score += idf * ((tf * (k1 + 1)) / (tf + k1 * (1 - b + b * dl / avg_len)))
-            overlap = len(set(q_terms) & set(_tokenize(c.get("cleaned_text", c.get("text", "")))))
+            overlap = len(q_set & doc_terms.keys())
             retrieval_score = score + overlap * 0.1
+            if positions is not None:
+                retrieval_score += _proximity_bonus(positions, cid, q_terms)
+            if phrase_hits is not None:
+                retrieval_score += PHRASE_WEIGHT * math.log1p(phrase_hits[cid])
             score_multiplier = self._card_weight_multiplier(project_id, src)
             final_score = retrieval_score * score_multiplier
             if final_score >= 0:
@@ -326,7 +779,32 @@ class KBService:
         out.sort(key=lambda x: x["score"], reverse=True)
         return out[:top_k]
 
-    def query_multi(self, project_id: str, query: str, top_k: int, kb: list[dict[str, Any]], filters: dict[str, Any] | None = None) -> list[dict[str, Any]]:
+    def _phrase_hits_for_query(self, chunks: list[dict[str, Any]], positions: dict[str, Any] | None, phrases: list[str]) -> dict[str, int] | None:
+        # Quoted phrases are hard filters: only chunks containing every phrase survive.
+        if not phrases:
+            return None
+        hits: dict[str, int] | None = None
+        for ph in phrases:
+            terms = _tokenize(ph)
+            if positions is not None and terms:
+                cur = _phrase_hits(positions, terms, set(hits) if hits is not None else None)
+            else:
+                needle = ph.lower()
+                pool = [c for c in chunks if hits is None or c["chunk_id"] in hits]
+                cur = {c["chunk_id"]: n for c in pool if (n := c.get("cleaned_text", c.get("text", "")).lower().count(needle))}
+            hits = cur if hits is None else {cid: hits[cid] + n for cid, n in cur.items() if cid in hits}
+        return hits or {}
+
+    def find_phrase(self, project_id: str, kb_id: str, phrase: str, top_k: int = 20) -> list[dict[str, Any]]:
+        snap = self.index_snapshot(project_id, kb_id)
+        chunks = snap["chunks"]
+        hits = self._phrase_hits_for_query(chunks, (snap["bm25"] or {}).get("positions"), [phrase]) or {}
+        by_id = {c["chunk_id"]: c for c in chunks if c["chunk_id"] in hits}
+        out = [{"kb_id": kb_id, "chunk_id": cid, "hits": n, "text": by_id[cid]["text"], "source": by_id[cid]["source"]} for cid, n in hits.items() if cid in by_id]
+        out.sort(key=lambda x: (-x["hits"], x["chunk_id"]))
+        return out[:top_k]
+
+    def query_multi(self, project_id: str, query: str, top_k: int, kb: list[dict[str, Any]], filters: dict[str, Any] | None = None, collapse_near_duplicates: bool = True) -> list[dict[str, Any]]:
         filters = filters or {}
         merged: dict[str, dict[str, Any]] = {}
         for item in kb:
@@ -345,8 +823,42 @@ class KBService:
                     merged[key] = {**r, "score": round(norm_score, 4)}
         out = list(merged.values())
         out.sort(key=lambda x: x["score"], reverse=True)
+        if collapse_near_duplicates:
+            out = self._collapse_near_duplicates(project_id, out, top_k)
         return out[:top_k]
 
+    def _collapse_near_duplicates(self, project_id: str, rows: list[dict[str, Any]], top_k: int) -> list[dict[str, Any]]:
+        threshold = float(self._kb_settings(project_id).get("near_dup_threshold", NEAR_DUP_THRESHOLD))
+        index = NearDupIndex(threshold)
+        kept: list[dict[str, Any]] = []
+        by_key: dict[str, dict[str, Any]] = {}
+        stats = self._dedup_stats[project_id]
+        for r in rows:
+            sig = self._row_signature(project_id, r)
+            key = f"{r['kb_id']}:{r['chunk_id']}"
+            dup_of = index.match(sig)
+            if dup_of is not None:
+                by_key[dup_of].setdefault("near_duplicates", []).append(key)
+                stats["query_collapsed_chunks"] += 1
+                stats["query_saved_tokens"] += _approx_tokens(r.get("text", ""))
+                continue
+            if len(kept) >= top_k:
+                break
+            index.add(key, sig)
+            by_key[key] = r
+            kept.append(r)
+        return kept
+
+    def _row_signature(self, project_id: str, row: dict[str, Any]) -> list[int]:
+        snap = self._snapshots.get((project_id, row["kb_id"]))
+        if snap is not None:
+            sigs = snap.get("minhash_by_id")
+            if sigs is None:
+                sigs = snap["minhash_by_id"] = {c["chunk_id"]: c["minhash"] for c in snap["chunks"] if c.get("minhash")}
+            if row["chunk_id"] in sigs:
+                return sigs[row["chunk_id"]]
+        return minhash_signature(row.get("text", ""))
+
     def get_asset_text(self, project_id: str, asset_id: str, kind: str) -> dict[str, Any]:
         if kind == "style_sample":
             rel = f"assets/style_samples/{asset_id}.txt"
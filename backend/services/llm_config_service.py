@@ -1,10 +1,22 @@
 from __future__ import annotations
 
 import json
+import threading
 from pathlib import Path
 from typing import Any
 
 
+MODULES = ("writer", "critic", "editor", "canon_extractor")
+
+
+def _signature(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
 class LLMConfigService:
     def __init__(self, data_dir: Path) -> None:
         self.data_dir = data_dir
@@ -12,8 +24,22 @@ class LLMConfigService:
         self.global_dir.mkdir(parents=True, exist_ok=True)
         self.profiles_file = self.global_dir / "llm_profiles.json"
         self.assignments_file = self.global_dir / "agent_assignments.json"
+        self._snapshot: tuple[Any, dict[str, Any]] | None = None
+        self._lock = threading.Lock()
         self._ensure_defaults()
 
+    def snapshot(self) -> dict[str, Any]:
+        """Profiles and assignments as one cached read; re-read only when either file's mtime/size
+        changes (covers edits made outside this service). Callers must not mutate the result."""
+        key = (_signature(self.profiles_file), _signature(self.assignments_file))
+        with self._lock:
+            if self._snapshot is not None and self._snapshot[0] == key:
+                return self._snapshot[1]
+        snap = {"profiles": self.read_profiles(), "assignments": self.read_assignments()}
+        with self._lock:
+            self._snapshot = (key, snap)
+        return snap
+
     def _ensure_defaults(self) -> None:
         if not self.profiles_file.exists():
             self.write_profiles({
@@ -34,6 +60,8 @@ class LLMConfigService:
     def _write_json(self, path: Path, data: dict[str, Any]) -> None:
         path.parent.mkdir(parents=True, exist_ok=True)
         path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        with self._lock:
+            self._snapshot = None
 
     def read_profiles(self) -> dict[str, Any]:
         data = self._read_json(self.profiles_file)
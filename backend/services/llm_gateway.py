@@ -5,6 +5,8 @@ import json
 import os
 from typing import Any, AsyncIterator
 
+from services.tokenizer import TokenizerRegistry, default_registry
+
 try:
     import httpx  # type: ignore
 except Exception:
@@ -12,8 +14,9 @@ except Exception:
 
 
 class LLMGateway:
-    def __init__(self) -> None:
+    def __init__(self, tokenizers: TokenizerRegistry | None = None) -> None:
         self.timeout = float(os.getenv("LLM_TIMEOUT_S", "60"))
+        self.tokenizers = tokenizers or default_registry
 
     def env_defaults(self) -> dict[str, Any]:
         return {
@@ -65,7 +68,7 @@ class LLMGateway:
         async for d in self.chat_stream(messages, model, temperature, max_tokens, extra):
             content.append(d)
         text = "".join(content)
-        usage = {"prompt_tokens": max(1, len(str(messages)) // 4), "completion_tokens": max(1, len(text) // 4)}
+        usage = {"prompt_tokens": self.tokenizers.count_messages(messages, extra), "completion_tokens": self.tokenizers.count(text, extra)}
         return {"text": text, "usage": usage}
 
 
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from typing import Any
+
+from storage.fs_store import FSStore
+
+
+PACKS_DIR = "meta/memory_packs"
+BLOBS_DIR = f"{PACKS_DIR}/blobs"
+INDEX_PATH = f"{PACKS_DIR}/index.jsonl"
+PACK_FORMAT = 2
+# Blocks stored as a single blob; fixed_blocks and evidence are split further so that a changed
+# scene plan or one new evidence chunk does not duplicate the rest.
+WHOLE_BLOCKS = ("citation_map", "budget_report", "dropped_items", "compression_steps")
+
+
+def _digest(value: Any) -> str:
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _blob_rel(digest: str) -> str:
+    return f"{BLOBS_DIR}/{digest[:2]}/{digest}.json"
+
+
+def _put_blob(store: FSStore, project_id: str, value: Any) -> str:
+    digest = _digest(value)
+    if store.file_signature(project_id, _blob_rel(digest)) is None:
+        store.write_json(project_id, _blob_rel(digest), {"value": value})
+    return digest
+
+
+def _get_blob(store: FSStore, project_id: str, digest: str) -> Any:
+    return store.read_json(project_id, _blob_rel(digest)).get("value")
+
+
+def _summary(pack: dict[str, Any]) -> dict[str, int]:
+    return {"evidence_count": len(pack.get("evidence", [])), "compression_steps": len(pack.get("compression_steps", []))}
+
+
+def _ensure_index(store: FSStore, project_id: str) -> None:
+    # One-time migration: index packs written before the index existed (full-copy format).
+    if store.file_signature(project_id, INDEX_PATH) is not None:
+        return
+    base = store._safe_path(project_id, PACKS_DIR)
+    rows = []
+    if base.exists():
+        for root in sorted(p for p in base.iterdir() if p.is_dir() and p.name != "blobs"):
+            for fp in sorted(root.glob("*.json")):
+                try:
+                    data = json.loads(fp.read_text(encoding="utf-8"))
+                except Exception:
+                    data = {}
+                rows.append({
+                    "pack_id": f"{root.name}:{fp.stem}",
+                    "chapter_id": root.name,
+                    "job_id": fp.stem,
+                    "created_at": fp.stat().st_mtime,
+                    "summary": _summary(data) if isinstance(data, dict) else {"evidence_count": 0, "compression_steps": 0},
+                })
+    store.write_jsonl(project_id, INDEX_PATH, rows)
+
+
+def persist_memory_pack(store: FSStore, project_id: str, chapter_id: str, job_id: str, pack: dict[str, Any]) -> dict[str, Any]:
+    _ensure_index(store, project_id)
+    refs = {
+        "fixed_blocks": {k: _put_blob(store, project_id, v) for k, v in pack.get("fixed_blocks", {}).items()},
+        "evidence": [_put_blob(store, project_id, e) for e in pack.get("evidence", [])],
+        **{k: _put_blob(store, project_id, pack.get(k)) for k in WHOLE_BLOCKS},
+    }
+    ref = {"format": PACK_FORMAT, "pack_id": f"{chapter_id}:{job_id}", "chapter_id": chapter_id, "job_id": job_id, "refs": refs}
+    store.write_json(project_id, f"{PACKS_DIR}/{chapter_id}/{job_id}.json", ref)
+    row = {"pack_id": ref["pack_id"], "chapter_id": chapter_id, "job_id": job_id, "created_at": time.time(), "summary": _summary(pack)}
+    store.append_jsonl(project_id, INDEX_PATH, row)
+    return row
+
+
+def list_memory_packs(store: FSStore, project_id: str, chapter_id: str | None = None) -> list[dict[str, Any]]:
+    _ensure_index(store, project_id)
+    rows = {}
+    for r in store.read_jsonl(project_id, INDEX_PATH):
+        if chapter_id and r.get("chapter_id") != chapter_id:
+            continue
+        r.pop("ts", None)
+        rows[r["pack_id"]] = r
+    return sorted(rows.values(), key=lambda x: (x["chapter_id"], x["job_id"]), reverse=True)
+
+
+def load_memory_pack(store: FSStore, project_id: str, chapter_id: str, job_id: str) -> dict[str, Any] | None:
+    if store.file_signature(project_id, f"{PACKS_DIR}/{chapter_id}/{job_id}.json") is None:
+        return None
+    data = store.read_json(project_id, f"{PACKS_DIR}/{chapter_id}/{job_id}.json")
+    if data.get("format") != PACK_FORMAT:
+        return data
+    refs = data["refs"]
+    return {
+        "pack_id": data["pack_id"],
+        "chapter_id": chapter_id,
+        "job_id": job_id,
+        "fixed_blocks": {k: _get_blob(store, project_id, d) for k, d in refs.get("fixed_blocks", {}).items()},
+        "evidence": [_get_blob(store, project_id, d) for d in refs.get("evidence", [])],
+        **{k: _get_blob(store, project_id, refs[k]) for k in WHOLE_BLOCKS if k in refs},
+    }
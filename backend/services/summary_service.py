@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import re
+import zlib
 from typing import Any
 
+from storage.fs_store import now_iso
+
 
 def make_summaries(chapter_id: str, text: str) -> dict[str, Any]:
     paragraphs = [p.strip() for p in text.split("\n\n") if p.strip() and not p.startswith("#")]
@@ -21,3 +24,132 @@ def make_summaries(chapter_id: str, text: str) -> dict[str, Any]:
         "open_questions": open_questions,
         "canon_candidates": canon_candidates,
     }
+
+
+PYRAMID_PATH = "meta/summaries/pyramid.json"
+ARC_SIZE = 10
+VOLUME_SIZE = 5
+ROLLUP_MAX_CHARS = 600
+ROLLUP_CHILD_CHARS = 120
+CHAPTER_NUM_RE = re.compile(r"(\d+)")
+
+
+def _chapter_sort_key(chapter_id: str) -> tuple:
+    return tuple(int(p) if p.isdigit() else p for p in CHAPTER_NUM_RE.split(chapter_id))
+
+
+def _lead(text: str, limit: int) -> str:
+    head = re.split(r"(?<=[。！？!?；])", text.strip(), maxsplit=1)[0]
+    return head[:limit]
+
+
+def _rollup(children: list[dict[str, Any]]) -> str:
+    # Extractive roll-up: lead sentence of every child, in order, so each child stays represented.
+    per_child = max(20, min(ROLLUP_CHILD_CHARS, ROLLUP_MAX_CHARS // max(1, len(children))))
+    return " / ".join(_lead(c.get("summary", ""), per_child) for c in children if c.get("summary"))[:ROLLUP_MAX_CHARS]
+
+
+def _group(ids: list[str], size: int, prefix: str) -> dict[str, list[str]]:
+    return {f"{prefix}_{i // size + 1:03d}": ids[i : i + size] for i in range(0, len(ids), size)}
+
+
+def _rebuild_level(prev: dict[str, Any], groups: dict[str, list[str]], children: dict[str, Any], ts: str) -> tuple[dict[str, Any], int]:
+    level: dict[str, Any] = {}
+    rebuilt = 0
+    for node_id, child_ids in groups.items():
+        digest = [children[c]["digest"] for c in child_ids]
+        old = prev.get(node_id)
+        if old and old.get("children") == child_ids and old.get("child_digests") == digest:
+            level[node_id] = old
+            continue
+        summary = _rollup([children[c] for c in child_ids])
+        level[node_id] = {
+            "summary": summary,
+            "children": child_ids,
+            "child_digests": digest,
+            "digest": f"{zlib.crc32(summary.encode('utf-8')):08x}",
+            "updated_at": ts,
+        }
+        rebuilt += 1
+    return level, rebuilt
+
+
+def _rebuild_book(prev: dict[str, Any], volumes: dict[str, Any], ts: str) -> tuple[dict[str, Any], int]:
+    # Above volumes the tree keeps a fanout of VOLUME_SIZE ("part" levels) up to a single "book" root,
+    # so every level stays small and a cover needs O(log n) nodes.
+    book: dict[str, Any] = {}
+    rebuilt = 0
+    ids, children, depth = list(volumes), volumes, 1
+    while len(ids) > VOLUME_SIZE:
+        level, n = _rebuild_level(prev, _group(ids, VOLUME_SIZE, f"part{depth}"), children, ts)
+        book.update(level)
+        rebuilt += n
+        ids, children, depth = list(level), level, depth + 1
+    root, n = _rebuild_level(prev, {"book": ids}, children, ts)
+    book.update(root)
+    return book, rebuilt + n
+
+
+def update_summary_pyramid(store: Any, project_id: str, chapter_id: str, chapter_summary: str) -> dict[str, Any]:
+    """Upsert one chapter leaf and re-roll only the arc/volume/book nodes whose children changed."""
+    ts = now_iso()
+    pyr = store.read_json(project_id, PYRAMID_PATH) or {}
+    chapters = pyr.get("chapter", {})
+    digest = f"{zlib.crc32(chapter_summary.encode('utf-8')):08x}"
+    if chapters.get(chapter_id, {}).get("digest") == digest:
+        return {"updated": False, "rebuilt": {}}
+    chapters[chapter_id] = {"summary": chapter_summary[:ROLLUP_MAX_CHARS], "digest": digest, "updated_at": ts}
+    order = sorted(chapters, key=_chapter_sort_key)
+
+    arcs, n_arcs = _rebuild_level(pyr.get("arc", {}), _group(order, ARC_SIZE, "arc"), chapters, ts)
+    volumes, n_volumes = _rebuild_level(pyr.get("volume", {}), _group(list(arcs), VOLUME_SIZE, "volume"), arcs, ts)
+    book, n_book = _rebuild_book(pyr.get("book", {}), volumes, ts)
+    out = {"order": order, "arc_size": ARC_SIZE, "volume_size": VOLUME_SIZE, "chapter": chapters, "arc": arcs, "volume": volumes, "book": book, "updated_at": ts}
+    store.write_json(project_id, PYRAMID_PATH, out)
+    return {"updated": True, "rebuilt": {"arc": n_arcs, "volume": n_volumes, "book": n_book}}
+
+
+def summary_cover(pyramid: dict[str, Any], chapter_id: str) -> list[dict[str, Any]]:
+    """Nodes covering every chapter before `chapter_id`, most recent first.
+
+    Walks down from the book root and keeps the largest nodes that lie entirely before the chapter,
+    descending only into the one node that straddles it: at most (fanout - 1) nodes per level.
+    """
+    order = pyramid.get("order", [])
+    book = pyramid.get("book", {})
+    if not order or "book" not in book:
+        return []
+    key = _chapter_sort_key(chapter_id)
+    levels = [("book", book), ("volume", pyramid.get("volume", {})), ("arc", pyramid.get("arc", {})), ("chapter", pyramid.get("chapter", {}))]
+    last_chapter: dict[str, str] = {}
+
+    def lookup(node_id: str) -> tuple[str, dict[str, Any]]:
+        for level, nodes in levels:
+            if node_id in nodes:
+                return level, nodes[node_id]
+        raise KeyError(node_id)
+
+    def last(node_id: str) -> str:
+        # Chapters are grouped in order, so a node's last chapter is its last child's last chapter.
+        if node_id not in last_chapter:
+            level, node = lookup(node_id)
+            last_chapter[node_id] = node_id if level == "chapter" else last(node["children"][-1])
+        return last_chapter[node_id]
+
+    nodes: list[dict[str, Any]] = []
+
+    def walk(node_id: str) -> None:
+        level, node = lookup(node_id)
+        if _chapter_sort_key(last(node_id)) < key:
+            entry = {"level": level, "id": node_id, "summary": node["summary"]}
+            if level != "chapter":
+                entry[{"arc": "chapters", "volume": "arcs"}.get(level, "children")] = node["children"]
+            nodes.append(entry)
+            return
+        for child in node.get("children", []):
+            walk(child)
+            if not _chapter_sort_key(last(child)) < key:
+                break
+
+    walk("book")
+    return nodes[::-1]
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+try:
+    import sentencepiece  # type: ignore
+except Exception:
+    sentencepiece = None
+
+try:
+    from tokenizers import Tokenizer as HFTokenizer  # type: ignore
+except Exception:
+    HFTokenizer = None
+
+
+COUNT_CACHE_SIZE = 4096
+# Each chat message costs a few framing tokens (role, separators) on top of its content.
+MESSAGE_OVERHEAD_TOKENS = 4
+HEURISTIC_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]|[A-Za-z]+|[0-9]+|\S")
+
+
+class HeuristicTokenizer:
+    """Vocab-free estimate: one token per CJK char, ~4 chars per latin word piece, 3 digits per token."""
+
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        n = 0
+        for m in HEURISTIC_RE.finditer(text):
+            s = m.group(0)
+            if len(s) == 1:
+                n += 1
+            elif s[0].isdigit():
+                n += math.ceil(len(s) / 3)
+            else:
+                n += math.ceil(len(s) / 4)
+        return n
+
+
+class SentencePieceTokenizer:
+    def __init__(self, path: Path) -> None:
+        self.name = f"sentencepiece:{path.name}"
+        self._sp = sentencepiece.SentencePieceProcessor(model_file=str(path))
+
+    def count(self, text: str) -> int:
+        return len(self._sp.encode(text))
+
+
+class BPETokenizer:
+    """Byte-level BPE from a local tokenizer.json (HF `tokenizers` format)."""
+
+    def __init__(self, path: Path) -> None:
+        self.name = f"bpe:{path.name}"
+        self._tok = HFTokenizer.from_file(str(path))
+
+    def count(self, text: str) -> int:
+        return len(self._tok.encode(text, add_special_tokens=False).ids)
+
+
+class TokenizerRegistry:
+    """Resolves the tokenizer for an LLM profile and memoizes counts by text hash.
+
+    A profile selects a vocab with `"tokenizer": {"kind": "sentencepiece" | "bpe", "path": "..."}`;
+    relative paths resolve against `base_dir`. Missing files or libraries fall back to the heuristic.
+    """
+
+    def __init__(self, base_dir: Path | None = None, cache_size: int = COUNT_CACHE_SIZE) -> None:
+        self.base_dir = base_dir
+        self.cache_size = cache_size
+        self.default = HeuristicTokenizer()
+        self._tokenizers: dict[tuple[str, str], Any] = {}
+        self._counts: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _load(self, kind: str, path: Path) -> Any:
+        if not path.exists():
+            return self.default
+        if kind == "sentencepiece" and sentencepiece is not None:
+            return SentencePieceTokenizer(path)
+        if kind == "bpe" and HFTokenizer is not None:
+            return BPETokenizer(path)
+        return self.default
+
+    def for_profile(self, profile: dict[str, Any] | None) -> Any:
+        spec = (profile or {}).get("tokenizer") or {}
+        if not isinstance(spec, dict) or not spec.get("path"):
+            return self.default
+        kind = str(spec.get("kind", "bpe"))
+        path = Path(str(spec["path"]))
+        if not path.is_absolute() and self.base_dir is not None:
+            path = self.base_dir / path
+        key = (kind, str(path))
+        with self._lock:
+            tok = self._tokenizers.get(key)
+        if tok is None:
+            try:
+                tok = self._load(kind, path)
+            except Exception:
+                tok = self.default
+            with self._lock:
+                self._tokenizers[key] = tok
+        return tok
+
+    def count(self, text: str, profile: dict[str, Any] | None = None) -> int:
+        tok = self.for_profile(profile)
+        key = (tok.name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+        with self._lock:
+            n = self._counts.get(key)
+            if n is not None:
+                self._counts.move_to_end(key)
+                self.stats["hits"] += 1
+                return n
+        n = max(1, tok.count(text))
+        with self._lock:
+            self.stats["misses"] += 1
+            self._counts[key] = n
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return n
+
+    def count_messages(self, messages: list[dict[str, str]], profile: dict[str, Any] | None = None) -> int:
+        return sum(self.count(str(m.get("content", "")), profile) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    def counter(self, profile: dict[str, Any] | None = None):
+        return lambda text: self.count(text, profile)
+
+    def describe(self, profile: dict[str, Any] | None = None) -> str:
+        return self.for_profile(profile).name
+
+
+default_registry = TokenizerRegistry()
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 import json
+import os
+import threading
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from difflib import unified_diff
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable
 
 
 WENSHAPE_SUBDIRS = ["cards", "canon", "drafts", "sessions"]
@@ -94,6 +96,13 @@ class FSStore:
         path.parent.mkdir(parents=True, exist_ok=True)
         path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
+    def file_signature(self, project_id: str, rel: str) -> list[int] | None:
+        try:
+            st = self._safe_path(project_id, rel).stat()
+        except FileNotFoundError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
     def read_json(self, project_id: str, rel: str) -> dict[str, Any]:
         path = self._safe_path(project_id, rel)
         if not path.exists():
@@ -104,7 +113,13 @@ class FSStore:
     def write_json(self, project_id: str, rel: str, data: Any) -> None:
         path = self._safe_path(project_id, rel)
         path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        self._replace_text(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+    def _replace_text(self, path: Path, text: str) -> None:
+        # Write-then-rename so concurrent readers see either the old or the new file, never a partial one.
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
 
     def read_md(self, project_id: str, rel: str) -> str:
         path = self._safe_path(project_id, rel)
@@ -125,6 +140,21 @@ class FSStore:
                 out.append(json.loads(line))
         return out
 
+    def read_jsonl_from(self, project_id: str, rel: str, offset: int) -> tuple[list[dict[str, Any]], int]:
+        """Read complete lines appended after byte ``offset``; returns (rows, new_offset)."""
+        path = self._safe_path(project_id, rel)
+        if not path.exists():
+            return [], 0
+        out: list[dict[str, Any]] = []
+        with path.open("rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode("utf-8").splitlines():
+            if line.strip():
+                out.append(json.loads(line))
+        return out, offset + end
+
     def append_jsonl(self, project_id: str, rel: str, item: dict[str, Any]) -> None:
         path = self._safe_path(project_id, rel)
         path.parent.mkdir(parents=True, exist_ok=True)
@@ -132,6 +162,13 @@ class FSStore:
         with path.open("a", encoding="utf-8") as f:
             f.write(json.dumps(payload, ensure_ascii=False) + "\n")
 
+    def write_jsonl(self, project_id: str, rel: str, items: Iterable[dict[str, Any]]) -> None:
+        path = self._safe_path(project_id, rel)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        ts = now_iso()
+        lines = [json.dumps({**item, "ts": item.get("ts", ts)}, ensure_ascii=False) + "\n" for item in items]
+        self._replace_text(path, "".join(lines))
+
     def list_projects(self) -> list[dict[str, Any]]:
         rows = []
         for p in self.data_dir.iterdir():
@@ -317,6 +317,7 @@ def test_llm_config_profiles_assignments_crud(tmp_path: Path):
     app_main.job_manager.context_engine.kb = KBService(app_main.store)
     app_main.job_manager.technique_director.store = app_main.store
     app_main.llm_config_service = __import__("services.llm_config_service", fromlist=["LLMConfigService"]).LLMConfigService(app_main.store.data_dir)
+    app_main.job_manager.llm_config = app_main.llm_config_service
 
     client = TestClient(app_main.app)
 
@@ -648,3 +649,944 @@ def test_create_job_invalid_payload_returns_400_and_stream_not_hanging(tmp_path:
         app_main.kb_service = old_kb
         app_main.context_engine = old_ctx
         app_main.job_manager = old_jm
+
+
+def test_parallel_reindex_all_matches_serial_and_reports_timings(tmp_path: Path):
+    s = make_store(tmp_path)
+    for i in range(2, 5):
+        s.write_md("p1", f"drafts/chapter_{i:03d}.md", f"# Chapter {i:03d}\n\n" + "林秋沿着港区排查线索。\n" * 60)
+    kb = KBService(s)
+    kb.upload_text("p1", "doc", "ref.md", "临港城有三层港区。雨季交通中断会影响补给。")
+
+    serial = kb.reindex("p1", "all")
+    serial_bm25 = kb.index_snapshot("p1", "kb_manuscript")["bm25"]
+    out = kb.reindex("p1", "all", parallel=True, workers=2)
+    assert out["mode"] == "parallel"
+    assert [(p["kb_id"], p["chunks"]) for p in out["parts"]] == [(p["kb_id"], p["chunks"]) for p in serial["parts"]]
+    assert {"total", "chunk_manuscript", "build_bm25"} <= set(out["timings_ms"])
+    assert kb.index_snapshot("p1", "kb_manuscript")["bm25"]["postings"] == serial_bm25["postings"]
+
+    from services import kb_service
+
+    pool = kb_service._POOLS[2]
+    assert kb.reindex("p1", "all", parallel=True, workers=2)["mode"] == "parallel"
+    assert kb_service._POOLS[2] is pool  # worker processes are reused across calls
+
+
+def test_world_reindex_is_incremental_with_watermarks(tmp_path: Path):
+    s = make_store(tmp_path)
+    kb = KBService(s)
+    first = kb.reindex("p1", "kb_world")
+    assert first["full_rebuild"] is True
+    again = kb.reindex("p1", "kb_world")
+    assert again.get("unchanged") is True and again["chunks"] == first["chunks"]
+
+    s.append_jsonl("p1", "canon/facts.jsonl", {"id": "fact_world_event_002", "scope": "world_event", "key": "storm", "value": "台风过境，码头停电。"})
+    lore = s.read_yaml("p1", "cards/lore_001.yaml")
+    lore["payload"]["summary"] = "黑潮同盟已转入地下钱庄。"
+    s.write_yaml("p1", "cards/lore_001.yaml", lore)
+    inc = kb.reindex("p1", "kb_world")
+    assert inc["full_rebuild"] is False
+    assert inc["chunks"] == first["chunks"] + 1
+    assert inc["changed_cards"] == ["lore_001.yaml"]
+
+    rows = s.read_jsonl("p1", "meta/kb/kb_world/chunks.jsonl")
+    assert any("地下钱庄" in r["text"] for r in rows)
+    assert kb.query("p1", "kb_world", "台风 码头", 3)[0]["chunk_id"] == "fact_world_event_002_c0000"
+    forced = kb.reindex_world("p1", force=True)
+    assert [r["chunk_id"] for r in s.read_jsonl("p1", "meta/kb/kb_world/chunks.jsonl")] == [r["chunk_id"] for r in rows]
+    assert forced["chunks"] == inc["chunks"]
+
+
+def test_kb_generation_swap_keeps_readers_on_previous_snapshot(tmp_path: Path):
+    s = make_store(tmp_path)
+    kb = KBService(s)
+    kb.upload_text("p1", "doc", "a.md", "临港城的灯塔在北岸。")
+    before = kb.query("p1", "kb_docs", "灯塔", 3)
+    gen = kb.index_snapshot("p1", "kb_docs")["generation"]
+
+    # A rebuild that has rewritten the source rows but not yet published must not affect readers.
+    s.write_jsonl("p1", "meta/kb/kb_docs/chunks.jsonl", [])
+    assert kb.query("p1", "kb_docs", "灯塔", 3) == before
+
+    kb.upload_text("p1", "doc", "b.md", "南岸只有废弃的灯塔。")
+    snap = kb.index_snapshot("p1", "kb_docs")
+    assert snap["generation"] == gen + 1
+    assert len(kb.query("p1", "kb_docs", "灯塔", 3)) == 1
+    pointer = s.read_json("p1", "meta/kb/kb_docs/generation.json")
+    gen_dirs = sorted(p.name for p in s._safe_path("p1", "meta/kb/kb_docs/generations").iterdir())
+    assert pointer["path"].endswith(gen_dirs[-1]) and len(gen_dirs) <= 2
+
+
+def test_positional_index_phrase_and_proximity_queries(tmp_path: Path):
+    s = make_store(tmp_path)
+    s.write_md("p1", "drafts/chapter_002.md", "# Chapter 002\n\n秋在港口等船，林一直没来。")
+    s.write_md("p1", "drafts/chapter_003.md", "# Chapter 003\n\n林秋在港口等船。")
+    kb = KBService(s)
+    kb.reindex("p1", "kb_manuscript")
+    assert "positions" in kb.index_snapshot("p1", "kb_manuscript")["bm25"]
+
+    rows = kb.query("p1", "kb_manuscript", '"林秋在港口"', 5)
+    assert [r["chunk_id"] for r in rows] == ["chapter_003_c0000"]
+    loose = kb.query("p1", "kb_manuscript", "林秋 港口", 5)
+    assert loose[0]["source"]["chapter_id"] == "chapter_003"
+
+    hits = kb.find_phrase("p1", "kb_manuscript", "林秋", 5)
+    assert {h["source"]["chapter_id"] for h in hits} == {"chapter_001", "chapter_003"}
+    assert kb.find_phrase("p1", "kb_docs", "林秋", 5) == []
+
+    # phrase terms must be adjacent within one run of text, not across a sentence break
+    s.write_md("p1", "drafts/chapter_004.md", "# Chapter 004\n\n他叫林秋。秋在港口。")
+    kb.reindex("p1", "kb_manuscript")
+    assert sorted(r["chunk_id"] for r in kb.query("p1", "kb_manuscript", '"林秋在"', 5)) == ["chapter_001_c0000", "chapter_003_c0000"]
+
+
+def test_minhash_near_duplicates_dedup_on_index_and_collapse_on_query(tmp_path: Path):
+    s = make_store(tmp_path)
+    kb = KBService(s)
+    para = "临港城的雾季很长，码头工人在凌晨四点开工，货轮的汽笛声穿过整片旧城区，一直传到山脚下的灯塔。"
+    kb.upload_text("p1", "doc", "a.md", para)
+    kb.upload_text("p1", "doc", "b.md", para + "完")
+    rows = kb.query_multi("p1", "码头 灯塔", 5, [{"kb_id": "kb_docs", "weight": 1.0}])
+    assert len(rows) == 1 and len(rows[0]["near_duplicates"]) == 1
+    assert kb.dedup_stats("p1")["query_saved_tokens"] > 0
+    assert len(kb.query_multi("p1", "码头 灯塔", 5, [{"kb_id": "kb_docs", "weight": 1.0}], collapse_near_duplicates=False)) == 2
+
+    project = s.read_yaml("p1", "project.yaml")
+    project["kb_settings"] = {"dedup_on_index": True}
+    s.write_yaml("p1", "project.yaml", project)
+    kb.upload_text("p1", "doc", "c.md", para)
+    assert len(s.read_jsonl("p1", "meta/kb/kb_docs/chunks.jsonl")) == 2
+    assert kb.dedup_stats("p1")["index_dropped_chunks"] == 1
+
+    s.write_md("p1", "drafts/chapter_001.md", para)
+    s.write_md("p1", "drafts/chapter_002.md", para + "完")
+    assert kb.reindex_manuscript("p1")["chunks"] == 1
+    kb.reindex_manuscript_chapter("p1", "chapter_002")
+    chunks = s.read_jsonl("p1", "meta/kb/kb_manuscript/chunks.jsonl")
+    assert [c["source"]["chapter_id"] for c in chunks] == ["chapter_001"]
+
+
+def test_streaming_chunkers_respect_target_and_overlap():
+    from services.kb_service import iter_chapter_rows, iter_chunks
+
+    text = "".join(f"第{i}句话在这里。" for i in range(300))
+    chunks = list(iter_chunks(text, target=200, overlap=40))
+    assert max(len(c) for c in chunks) <= 200
+    assert chunks[0][-40:] == chunks[1][:40]
+    assert [len(c) for c in iter_chunks("甲" * 1000, target=300, overlap=50)] == [300, 300, 300, 250]
+
+    rows = list(iter_chapter_rows("chapter_x", "短\n" + "长" * 1200 + "\n尾", target=500))
+    assert [len(r["text"]) for r in rows] == [1, 500, 500, 202]
+    assert rows[1]["source"]["start_line"] == rows[1]["source"]["end_line"] == 2
+
+    lines = "\n".join(f"行{i:03d}内容内容" for i in range(100))
+    spans = [(r["source"]["start_line"], r["source"]["end_line"]) for r in iter_chapter_rows("chapter_x", lines, target=100, overlap=25)]
+    assert spans[0] == (1, 12) and spans[1][0] == 11
+
+    # the overlap carried before an oversized line is not re-emitted as a chunk of its own
+    rows = list(iter_chapter_rows("chapter_x", "aaaa\nbbbb\ncccc\n" + "x" * 30 + "\ntail", target=12, overlap=5))
+    assert [r["text"] for r in rows[:2]] == ["aaaa\nbbbb\ncccc", "x" * 12]
+    assert [(r["source"]["start_line"], r["source"]["end_line"]) for r in rows[:2]] == [(1, 3), (4, 4)]
+
+
+def test_evidence_packer_maximizes_score_within_bucket_budgets(tmp_path: Path):
+    from context_engine.evidence_packer import pack_evidence
+
+    items = [
+        {"kb_id": "kb_manuscript", "chunk_id": "big", "score": 1.0, "text": "x" * 60},
+        {"kb_id": "kb_manuscript", "chunk_id": "a", "score": 0.8, "text": "x" * 40},
+        {"kb_id": "kb_manuscript", "chunk_id": "b", "score": 0.7, "text": "x" * 40},
+        {"kb_id": "kb_docs", "chunk_id": "d", "score": 0.9, "text": "x" * 10},
+    ]
+    out = pack_evidence(items, {"current_draft": 80, "canon": 0}, 12, lambda t: len(t))
+    assert {e["chunk_id"] for e in out["selected"]} == {"a", "b"}
+    assert {e["chunk_id"] for e in out["dropped"]} == {"big", "d"}
+    assert out["used"]["current_draft"] == 80
+    assert any(d.startswith("pack_evidence:current_draft:dp") for d in out["decisions"])
+
+    capped = pack_evidence(items, {"current_draft": 1000, "canon": 100}, 2, lambda t: len(t))
+    assert [e["chunk_id"] for e in capped["selected"]] == ["big", "d"]
+
+    # negative MMR scores count as zero on both paths and still fill leftover capacity
+    from context_engine.evidence_packer import DP_MAX_ITEMS
+
+    for n in (DP_MAX_ITEMS, DP_MAX_ITEMS + 1):
+        rows = [{"kb_id": "kb_manuscript", "chunk_id": f"m{i}", "mmr_score": 1.0 if i % 2 else -0.5, "text": "x" * 10} for i in range(n)]
+        out = pack_evidence(rows, {"current_draft": 10 * (n - 1)}, 100, len, "mmr_score")
+        assert len(out["selected"]) == n - 1 and out["dropped"][0]["mmr_score"] < 0
+        assert out["decisions"][0].split(":")[2] == ("dp" if n <= DP_MAX_ITEMS else "greedy")
+
+    # kb_world evidence is charged to the world bucket once, and packed when it fits the limit
+    s = make_store(tmp_path)
+    kb = KBService(s)
+    kb.reindex("p1", "all")
+    scene = s.read_json("p1", "cards/blueprint_001.json")["scene_plan"][0]
+    manifest = ContextEngine(s, kb).build_manifest("p1", "chapter_001", scene, {"max_tokens": 2400})
+    world = [e for e in manifest["evidence"] if e["kb_id"] == "kb_world"]
+    assert world and manifest["world_facts"] == world
+    assert manifest["budget"]["usage"]["world"] == sum(e["tokens"] for e in world) <= manifest["budget"]["limits"]["world"]
+
+
+def test_tokenizer_registry_counts_mixed_text_and_falls_back_per_profile(tmp_path: Path):
+    from services.tokenizer import TokenizerRegistry
+
+    reg = TokenizerRegistry(tmp_path)
+    assert reg.count("林秋走进码头") == 6
+    assert reg.count("hello world") == 4
+    assert reg.count("林秋 said hello") == 2 + 1 + 2
+    assert reg.stats["misses"] == 3
+    reg.count("林秋走进码头")
+    assert reg.stats["hits"] == 1
+
+    missing = {"tokenizer": {"kind": "sentencepiece", "path": "nope.model"}}
+    assert reg.describe(missing) == "heuristic"
+    assert reg.count_messages([{"role": "user", "content": "林秋"}], missing) == 2 + 4
+
+
+def test_token_ledger_measures_entries_once_and_adjusts_totals():
+    from context_engine.token_ledger import TokenLedger
+
+    calls = []
+
+    def count(text: str) -> int:
+        calls.append(text)
+        return len(text)
+
+    ledger = TokenLedger(count, ["cards", "canon"])
+    ledger.add_many("cards", "card", ["aaaa", "bb"])
+    ledger.add("canon", "fact", "ccc")
+    assert ledger.usage() == {"cards": 6, "canon": 3}
+    ledger.add("cards", "card:0", "a")
+    ledger.remove("canon", "fact")
+    ledger.set("canon", "evidence:x", 7)
+    assert ledger.usage() == {"cards": 3, "canon": 7}
+    assert ledger.remove_prefix("cards", "card") == 3 and ledger.total("cards") == 0
+    assert calls == ["aaaa", "bb", "ccc", "a"]
+
+
+def test_summary_pyramid_updates_incrementally_and_covers_book(tmp_path: Path):
+    from services.summary_service import PYRAMID_PATH, summary_cover, update_summary_pyramid
+
+    store = FSStore(tmp_path)
+    for i in range(1, 121):
+        update_summary_pyramid(store, "p1", f"chapter_{i:03d}", f"第{i}章：林秋抵达第{i}个港口。后来发生了很多事。")
+    pyr = store.read_json("p1", PYRAMID_PATH)
+    assert len(pyr["arc"]) == 12 and len(pyr["volume"]) == 3 and "book" in pyr["book"]
+
+    out = update_summary_pyramid(store, "p1", "chapter_005", "第5章：改写后的摘要。")
+    # volume_001's roll-up text is unchanged (it leads with chapter 1), so the book node is not touched
+    assert out["rebuilt"] == {"arc": 1, "volume": 1, "book": 0}
+    assert update_summary_pyramid(store, "p1", "chapter_005", "第5章：改写后的摘要。")["updated"] is False
+
+    nodes = summary_cover(store.read_json("p1", PYRAMID_PATH), "chapter_113")
+    levels = [n["level"] for n in nodes]
+    assert levels == ["chapter"] * 2 + ["arc"] + ["volume"] * 2
+    covered = {c for n in nodes if n["level"] == "chapter" for c in [n["id"]]}
+    covered |= {c for n in nodes if n["level"] == "arc" for c in n["chapters"]}
+    covered |= {c for n in nodes if n["level"] == "volume" for a in n["arcs"] for c in pyr["arc"][a]["children"]}
+    assert covered == {f"chapter_{i:03d}" for i in range(1, 113)}
+    assert [n["level"] for n in summary_cover(pyr, "chapter_121")] == ["book"]
+
+    def leaves(p, node_id):
+        for level in ("book", "volume", "arc"):
+            if node_id in p[level]:
+                return set().union(*(leaves(p, c) for c in p[level][node_id]["children"]))
+        return {node_id}
+
+    long_store = FSStore(tmp_path / "long")
+    for i in range(1, 301):
+        update_summary_pyramid(long_store, "p1", f"chapter_{i:03d}", f"第{i}章。")
+    long_pyr = long_store.read_json("p1", PYRAMID_PATH)
+    assert long_pyr["book"]["book"]["children"] == ["part1_001", "part1_002"]
+    for target in (2, 57, 199, 251, 300):
+        cover = summary_cover(long_pyr, f"chapter_{target:03d}")
+        # at most fanout - 1 nodes per level (chapters 9, arcs 4, volumes 4, parts 1)
+        assert len(cover) <= 9 + 4 + 4 + 1
+        assert set().union(*(leaves(long_pyr, n["id"]) for n in cover)) == {f"chapter_{i:03d}" for i in range(1, target)}
+    assert len(summary_cover(long_pyr, "chapter_251")) == 1 + 0 + 0  # part1_001 covers chapters 1-250
+
+
+def test_mmr_rerank_prefers_distinct_evidence_and_lambda_is_configurable():
+    from context_engine.budget_manager import BudgetManager
+    from context_engine.mmr import mmr_rerank
+    from services.kb_service import _tokenize
+
+    items = [
+        {"chunk_id": "a", "score": 1.0, "text": "林秋在码头等船，雨一直下"},
+        {"chunk_id": "a2", "score": 0.95, "text": "林秋在码头等船，雨一直下个不停"},
+        {"chunk_id": "b", "score": 0.8, "text": "议会大厅里众人争论税法"},
+    ]
+    assert [r["chunk_id"] for r in mmr_rerank(items, 0.5, _tokenize)] == ["a", "b", "a2"]
+    assert [r["chunk_id"] for r in mmr_rerank(items, 1.0, _tokenize)] == ["a", "a2", "b"]
+
+    assert BudgetManager.from_project({"token_budgets": {"mmr_lambda": 0.4}}).mmr_lambda == 0.4
+    assert BudgetManager.from_project({}).mmr_lambda == 0.7
+
+
+def test_extractive_compressor_keeps_query_sentences_with_line_citations():
+    from context_engine.compressor import compress_evidence, compress_to_fit
+    from services.kb_service import _tokenize
+
+    text = "天色很暗。\n林秋在码头等船。\n远处传来钟声。\n船终于靠岸，林秋上船。"
+    item = {"kb_id": "kb_manuscript", "chunk_id": "c1", "score": 1.0, "text": text, "source": {"path": "drafts/chapter_001.md", "start_line": 10}}
+    out = compress_evidence(item, set(_tokenize("林秋 码头")), 12, len, _tokenize)
+    assert out["compressed"] and "林秋在码头等船。" in out["text"] and "钟声" not in out["text"]
+    assert out["source"]["lines"] == [11]
+    for sp in out["spans"]:
+        assert text[sp["start"]:sp["end"]] in out["text"]
+
+    long_item = {**item, "text": text + "\n" + "雨水打湿了街道，行人匆匆。" * 3}
+    items, steps = compress_to_fit([long_item, {**long_item, "chunk_id": "c2"}], {"current_draft": 60}, 12, "林秋 码头", len, _tokenize)
+    assert all(i.get("compressed") for i in items)
+    assert steps == ["compress_evidence:current_draft:2/2:target=40"]
+
+    from services.kb_service import iter_chapter_rows
+
+    chapter = "\n\n天色很暗。\n\n远处传来钟声。\n\n林秋在码头等船。\n\n"
+    row = next(iter_chapter_rows("chapter_001", chapter, target=10))
+    assert (row["source"]["start_line"], row["source"]["end_line"]) == (3, 5)
+    rows = list(iter_chapter_rows("chapter_001", chapter, target=1000))
+    assert (rows[0]["source"]["start_line"], rows[0]["source"]["end_line"]) == (3, 7)
+    out = compress_evidence(rows[0], set(_tokenize("林秋 码头")), 6, len, _tokenize)
+    assert out["source"]["lines"] == [7] and chapter.splitlines()[6] == "林秋在码头等船。"
+
+
+def test_manifest_components_are_reused_until_inputs_change(tmp_path: Path):
+    s = make_store(tmp_path)
+    kb = KBService(s)
+    kb.reindex("p1", "all")
+    ctx = ContextEngine(s, kb)
+    scene = s.read_json("p1", "cards/blueprint_001.json")["scene_plan"][0]
+
+    first = ctx.build_manifest("p1", "chapter_001", scene, {"max_tokens": 4000})
+    assert first["cache"]["reused"] == [] and "writer_evidence" in first["cache"]["built_ms"]
+
+    second = ctx.build_manifest("p1", "chapter_001", scene, {"max_tokens": 4000})
+    assert second["cache"]["built_ms"] == {}
+    assert second["evidence"] == first["evidence"]
+
+    s.append_jsonl("p1", "canon/issues.jsonl", {"id": "i_new", "issue": "时间线冲突"})
+    third = ctx.build_manifest("p1", "chapter_001", scene, {"max_tokens": 4000})
+    assert list(third["cache"]["built_ms"]) == ["canon"]
+    assert third["included_canon"]["issues"][-1]["id"] == "i_new"
+
+    card = s.read_yaml("p1", "cards/character_001.yaml")
+    s.write_yaml("p1", "cards/character_001.yaml", {**card, "stars": 5, "importance": 5})
+    fourth = ctx.build_manifest("p1", "chapter_001", scene, {"max_tokens": 4000})
+    assert {"cards", "writer_evidence", "critic_evidence"} <= set(fourth["cache"]["built_ms"])
+
+
+def test_next_scene_prefetch_warms_manifest_components(tmp_path: Path):
+    s = make_store(tmp_path)
+    bp = s.read_json("p1", "cards/blueprint_001.json")
+    next_scene = {**bp["scene_plan"][0], "purpose": "第二场：林秋夜探议会", "situation": "议会大厅"}
+    bp["scene_plan"].append(next_scene)
+    s.write_json("p1", "cards/blueprint_001.json", bp)
+
+    kb = KBService(s)
+    ctx = ContextEngine(s, kb)
+    jm = JobManager(s, ctx, LLMGateway())
+
+    import asyncio
+
+    async def _run():
+        jid = await jm.run_write_job("p1", {"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_index": 0, "prefetch_next_scene": True})
+        async for _ in jm.stream(jid):
+            pass
+
+    asyncio.run(_run())
+    manifest = ctx.build_manifest("p1", "chapter_001", next_scene, {})
+    assert {"writer_evidence", "critic_evidence", "cards", "style"} <= set(manifest["cache"]["reused"])
+
+
+def test_memory_packs_are_content_addressed_and_indexed(tmp_path: Path):
+    from services.memory_pack_service import BLOBS_DIR, list_memory_packs, load_memory_pack, persist_memory_pack
+
+    s = make_store(tmp_path)
+    s.write_json("p1", "meta/memory_packs/chapter_000/job_legacy.json", {"evidence": [{"chunk_id": "x"}], "compression_steps": []})
+    ev = [{"chunk_id": f"c{i}", "text": "林秋" * 50} for i in range(5)]
+    pack = {"fixed_blocks": {"style_guide": {"tone": "冷"}, "scene_plan": {"purpose": "a"}}, "evidence": ev, "citation_map": {}, "budget_report": {}, "dropped_items": [], "compression_steps": ["x"]}
+    persist_memory_pack(s, "p1", "chapter_001", "job_a", pack)
+    blobs = sum(1 for _ in s._safe_path("p1", BLOBS_DIR).rglob("*.json"))
+    persist_memory_pack(s, "p1", "chapter_001", "job_b", {**pack, "fixed_blocks": {**pack["fixed_blocks"], "scene_plan": {"purpose": "b"}}})
+    assert sum(1 for _ in s._safe_path("p1", BLOBS_DIR).rglob("*.json")) == blobs + 1
+
+    rows = list_memory_packs(s, "p1")
+    assert [r["pack_id"] for r in rows] == ["chapter_001:job_b", "chapter_001:job_a", "chapter_000:job_legacy"]
+    assert rows[0]["summary"] == {"evidence_count": 5, "compression_steps": 1}
+    assert load_memory_pack(s, "p1", "chapter_001", "job_a")["evidence"] == ev
+    assert load_memory_pack(s, "p1", "chapter_000", "job_legacy")["evidence"] == [{"chunk_id": "x"}]
+
+
+def test_writer_tokens_are_coalesced_into_frames(tmp_path: Path):
+    s = make_store(tmp_path)
+    kb = KBService(s)
+    jm = JobManager(s, ContextEngine(s, kb), LLMGateway())
+
+    import asyncio
+
+    async def _run(policy):
+        jid = await jm.run_write_job("p1", {"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_index": 0, "stream_coalescing": policy})
+        return jid, [e async for e in jm.stream(jid)]
+
+    jid, events = asyncio.run(_run({"max_tokens": 16, "max_ms": 0}))
+    frames = [e["data"] for e in events if e["event"] == "WRITER_TOKEN"]
+    draft = [e for e in events if e["event"] == "WRITER_DRAFT"][0]["data"]["text"]
+    assert draft.endswith("".join(f["delta"] for f in frames))
+    stats = events[-1]["data"]["stream"]
+    assert stats["frames"] == len(frames) == -(-stats["tokens"] // 16)
+    assert all(f["tokens"] == 16 for f in frames[:-1])
+    logged = [r for r in s.read_jsonl("p1", "sessions/session_001.jsonl") if r.get("job_id") == jid and r.get("event") == "WRITER_TOKEN"]
+    assert len(logged) == len(frames)
+
+    _, events = asyncio.run(_run({"max_tokens": 1}))
+    assert sum(1 for e in events if e["event"] == "WRITER_TOKEN") == events[-1]["data"]["stream"]["tokens"]
+
+    import logging
+
+    from jobs.coalescer import TokenCoalescer
+
+    async def _timed_failure():
+        async def broken(frame):
+            raise RuntimeError("subscriber gone")
+
+        frames = TokenCoalescer(broken, max_tokens=8, max_ms=5)
+        await frames.add("a", {})
+        await asyncio.sleep(0.03)
+        task = frames._flush_task
+        await frames.close()
+        return task
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logging.getLogger("jobs.coalescer").addHandler(handler)
+    try:
+        task = asyncio.run(_timed_failure())
+    finally:
+        logging.getLogger("jobs.coalescer").removeHandler(handler)
+    # the timed flush is kept on the coalescer and its failure is logged, not lost
+    assert task is not None and task.done() and isinstance(task.exception(), RuntimeError)
+    assert [r.getMessage() for r in records] == ["timed frame flush failed"]
+
+
+def test_job_events_replay_from_seq_and_expire_after_done(tmp_path: Path):
+    from jobs.event_buffer import JobEventRegistry
+
+    s = make_store(tmp_path)
+    jm = JobManager(s, ContextEngine(s, KBService(s)), LLMGateway())
+
+    import asyncio
+
+    async def _run():
+        jid = await jm.run_write_job("p1", {"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_index": 0})
+        live = [e async for e in jm.stream(jid)]
+        replay = [e async for e in jm.stream(jid, since=live[2]["seq"])]
+        return jid, live, replay
+
+    jid, live, replay = asyncio.run(_run())
+    assert [e["seq"] for e in live] == list(range(len(live)))
+    assert replay == live[3:] and replay[-1]["event"] == "DONE"
+
+    assert jm.events.gc(now=jm.events.get(jid).done_at + jm.events.ttl_s + 1) == [jid]
+    assert not jm.has_job(jid)
+
+    reg = JobEventRegistry(maxlen=3)
+    buf = reg.open("j")
+    for i in range(5):
+        buf.publish({"event": "WRITER_TOKEN", "data": {"delta": str(i)}})
+    buf.publish({"event": "DONE", "data": {}})
+
+    async def _late():
+        return [e async for e in buf.subscribe()]
+
+    late = asyncio.run(_late())
+    assert late[0]["event"] == "REPLAY_GAP" and late[0]["data"] == {"requested": 0, "oldest": 3}
+    assert [e["seq"] for e in late[1:]] == [3, 4, 5]
+
+
+def test_job_stream_fans_out_and_coalesces_for_slow_subscribers():
+    from jobs.event_buffer import JobEventBuffer
+
+    import asyncio
+
+    async def _run():
+        buf = JobEventBuffer(subscriber_maxlen=4)
+        fast, slow = buf.subscribe(), buf.subscribe()
+        first = asyncio.ensure_future(fast.__anext__())
+        await asyncio.sleep(0)  # both generators must be registered before publishing
+        slow_first = asyncio.ensure_future(slow.__anext__())
+        await asyncio.sleep(0)
+        buf.publish({"event": "DIRECTOR_PLAN", "data": {}})
+        got_fast = [await first]
+        for i in range(20):
+            buf.publish({"event": "WRITER_TOKEN", "data": {"delta": str(i % 10), "tokens": 1, "provider": "mock"}})
+            got_fast.append(await fast.__anext__())
+        buf.publish({"event": "WRITER_DRAFT", "data": {}})
+        buf.publish({"event": "DONE", "data": {}})
+        got_fast += [e async for e in fast]
+        got_slow = [await slow_first] + [e async for e in slow]
+        return got_fast, got_slow
+
+    fast, slow = asyncio.run(_run())
+    stages = lambda evs: [e["event"] for e in evs if e["event"] != "WRITER_TOKEN"]
+    assert stages(fast) == stages(slow) == ["DIRECTOR_PLAN", "WRITER_DRAFT", "DONE"]
+    text = lambda evs: "".join(e["data"]["delta"] for e in evs if e["event"] == "WRITER_TOKEN")
+    assert text(fast) == text(slow) == "01234567890123456789"
+    assert sum(1 for e in fast if e["event"] == "WRITER_TOKEN") == 20
+    assert sum(1 for e in slow if e["event"] == "WRITER_TOKEN") < 20
+
+
+def test_job_scheduler_limits_backend_and_orders_by_priority_and_fairness(tmp_path: Path):
+    from jobs.scheduler import AdmissionError, JobScheduler, backend_key
+
+    import asyncio
+
+    local = {"provider": "llama_cpp", "base_url": "http://127.0.0.1:8080/"}
+    assert backend_key(local) == "llama_cpp@http://127.0.0.1:8080"
+
+    async def _run():
+        sched = JobScheduler(max_queued_per_project=2)
+        order, queued = [], {}
+
+        async def job(jid, project, priority="interactive"):
+            async with sched.slot(jid, project, local, priority, lambda info: queued.setdefault(jid, []).append(info["position"])):
+                order.append(jid)
+                assert sched.running["llama_cpp@http://127.0.0.1:8080"] == 1
+                await asyncio.sleep(0.01)
+
+        tasks = [asyncio.create_task(job("a1", "A"))]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(job("a2", "A", "batch")), asyncio.create_task(job("a3", "A"))]
+        await asyncio.sleep(0)
+        try:
+            sched.admit("A", local)
+        except AdmissionError:
+            rejected = True
+        else:
+            rejected = False
+        tasks += [asyncio.create_task(job("b1", "B")), asyncio.create_task(job("b2", "B", "batch"))]
+        await asyncio.gather(*tasks)
+        return order, queued, rejected, sched.snapshot()
+
+    order, queued, rejected, snap = asyncio.run(_run())
+    # interactive before batch; among equal priority, FIFO because neither project is running when the slot frees
+    assert order == ["a1", "a3", "b1", "a2", "b2"]
+    assert "a1" not in queued and queued["a2"][0] == 1 and queued["b2"][-1] == 1
+    assert rejected
+    assert snap["llama_cpp@http://127.0.0.1:8080"] == {"running": 0, "waiting": 0, "limit": 1}
+
+    async def _fair():
+        sched = JobScheduler()
+        shared = {**local, "max_concurrency": 2}
+        order = []
+
+        async def job(jid, project, hold):
+            async with sched.slot(jid, project, shared):
+                order.append(jid)
+                await asyncio.sleep(hold)
+
+        tasks = [asyncio.create_task(job("a1", "A", 0.01)), asyncio.create_task(job("a2", "A", 0.05))]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(job("a3", "A", 0)), asyncio.create_task(job("b1", "B", 0))]
+        await asyncio.gather(*tasks)
+        return order
+
+    # when a1 finishes, project A still runs a2, so B's job goes ahead of the earlier-queued a3
+    assert asyncio.run(_fair()) == ["a1", "a2", "b1", "a3"]
+
+    async def _burst():
+        s = make_store(tmp_path)
+        jm = JobManager(s, ContextEngine(s, KBService(s)), LLMGateway())
+        payload = {"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_index": 0}
+        accepted, rejected = [], 0
+        for _ in range(40):
+            try:
+                accepted.append(await jm.run_write_job("p1", payload))
+            except AdmissionError:
+                rejected += 1
+        reserved = jm.scheduler.reserved["mock"]
+        for jid in accepted:
+            [e async for e in jm.stream(jid)]
+        return len(accepted), rejected, reserved, jm.scheduler.reserved["mock"], jm.scheduler.snapshot()["mock"]
+
+    # admitted jobs count before they reach acquire(): 8 free mock slots + 8 queued for the project
+    n_accepted, n_rejected, reserved, left, mock = asyncio.run(_burst())
+    assert (n_accepted, n_rejected, reserved) == (16, 24, 16)
+    assert left == 0 and mock["running"] == mock["waiting"] == 0
+
+    # modules routed to another backend take a slot there around their own LLM calls
+    from services.llm_config_service import LLMConfigService
+
+    async def _routed():
+        s = make_store(tmp_path / "routed")
+        project = s.read_yaml("p1", "project.yaml")
+        project["llm_profiles"] = {"critic_local": {"provider": "ollama", "base_url": "http://127.0.0.1:11434", "model": "qwen"}}
+        s.write_yaml("p1", "project.yaml", project)
+        cfg = LLMConfigService(s.data_dir)
+        cfg.write_assignments({**cfg.snapshot()["assignments"], "critic": "critic_local"})
+        jm = JobManager(s, ContextEngine(s, KBService(s)), LLMGateway(), cfg)
+        complete, seen = jm.llm_gateway.chat_complete, []
+
+        async def fake_local(messages, model, temperature, max_tokens, extra):
+            if extra.get("provider") != "ollama":
+                return await complete(messages, model, temperature, max_tokens, extra)
+            seen.append(dict(jm.scheduler.running))
+            return {"text": "冲突不足"}
+
+        jm.llm_gateway.chat_complete = fake_local
+        jid = await jm.run_write_job("p1", {"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_index": 0})
+        events = [e async for e in jm.stream(jid)]
+        return seen, events, jm.scheduler.snapshot()
+
+    seen, events, snap = asyncio.run(_routed())
+    assert [r["ollama@http://127.0.0.1:11434"] for r in seen] == [1]
+    assert not any(e["event"] == "ERROR" for e in events)
+    assert snap["ollama@http://127.0.0.1:11434"]["running"] == 0 and snap["mock"]["running"] == 0
+
+
+def test_write_pipeline_stage_dag_keeps_event_order_and_times_stages(tmp_path: Path):
+    from jobs.stages import Stage, run_stage_dag
+
+    import asyncio
+    import time
+
+    async def _dag():
+        seen = []
+
+        async def sleep_stage(name, dt):
+            async def fn(r):
+                await asyncio.sleep(dt)
+                seen.append(name)
+                return name
+            return fn
+
+        timings = {}
+        t0 = time.perf_counter()
+        results = await run_stage_dag([
+            Stage("a", await sleep_stage("a", 0.05)),
+            Stage("b", await sleep_stage("b", 0.05)),
+            Stage("c", await sleep_stage("c", 0), ("a", "b")),
+        ], timings)
+        return seen, results, timings, time.perf_counter() - t0
+
+    seen, results, timings, elapsed = asyncio.run(_dag())
+    assert seen[-1] == "c" and set(results) == {"a", "b", "c"} and set(timings) == {"a", "b", "c"}
+    assert elapsed < 0.095  # a and b overlap
+
+    s = make_store(tmp_path)
+    jm = JobManager(s, ContextEngine(s, KBService(s)), LLMGateway())
+
+    extract = jm.canon_extractor.extract
+
+    async def slow_extract(*args, **kwargs):
+        await asyncio.sleep(0.2)
+        return await extract(*args, **kwargs)
+
+    jm.canon_extractor.extract = slow_extract
+    logged = lambda jid: [r["event"] for r in s.read_jsonl("p1", "sessions/session_001.jsonl") if r.get("job_id") == jid]
+
+    async def _run(defer):
+        jid = await jm.run_write_job("p1", {"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_index": 0, "auto_apply_patch": True, "defer_canon": defer})
+        events = [e async for e in jm.stream(jid)]
+        at_done = (logged(jid), jm.scheduler.running["mock"])
+        await asyncio.gather(*jm._background)
+        return jid, events, at_done
+
+    order = ["DIRECTOR_PLAN", "TECHNIQUE_BRIEF", "CONTEXT_MANIFEST", "WRITER_TOKEN", "WRITER_DRAFT", "CRITIC_REVIEW", "EDITOR_PATCH", "DIFF", "MERGE_RESULT", "CANON_UPDATES", "DONE"]
+    for defer in (False, True):
+        jid, events, (logged_at_done, running_at_done) = asyncio.run(_run(defer))
+        names = [e["event"] for e in events]
+        assert [n for i, n in enumerate(names) if i == 0 or names[i - 1] != n] == order
+        stage_ms = events[-1]["data"]["stage_ms"]
+        assert {"plan", "retrieve", "technique", "manifest", "writer", "critic_llm", "checks", "critic", "editor", "merge", "canon"} <= set(stage_ms)
+        canon = [e for e in events if e["event"] == "CANON_UPDATES"][0]["data"]
+        assert canon.get("deferred", False) is defer
+        # a deferred extraction finishes after DONE, holding the job's backend slot until it returns
+        assert "CANON_EXTRACTED" not in logged_at_done and running_at_done == int(defer)
+        assert ("CANON_EXTRACTED" in logged(jid)) is defer and jm.scheduler.running["mock"] == 0
+
+
+def test_pipeline_offloads_blocking_work_and_monitors_loop_lag(tmp_path: Path):
+    from jobs.loop_monitor import LoopLagMonitor
+
+    import asyncio
+    import threading
+    import time
+
+    async def _blocked():
+        mon = LoopLagMonitor(interval_s=0.01)
+        mon.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.1)  # blocks the loop
+        await asyncio.sleep(0.03)
+        mon.stop()
+        return mon.snapshot()
+
+    snap = asyncio.run(_blocked())
+    assert snap["samples"] >= 2 and snap["max_ms"] >= 80 and not snap["running"]
+
+    s = make_store(tmp_path)
+    ce = ContextEngine(s, KBService(s))
+    jm = JobManager(s, ce, LLMGateway())
+    threads = []
+    build = ce.build_manifest
+
+    def spy(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return build(*args, **kwargs)
+
+    ce.build_manifest = spy
+
+    import jobs.manager as manager_module
+    from jobs import checkpoints
+
+    def traced(fn):
+        def wrapper(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    patched = {"apply_patch_ops": manager_module.apply_patch_ops, "find_job_project": checkpoints.find_job_project}
+    manager_module.apply_patch_ops = traced(patched["apply_patch_ops"])
+    checkpoints.find_job_project = traced(patched["find_job_project"])
+
+    async def _run():
+        jid = await jm.run_write_job("p1", {"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_index": 0, "auto_apply_patch": True})
+        events = [e async for e in jm.stream(jid)]
+        try:
+            await jm.resume_job(jid)
+        except ValueError:
+            pass
+        return events, jm.loop_monitor.snapshot()
+
+    try:
+        events, snap = asyncio.run(_run())
+    finally:
+        manager_module.apply_patch_ops = patched["apply_patch_ops"]
+        checkpoints.find_job_project = patched["find_job_project"]
+    assert events[-1]["event"] == "DONE" and not any(e["event"] == "ERROR" for e in events)
+    # manifest build, patch merge and the checkpoint scan on resume all run on worker threads
+    assert len(threads) >= 3 and all(t.startswith("job-io") for t in threads)
+    assert snap["running"] and set(snap) >= {"p50_ms", "p99_ms", "max_ms"}
+
+
+def test_batch_job_writes_blueprint_scenes_in_order_with_multiplexed_events(tmp_path: Path):
+    s = make_store(tmp_path)
+    bp = s.read_json("p1", "cards/blueprint_001.json")
+    base = bp["scene_plan"][0]
+    bp["scene_plan"] = [{**base, "scene_id": f"scene_{i}", "situation": f"场景{i}"} for i in range(3)]
+    s.write_json("p1", "cards/blueprint_001.json", bp)
+    jm = JobManager(s, ContextEngine(s, KBService(s)), LLMGateway())
+
+    import asyncio
+
+    async def _run(body):
+        started = await jm.run_batch_job("p1", body)
+        return started, [e async for e in jm.stream(started["batch_id"])]
+
+    started, events = asyncio.run(_run({"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "batch_window": 2}))
+    jobs = [j["job_id"] for j in started["jobs"]]
+    assert [j["scene_index"] for j in started["jobs"]] == [0, 1, 2]
+    assert events[0]["event"] == "BATCH_PLAN" and events[-1]["event"] == "DONE"
+    assert all(u["ok"] for u in events[-1]["data"]["units"])
+    assert sorted(e["job_id"] for e in events if e["event"] == "UNIT_DONE") == sorted(jobs)
+    for jid in jobs:
+        names = [e["event"] for e in events if e.get("job_id") == jid and e["event"] != "WRITER_TOKEN"]
+        assert names[:3] == ["DIRECTOR_PLAN", "TECHNIQUE_BRIEF", "CONTEXT_MANIFEST"] and names[-1] == "UNIT_DONE"
+    drafts = [next(e["data"]["text"] for e in events if e.get("job_id") == jid and e["event"] == "WRITER_DRAFT") for jid in jobs]
+    # each scene is appended to the chapter text of the scene before it
+    assert drafts[1].startswith(drafts[0].rstrip()) and drafts[2].startswith(drafts[1].rstrip())
+    assert s.read_md("p1", "drafts/chapter_001.md") == drafts[2] and drafts[2].count("# chapter_001") == 1
+
+    # without auto-apply the next scene starts drafting once the previous draft is written,
+    # not after the previous unit's critic/editor/canon stages
+    complete = jm.llm_gateway.chat_complete
+
+    async def slow_complete(*args, **kwargs):
+        await asyncio.sleep(0.2)
+        return await complete(*args, **kwargs)
+
+    jm.llm_gateway.chat_complete = slow_complete
+    started, events = asyncio.run(_run({"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_indices": [0, 1]}))
+    first, second = (j["job_id"] for j in started["jobs"])
+    names = [(e.get("job_id"), e["event"]) for e in events]
+    assert names.index((second, "WRITER_DRAFT")) < names.index((first, "CRITIC_REVIEW"))
+    jm.llm_gateway.chat_complete = complete
+
+    s.write_md("p1", "drafts/.chapter_order", "chapter_001\nchapter_002\nchapter_003\n")
+    s.write_json("p1", "drafts/chapter_002.meta.json", {"blueprint_id": "blueprint_001", "scene_index": 2})
+    units = jm._batch_units("p1", {"chapter_range": {"from": "chapter_002", "to": "chapter_003"}, "blueprint_id": "blueprint_001"})
+    assert [(u["chapter_id"], u["scene_index"]) for u in units] == [("chapter_002", 2), ("chapter_003", 0), ("chapter_003", 1), ("chapter_003", 2)]
+    try:
+        jm._batch_units("p1", {"chapter_range": {"from": "chapter_009"}})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown chapter accepted")
+
+
+def test_write_job_checkpoints_stages_and_resumes_after_failure(tmp_path: Path):
+    from jobs import checkpoints
+
+    import asyncio
+
+    s = make_store(tmp_path)
+    jm = JobManager(s, ContextEngine(s, KBService(s)), LLMGateway())
+    calls = {"writer": 0}
+    writer = jm._writer
+
+    async def counting_writer(*args, **kwargs):
+        calls["writer"] += 1
+        return await writer(*args, **kwargs)
+
+    jm._writer = counting_writer
+    complete = jm._complete_with_fallback
+
+    async def editor_down(project_id, job_id, stage, *args, **kwargs):
+        if stage == "editor":
+            raise RuntimeError("backend restarted")
+        return await complete(project_id, job_id, stage, *args, **kwargs)
+
+    jm._complete_with_fallback = editor_down
+
+    async def _run():
+        jid = await jm.run_write_job("p1", {"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_index": 0})
+        first = [e async for e in jm.stream(jid)]
+        jm._complete_with_fallback = complete
+        resumed = await jm.resume_job(jid)
+        second = [e async for e in jm.stream(jid)]
+        try:
+            await jm.resume_job(jid)
+        except ValueError:
+            again = False
+        else:
+            again = True
+        return jid, first, resumed, second, again
+
+    jid, first, resumed, second, again = asyncio.run(_run())
+    assert any(e["event"] == "ERROR" for e in first)
+    assert {"plan", "technique", "manifest", "writer", "critic"} <= set(resumed["resumed_from"]) and "editor" not in resumed["resumed_from"]
+    names = [e["event"] for e in second]
+    assert names[0] == "RESUMED" and "WRITER_DRAFT" not in names and "EDITOR_PATCH" in names and names[-1] == "DONE"
+    assert calls["writer"] == 1 and not again
+
+    rows = checkpoints.list_jobs(s, "p1")
+    assert rows[0]["job_id"] == jid and rows[0]["status"] == "done"
+    assert {"editor", "merge", "canon"} <= set(checkpoints.load_job(s, "p1", jid)["stages_done"])
+    try:
+        asyncio.run(jm.resume_job("job_missing"))
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("unknown job resumed")
+
+    # a resumed batch unit still appends to the scenes written before it
+    async def _batch():
+        started = await jm.run_batch_job("p1", {"chapter_id": "chapter_002", "blueprint_id": "blueprint_001", "scene_indices": [0, 0]})
+        [e async for e in jm.stream(started["batch_id"])]
+        unit = started["jobs"][1]["job_id"]
+        for stage in ("writer", "critic_llm", "checks", "critic", "editor", "merge", "canon"):
+            s._safe_path("p1", f"meta/jobs/{unit}/stages/{stage}.json").unlink(missing_ok=True)
+        checkpoints.save_job(s, "p1", unit, status="failed")
+        before = s.read_md("p1", "drafts/chapter_002.md")
+        await jm.resume_job(unit)
+        return before, [e async for e in jm.stream(unit)]
+
+    before, events = asyncio.run(_batch())
+    draft = next(e["data"]["text"] for e in events if e["event"] == "WRITER_DRAFT")
+    assert len(draft) > len(before) and draft.startswith(before.rstrip()) and draft.count("# chapter_002") == 1
+
+
+def test_profiles_resolve_once_per_job_from_cached_config_snapshot(tmp_path: Path):
+    from services.llm_config_service import LLMConfigService
+
+    import asyncio
+    import json
+    import os
+
+    s = make_store(tmp_path)
+    cfg = LLMConfigService(s.data_dir)
+    snap = cfg.snapshot()
+    assert cfg.snapshot() is snap
+    cfg.write_assignments({**snap["assignments"], "critic": "critic_profile"})
+    assert cfg.snapshot()["assignments"]["critic"] == "critic_profile"
+    # edits behind the service's back are picked up through the file signature
+    raw = json.loads(cfg.profiles_file.read_text(encoding="utf-8"))
+    raw["critic_profile"] = {"provider": "mock", "model": "mock-critic-v1", "stream": True}
+    cfg.profiles_file.write_text(json.dumps(raw), encoding="utf-8")
+    os.utime(cfg.profiles_file, ns=(1, 1))
+    assert cfg.snapshot()["profiles"]["critic_profile"]["model"] == "mock-critic-v1"
+
+    jm = JobManager(s, ContextEngine(s, KBService(s)), LLMGateway(), cfg)
+    reads = {"n": 0}
+    read_profiles = cfg.read_profiles
+
+    def counting():
+        reads["n"] += 1
+        return read_profiles()
+
+    cfg.read_profiles = counting
+    resolves = {"n": 0}
+    resolve = jm._resolve_profiles
+
+    def counting_resolve(*args, **kwargs):
+        resolves["n"] += 1
+        return resolve(*args, **kwargs)
+
+    jm._resolve_profiles = counting_resolve
+
+    async def _run():
+        jid = await jm.run_write_job("p1", {"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_index": 0})
+        events = [e async for e in jm.stream(jid)]
+        started = await jm.run_batch_job("p1", {"chapter_id": "chapter_002", "blueprint_id": "blueprint_001", "scene_indices": [0, 0]})
+        [e async for e in jm.stream(started["batch_id"])]
+        return events
+
+    events = asyncio.run(_run())
+    # once at admission for the write job, once for the whole batch
+    assert resolves["n"] == 2
+    resolved = [e for e in events if e["event"] == "CONTEXT_MANIFEST"][0]["data"]["llm"]["resolved"]
+    assert set(resolved) == {"writer", "critic", "editor", "canon_extractor"}
+    assert resolved["critic"] == {"profile_id": "critic_profile", "provider": "mock", "model": "mock-critic-v1"}
+    assert reads["n"] == 0
+
+
+def test_rolling_session_summary_is_incremental_and_matches_full_log(tmp_path: Path):
+    import asyncio
+
+    s = make_store(tmp_path)
+    jm = JobManager(s, ContextEngine(s, KBService(s)), LLMGateway())
+
+    async def _run():
+        jid = await jm.run_write_job("p1", {"chapter_id": "chapter_001", "blueprint_id": "blueprint_001", "scene_index": 0})
+        return [e async for e in jm.stream(jid)]
+
+    def expected():
+        events = s.read_jsonl("p1", "sessions/session_001.jsonl")
+        return " | ".join(f"{e.get('job_id','evt')}:{str(e.get('event',''))[:40]}" for e in events[-10:])[:600], str(len(events))
+
+    asyncio.run(_run())
+    asyncio.run(_run())
+    meta = s.read_json("p1", "sessions/session_001.meta.json")
+    assert (meta["rolling_summary"], meta["last_summarized_message_id"]) == expected()
+    first_offset = meta["rolling_state"]["offset"]
+    s.append_jsonl("p1", "sessions/session_001.jsonl", {"event": "PROPOSAL_REJECTED", "data": {}})
+
+    offsets = []
+    read_from = s.read_jsonl_from
+    s.read_jsonl_from = lambda pid, rel, offset: offsets.append((rel, offset)) or read_from(pid, rel, offset)
+    s.read_jsonl = lambda *a: (_ for _ in ()).throw(AssertionError("full session log read"))
+    jm._update_rolling_summary("p1", "session_001")
+    s.read_jsonl = FSStore.read_jsonl.__get__(s)
+    meta = s.read_json("p1", "sessions/session_001.meta.json")
+    assert offsets == [("sessions/session_001.jsonl", first_offset)]
+    assert (meta["rolling_summary"], meta["last_summarized_message_id"]) == expected()
+    assert meta["rolling_summary"].endswith("evt:PROPOSAL_REJECTED")
+
+    # a fresh manager picks the state up from the meta instead of rereading the log
+    jm2 = JobManager(s, ContextEngine(s, KBService(s)), LLMGateway())
+    jm2._update_rolling_summary("p1", "session_001")
+    assert offsets[-1][1] == meta["rolling_state"]["offset"]
+    assert s.read_json("p1", "sessions/session_001.meta.json")["last_summarized_message_id"] == expected()[1]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Benchmark the KB chunkers on large single-paragraph inputs.
+
+Usage: python scripts/bench_chunkers.py [--mb 10] [--legacy-mb 10]
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from services.kb_service import iter_chapter_rows, iter_chunks, text_features  # noqa: E402
+
+
+def legacy_split_chunks(text: str) -> list[str]:
+    # Pre-streaming implementation, kept here as the baseline.
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    chunks: list[str] = []
+
+    def flush_buffer(buf: str) -> str:
+        while len(buf) > 800:
+            chunks.append(buf[:800].strip())
+            buf = buf[800:]
+        return buf
+
+    for p in paragraphs:
+        if len(p) <= 800:
+            chunks.append(p)
+            continue
+        buf = ""
+        for s in re.split(r"(?<=[。！？!?])|\n", p):
+            s = s.strip()
+            if not s:
+                continue
+            if len(buf) + len(s) <= 800:
+                buf += s
+                continue
+            if buf:
+                chunks.append(buf.strip())
+                buf = ""
+            buf = s if len(s) <= 800 else flush_buffer(s)
+        if buf.strip():
+            chunks.append(buf.strip())
+    return chunks or [text[:800]]
+
+
+def legacy_rows_for_chapter(text: str) -> list[dict]:
+    # Old _rows_for_chapter: re-joins the whole buffer after every line.
+    lines = text.splitlines()
+    rows = []
+    buf: list[str] = []
+    for i, line in enumerate(lines, start=1):
+        buf.append(line)
+        if len("\n".join(buf)) >= 500 or i == len(lines):
+            chunk_text = "\n".join(buf).strip()
+            if chunk_text:
+                rows.append({"text": chunk_text, "features": text_features(chunk_text)})
+            buf = []
+    return rows
+
+
+def make_inputs(mb: float) -> dict[str, str]:
+    n_chars = int(mb * 1024 * 1024 / 3)  # CJK chars are 3 bytes in UTF-8
+    sentence = "林秋在码头边等了很久，雨一直没有停。"
+    soft_lines = "雨\n"
+    return {
+        "no_punctuation": "甲" * n_chars,
+        "sentences": sentence * (n_chars // len(sentence)),
+        "short_lines": soft_lines * (n_chars // len(soft_lines)),
+    }
+
+
+def timed(fn, *args) -> tuple[float, int]:
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - t0, (out if isinstance(out, int) else len(out))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=10.0, help="input size for the streaming chunkers")
+    ap.add_argument("--legacy-mb", type=float, default=10.0, help="input size for the legacy baseline (0 to skip)")
+    args = ap.parse_args()
+
+    new_inputs = make_inputs(args.mb)
+    legacy_inputs = make_inputs(args.legacy_mb) if args.legacy_mb else {}
+    print(f"{'case':<28}{'impl':<10}{'MB':>6}{'chunks':>10}{'seconds':>10}")
+    for name in ("no_punctuation", "sentences"):
+        dt, n = timed(lambda t: list(iter_chunks(t)), new_inputs[name])
+        print(f"{'split_chunks/' + name:<28}{'stream':<10}{args.mb:>6}{n:>10}{dt:>10.3f}")
+        if name in legacy_inputs:
+            dt, n = timed(legacy_split_chunks, legacy_inputs[name])
+            print(f"{'split_chunks/' + name:<28}{'legacy':<10}{args.legacy_mb:>6}{n:>10}{dt:>10.3f}")
+    dt, n = timed(lambda t: list(iter_chapter_rows("chapter_bench", t)), new_inputs["short_lines"])
+    print(f"{'chapter_rows/short_lines':<28}{'stream':<10}{args.mb:>6}{n:>10}{dt:>10.3f}")
+    if legacy_inputs:
+        dt, n = timed(legacy_rows_for_chapter, legacy_inputs["short_lines"])
+        print(f"{'chapter_rows/short_lines':<28}{'legacy':<10}{args.legacy_mb:>6}{n:>10}{dt:>10.3f}")
+    # The legacy chunker emits a single chunk for a paragraph without line breaks; the streaming one windows it.
+    dt, n = timed(lambda t: list(iter_chapter_rows("chapter_bench", t)), new_inputs["no_punctuation"])
+    print(f"{'chapter_rows/one_line':<28}{'stream':<10}{args.mb:>6}{n:>10}{dt:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()